@@ -0,0 +1,275 @@
+import hashlib
+import heapq
+import math
+import threading
+import time
+from collections import Counter
+from operator import itemgetter
+
+import numpy as np
+
+# Products tracked per top-K summary; counts are exact for any product with
+# more than 1/capacity of the events, and overestimate by at most that much
+DEFAULT_CAPACITY = 1000
+
+# Products tracked per window bucket; a window merges many buckets, so
+# each can be smaller than the all-time summary
+DEFAULT_BUCKET_CAPACITY = 250
+
+# HyperLogLog registers = 2 ** precision (one byte each); the standard error
+# of the distinct-user estimate is about 1.04 / sqrt(2 ** precision)
+DEFAULT_PRECISION = 12
+
+# Sliding windows as (name, span in seconds, buckets). A window reports the
+# buckets overlapping its span, so it is accurate to one bucket width.
+DEFAULT_WINDOWS = (
+    ("last_hour", 3600, 12),
+    ("last_day", 86400, 24),
+)
+
+
+class SpaceSaving:
+    """Approximate event counts of the most frequent keys in fixed memory.
+
+    The Space-Saving algorithm (Metwally et al.): at most ``capacity``
+    keys are tracked. A new key replaces the key with the lowest count and
+    takes over that count, so counts can only be overestimated, by at most
+    ``total / capacity``, and every key with more than that many events is
+    tracked. Merged summaries keep both guarantees.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.counts = {}
+        self.total = 0
+        self.lossy = False  # whether any key was ever evicted or trimmed
+
+    def add(self, counts):
+        """Add a batch of ``{key: count}`` events"""
+        misses = []
+        for key, count in counts.items():
+            self.total += count
+            if key in self.counts:
+                self.counts[key] += count
+            elif len(self.counts) < self.capacity:
+                self.counts[key] = count
+            else:
+                misses.append((count, key))
+        if misses:
+            # Each miss evicts the current minimum; heap entries stay valid
+            # because only this loop changes counts until it is done
+            self.lossy = True
+            heap = [(count, key) for key, count in self.counts.items()]
+            heapq.heapify(heap)
+            for count, key in misses:
+                smallest, evicted = heapq.heappop(heap)
+                del self.counts[evicted]
+                self.counts[key] = smallest + count
+                heapq.heappush(heap, (smallest + count, key))
+
+    def _floor(self):
+        """Most events an untracked key can have had: the lowest count, once anything was lost"""
+        return min(self.counts.values()) if self.lossy and self.counts else 0
+
+    def merge(self, other):
+        """Add another summary's counts.
+
+        A key only one side tracks is credited with the other side's floor,
+        so counts stay overestimates, off by at most the combined total
+        over the capacity. Past twice the capacity, only the ``capacity``
+        largest are kept; the slack lets a few merges in a row skip the trim.
+        """
+        if not self.counts:
+            self.counts = dict(other.counts)
+        else:
+            counts = self.counts
+            floor, other_floor = self._floor(), other._floor()
+            if other_floor:
+                for key in counts.keys() - other.counts.keys():
+                    counts[key] += other_floor
+            for key, count in other.counts.items():
+                counts[key] = counts.get(key, floor) + count
+        self.total += other.total
+        self.lossy = self.lossy or other.lossy
+        if len(self.counts) > 2 * self.capacity:
+            self.counts = dict(heapq.nlargest(self.capacity, self.counts.items(), key=itemgetter(1)))
+            self.lossy = True
+
+    def top(self, k):
+        """The ``k`` highest ``(key, count)`` pairs, highest first"""
+        return heapq.nlargest(k, self.counts.items(), key=itemgetter(1))
+
+
+class ExactCounts:
+    """Exact event counts with the ``SpaceSaving`` interface; memory grows with the keys"""
+
+    def __init__(self, capacity=None):
+        self.counts = Counter()
+        self.total = 0
+
+    def add(self, counts):
+        self.counts.update(counts)
+        self.total += sum(counts.values())
+
+    def merge(self, other):
+        self.counts.update(other.counts)
+        self.total += other.total
+
+    def top(self, k):
+        return heapq.nlargest(k, self.counts.items(), key=itemgetter(1))
+
+
+def _hash64(key):
+    return int.from_bytes(hashlib.blake2b(str(key).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HyperLogLog:
+    """Approximate count of distinct keys in ``2 ** precision`` bytes"""
+
+    def __init__(self, precision=DEFAULT_PRECISION):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8)
+
+    def add(self, keys):
+        registers = self.registers
+        shift = 64 - self.precision
+        mask = (1 << shift) - 1
+        for key in keys:
+            h = _hash64(key)
+            # Register from the top bits, rank = position of the first 1 in the rest
+            rank = shift - (h & mask).bit_length() + 1
+            index = h >> shift
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def merge(self, other):
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def count(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / np.ldexp(1.0, -self.registers.astype(np.int32)).sum()
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            # Small-range correction: linear counting of the empty registers
+            estimate = m * math.log(m / zeros)
+        return int(round(estimate))
+
+
+class ExactDistinct:
+    """Exact distinct count with the ``HyperLogLog`` interface; memory grows with the keys"""
+
+    def __init__(self, precision=None):
+        self.keys = set()
+
+    def add(self, keys):
+        self.keys.update(keys)
+
+    def merge(self, other):
+        self.keys.update(other.keys)
+
+    def count(self):
+        return len(self.keys)
+
+
+class _Summary:
+    """Views, purchases and users seen over some stretch of time"""
+
+    def __init__(self, counts, distinct, capacity, precision):
+        self.views = counts(capacity)
+        self.purchases = counts(capacity)
+        self.users = distinct(precision)
+
+    def add(self, views, purchases, user_ids):
+        if views:
+            self.views.add(views)
+        if purchases:
+            self.purchases.add(purchases)
+        if user_ids:
+            self.users.add(user_ids)
+
+    def merge(self, other):
+        self.views.merge(other.views)
+        self.purchases.merge(other.purchases)
+        self.users.merge(other.users)
+
+    def report(self, k):
+        return {
+            "views": self.views.total,
+            "purchases": self.purchases.total,
+            "distinct_users": self.users.count(),
+            "most_viewed_products": dict(self.views.top(k)),
+            "most_purchased_products": dict(self.purchases.top(k)),
+        }
+
+
+class StreamingAnalytics:
+    """Top products and distinct users, all time and over sliding windows.
+
+    Fed with batches of events by the counter flusher. Each window is a
+    ring of time buckets, each bucket a summary of its own. Only the current
+    bucket changes, so a report merges it with a cached merge of the
+    window's closed buckets, which is rebuilt when the bucket rolls over.
+    Approximate mode keeps every summary to a Space-Saving top-K and a
+    HyperLogLog, so memory is fixed and reports cost the same however much
+    traffic there has been. With ``exact``,
+    plain counters and sets are used instead, for tests.
+    """
+
+    def __init__(self, capacity=DEFAULT_CAPACITY, precision=DEFAULT_PRECISION, windows=DEFAULT_WINDOWS,
+                 exact=False, clock=time.time, bucket_capacity=DEFAULT_BUCKET_CAPACITY):
+        self.exact = exact
+        self.clock = clock
+        counts = ExactCounts if exact else SpaceSaving
+        distinct = ExactDistinct if exact else HyperLogLog
+        self._new = lambda size=capacity: _Summary(counts, distinct, size, precision)
+        self._new_bucket = lambda: self._new(bucket_capacity)
+        self.all_time = self._new()
+        # name -> (bucket width, [(bucket number, summary)] ring)
+        self.windows = {name: (span / buckets, [(None, None)] * buckets) for name, span, buckets in windows}
+        self._closed = {}   # name -> (current bucket number, merge of the closed buckets)
+        self._lock = threading.Lock()
+
+    def _bucket(self, width, ring, number):
+        slot = number % len(ring)
+        if ring[slot][0] != number:
+            ring[slot] = (number, self._new_bucket())
+        return ring[slot][1]
+
+    def _closed_merge(self, name, ring, current):
+        cached = self._closed.get(name)
+        if cached is None or cached[0] != current:
+            merged = self._new()
+            for number, summary in ring:
+                if number is not None and current - len(ring) < number < current:
+                    merged.merge(summary)
+            cached = self._closed[name] = (current, merged)
+        return cached[1]
+
+    def update(self, views, purchases, user_ids, historical=False):
+        """Count a batch: ``{product_id: count}`` views and purchases and active user ids.
+
+        ``historical`` events happened before this process saw the stream
+        (a restored snapshot, another worker's totals), so they only count
+        toward all-time figures.
+        """
+        now = self.clock()
+        with self._lock:
+            self.all_time.add(views, purchases, user_ids)
+            if historical:
+                return
+            for width, ring in self.windows.values():
+                self._bucket(width, ring, int(now // width)).add(views, purchases, user_ids)
+
+    def report(self, k=5):
+        """All-time and per-window figures with the top ``k`` products"""
+        now = self.clock()
+        with self._lock:
+            result = {"all_time": self.all_time.report(k)}
+            for name, (width, ring) in self.windows.items():
+                current = int(now // width)
+                merged = self._new()
+                merged.merge(self._closed_merge(name, ring, current))
+                merged.merge(self._bucket(width, ring, current))
+                result[name] = merged.report(k)
+        return result
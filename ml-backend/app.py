@@ -1,159 +1,384 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import atexit
+import logging
+import os
 import random
-from collections import Counter, defaultdict
+import threading
+import time
 import math
 
-# Handle requests import with fallback
-try:
-    import requests
-    REQUESTS_AVAILABLE = True
-except ImportError:
-    REQUESTS_AVAILABLE = False
-    print("⚠️ Warning: 'requests' module not available. Product sync will be disabled.")
+from analytics import StreamingAnalytics
+from cache import RecommendationCache
+from catalog import ProductCatalog, normalize_id
+from copurchase import CoPurchaseIndex
+from counters import CounterStore
+from logs import configure_logging, get_logger
+from metrics import CONTENT_TYPE, REGISTRY, Counter, Gauge, Histogram
+from popularity import HEAD_SIZE as POPULARITY_HEAD_SIZE
+from recommender import DEFAULT_LIMIT, prepare_cart, recommend_batch, recommend_rows, recommendation_payload
+from snapshot import SnapshotWriter, capture_snapshot, load_snapshot
+from serialization import CatalogPayloads, FastJSONProvider, dumps, loads
+from state import CatalogState
+from sync import (
+    REQUESTS_AVAILABLE, SyncScheduler, build_catalog, delta_too_large, diff_upstream,
+    fetch_upstream, make_session
+)
+from tags import extract_tags
+
+configure_logging()
+log = get_logger("app")
 
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 
-CORS(app, resources={r"/*": {"origins": [
+# Frontends allowed to call the API from the browser
+CORS_ORIGINS = [
     "https://e-commerce-website-orcin-xi.vercel.app",
     "http://localhost:3000"
-]}}, supports_credentials=True)
+]
+
+CORS(app, resources={r"/*": {"origins": CORS_ORIGINS}}, supports_credentials=True)
 
 @app.route('/health', methods=['GET', 'OPTIONS'])
 def health_check():
     return jsonify({"status": "OK"})
 
-# Configuration for Node.js backend
-NODE_JS_BACKEND = "https://e-commerce-website-3-uo7o.onrender.com"
+# Configuration for Node.js backend and DummyJSON
+NODE_JS_BACKEND = os.environ.get("NODE_JS_BACKEND", "https://e-commerce-website-3-uo7o.onrender.com")
+DUMMYJSON_URL = os.environ.get("DUMMYJSON_URL", "https://dummyjson.com/products")
 
-# Start with an empty product list
-products = []
+# Re-sync every N seconds in the background (0 = only on startup and on demand)
+SYNC_INTERVAL_SECONDS = int(os.environ.get("SYNC_INTERVAL_SECONDS", "0"))
 
-# Store user purchase history and interactions
-user_purchases = defaultdict(list)  # user_id -> [product_ids]
-product_views = defaultdict(int)    # product_id -> view_count
-product_purchases = defaultdict(int)  # product_id -> purchase_count
+# How scheduled re-syncs run: "incremental" applies only upstream changes
+SYNC_MODE = os.environ.get("SYNC_MODE", "incremental")
 
-def sync_products_from_nodejs():
-    """Sync products from Node.js backend to ML system"""
-    if not REQUESTS_AVAILABLE:
-        print("❌ Cannot sync products: 'requests' module not available")
-        return False
-        
-    try:
-        response = requests.get(f"{NODE_JS_BACKEND}/api/products")
-        if response.status_code == 200:
-            fetched_products = response.json()
-            
-            # Clear existing products and update with fresh data
-            global products
-            products = []
-            
-            for product in fetched_products:
-                # Handle both MongoDB and DummyJSON products
-                product_id = product.get("_id") or product.get("id")
-                ml_product = {
-                    "id": product_id,
-                    "name": product.get("name") or product.get("title"),
-                    "price": float(product.get("price", 0)),
-                    "image": product.get("image") or product.get("thumbnail"),
-                    "description": product.get("description", ""),
-                    "category": product.get("category", "Others"),
-                    "rating": product.get("rating", round(random.uniform(3.5, 5.0), 1)),
-                    "reviews": product.get("reviews", random.randint(10, 500)),
-                    "tags": extract_tags(
-                        product.get("name") or product.get("title", ""), 
-                        product.get("description", "")
-                    )
-                }
-                products.append(ml_product)
-            
-            print(f"✅ Synced {len(products)} products from Node.js backend")
-            return True
-        else:
-            print(f"❌ Failed to sync products: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Error syncing products: {str(e)}")
-        return False
+# Products an incremental sync patches per write-lock hold; content vectors
+# are re-packed once per batch, and other writers wait for one batch at most
+SYNC_PATCH_BATCH = int(os.environ.get("SYNC_PATCH_BATCH", "32"))
 
-def sync_dummyjson_products():
-    """Sync DummyJSON products (IDs 1001-1100) to ML system"""
-    if not REQUESTS_AVAILABLE:
-        print("❌ Cannot sync DummyJSON products: 'requests' module not available")
-        return False
-        
+# Shared SQLite file for interaction counters, so every gunicorn worker on the
+# box sees the same totals (unset = counters are local to this process)
+COUNTER_DB_PATH = os.environ.get("COUNTER_DB_PATH") or None
+COUNTER_FLUSH_SECONDS = float(os.environ.get("COUNTER_FLUSH_SECONDS", "0.5"))
+
+# Events buffered for the counter flusher; when full, /track-view and
+# /track-events answer 429 and the events are dropped
+COUNTER_BUFFER_SIZE = int(os.environ.get("COUNTER_BUFFER_SIZE", "100000"))
+
+# Most events one /track-events call may carry
+TRACK_EVENTS_MAX = int(os.environ.get("TRACK_EVENTS_MAX", "10000"))
+
+# Purchase lists kept in memory: the most recently active users, and the
+# latest purchases of each
+COUNTER_MAX_USERS = int(os.environ.get("COUNTER_MAX_USERS", "100000"))
+COUNTER_MAX_HISTORY = int(os.environ.get("COUNTER_MAX_HISTORY", "100"))
+
+# /analytics keeps fixed-size top-K summaries and distinct-user sketches;
+# ANALYTICS_EXACT=1 counts everything exactly instead (memory grows with traffic)
+ANALYTICS_CAPACITY = int(os.environ.get("ANALYTICS_CAPACITY", "1000"))
+ANALYTICS_EXACT = os.environ.get("ANALYTICS_EXACT", "0").lower() in ("1", "true", "yes")
+
+# Directory for write-behind snapshots of the catalog, its indexes and the
+# counters; on startup the latest one is served until the first sync lands
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR") or None
+SNAPSHOT_INTERVAL_SECONDS = int(os.environ.get("SNAPSHOT_INTERVAL_SECONDS", "60"))
+
+# Worker processes for large /recommend/batch calls (0 = score in-process)
+RECOMMEND_BATCH_PROCESSES = int(os.environ.get("RECOMMEND_BATCH_PROCESSES", "0"))
+
+# The O(n^2) item-to-item neighbour table is built in the background after
+# each full sync, and not at all above this many products: similar-product
+# lookups then scan the catalog per request (about 35 ms at 100k). At 100k
+# the build takes about 20 minutes of one core and the table 26 MB, so the
+# default covers catalogs of that size
+NEIGHBOR_INDEX_MAX_PRODUCTS = int(os.environ.get("NEIGHBOR_INDEX_MAX_PRODUCTS", "100000"))
+
+# Bounded LRU/TTL cache of /recommend responses (size 0 disables it)
+RECOMMEND_CACHE_SIZE = int(os.environ.get("RECOMMEND_CACHE_SIZE", "10000"))
+RECOMMEND_CACHE_TTL_SECONDS = float(os.environ.get("RECOMMEND_CACHE_TTL_SECONDS", "300"))
+
+# "Frequently bought together": product pairs kept in memory, how fast old
+# co-purchases fade, and "cosine" or "lift" scoring
+COPURCHASE_MAX_PAIRS = int(os.environ.get("COPURCHASE_MAX_PAIRS", "1000000"))
+COPURCHASE_HALF_LIFE_DAYS = float(os.environ.get("COPURCHASE_HALF_LIFE_DAYS", "30"))
+COPURCHASE_NORMALIZATION = os.environ.get("COPURCHASE_NORMALIZATION", "cosine")
+
+def on_counters_flushed(product_ids):
+    """Re-rank products whose counters moved in the last flush"""
+    with write_lock:
+        state.counters_changed(product_ids)
+
+# Item-item co-purchase weights, learned from every change to a user's list
+co_purchases = CoPurchaseIndex(
+    COPURCHASE_MAX_PAIRS, COPURCHASE_HALF_LIFE_DAYS * 24 * 3600, COPURCHASE_NORMALIZATION
+)
+
+# Top products and distinct users, all time and over the last hour/day
+analytics = StreamingAnalytics(ANALYTICS_CAPACITY, exact=ANALYTICS_EXACT)
+
+# Store user purchase history and interactions. Requests only enqueue
+# events; the counter flusher updates these read models in batches.
+counter_store = CounterStore(
+    COUNTER_DB_PATH, COUNTER_FLUSH_SECONDS, on_change=on_counters_flushed, on_baskets=co_purchases.update,
+    max_pending=COUNTER_BUFFER_SIZE, on_events=analytics.update, max_users=COUNTER_MAX_USERS,
+    max_history=COUNTER_MAX_HISTORY
+)
+user_purchases = counter_store.user_purchases    # user_id -> [product_ids]
+product_views = counter_store.views              # product_id -> view_count
+product_purchases = counter_store.purchases      # product_id -> purchase_count
+
+# The published catalog and its indexes. Replaced as a whole by sync; request
+# handlers read it once and use that snapshot throughout.
+state = CatalogState(ProductCatalog(), product_views, product_purchases, co_purchases=co_purchases)
+
+# Responses are keyed by cart and limit, and dropped as soon as the catalog
+# version or the head of the popularity ranking moves
+recommend_cache = RecommendationCache(RECOMMEND_CACHE_SIZE, RECOMMEND_CACHE_TTL_SECONDS)
+
+# Serializes writers (add/delete/counter updates) and overlapping syncs
+write_lock = threading.RLock()
+sync_lock = threading.RLock()
+sync_scheduler = None
+sync_watermark = None  # Node.js change watermark from the last sync, if any
+_session = None
+
+# Set once the flusher, snapshot writer and sync have been started
+background_started = threading.Event()
+_background_lock = threading.Lock()
+
+# Metrics served at /metrics. Gauges and counters owned by other objects
+# are read when scraped, so they cost nothing on the request path.
+REQUEST_SECONDS = Histogram('http_request_seconds', 'Request latency by endpoint', ['endpoint', 'status'])
+SYNC_SECONDS = Histogram(
+    'catalog_sync_seconds', 'Catalog sync duration', ['mode'],
+    buckets=(0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+)
+SYNC_TOTAL = Counter('catalog_sync_total', 'Catalog syncs by mode and outcome', ['mode', 'outcome'])
+SYNC_LAST_SUCCESS = Gauge('catalog_sync_last_success_timestamp_seconds', 'Unix time of the last successful sync')
+Gauge('catalog_products', 'Live products in the published catalog', function=lambda: len(state.catalog))
+Gauge('catalog_version', 'Mutation counter of the published catalog', function=lambda: state.catalog.version)
+Counter('counter_events_applied_total', 'View/purchase events applied by the flusher',
+        function=lambda: counter_store.events_applied)
+Counter('counter_flushes_total', 'Counter flushes', function=lambda: counter_store.flushes)
+Gauge('counter_pending_events', 'Events waiting for the next flush', function=lambda: len(counter_store._pending))
+Gauge('counter_buffer_capacity', 'Events the counter buffer holds before dropping',
+      function=lambda: counter_store.max_pending)
+Counter('counter_events_dropped_total', 'View/purchase events dropped because the buffer was full',
+        function=lambda: counter_store.dropped)
+Gauge('counter_users', 'Users whose purchase lists are held in memory', function=lambda: len(user_purchases))
+Counter('counter_users_evicted_total', 'Least recently active users dropped from memory',
+        function=lambda: counter_store.users_evicted)
+Counter('recommend_cache_events_total', 'Recommendation cache lookups and removals', ['event'], function=lambda: {
+    event: recommend_cache.stats()[key] for event, key in
+    (('hit', 'hits'), ('miss', 'misses'), ('eviction', 'evictions'),
+     ('expiration', 'expirations'), ('invalidation', 'invalidations'))
+})
+Gauge('recommend_cache_entries', 'Entries in the recommendation cache', function=lambda: len(recommend_cache))
+Gauge('neighbor_index_current', '1 if the published catalog has a current neighbour table',
+      function=lambda: int(state.neighbors.is_current(state.catalog)))
+Gauge('content_index_bytes', 'Memory held by the TF-IDF content vectors',
+      function=lambda: state.content.memory_bytes())
+Gauge('copurchase_pairs', 'Product pairs in the co-purchase index', function=lambda: len(co_purchases))
+Counter('copurchase_pruned_pairs_total', 'Low-weight pairs pruned to stay under the cap',
+        function=lambda: co_purchases.pruned)
+Counter('products_payload_builds_total', 'Serializations of /products payloads',
+        function=lambda: catalog_payloads.builds)
+Counter('snapshot_writes_total', 'Snapshots written',
+        function=lambda: snapshot_writer.writes if snapshot_writer is not None else 0)
+
+def run_sync(sync, mode):
+    """Run a sync function, recording its duration and outcome.
+    
+    ``mode`` ("full" or "incremental") labels a failure; a success is
+    labelled with the mode the report says actually ran.
+    """
+    started = time.perf_counter()
     try:
-        # Fetch products from DummyJSON (IDs 1-100)
-        response = requests.get("https://dummyjson.com/products?limit=100")
-        if response.status_code == 200:
-            dummy_data = response.json()
-            
-            for product in dummy_data.get("products", []):
-                # Convert DummyJSON ID to frontend ID (add 1000)
-                frontend_id = product.get("id", 0) + 1000
-                
-                ml_product = {
-                    "id": frontend_id,  # Use frontend ID format
-                    "name": product.get("title", ""),
-                    "price": float(product.get("price", 0)),
-                    "image": product.get("thumbnail", ""),
-                    "description": product.get("description", ""),
-                    "category": product.get("category", "Others"),
-                    "rating": product.get("rating", round(random.uniform(3.5, 5.0), 1)),
-                    "reviews": random.randint(10, 500),
-                    "tags": extract_tags(
-                        product.get("title", ""), 
-                        product.get("description", "")
+        report = sync()
+    except Exception:
+        SYNC_TOTAL.inc(mode, "error")
+        raise
+    SYNC_SECONDS.observe(time.perf_counter() - started, report["mode"])
+    SYNC_TOTAL.inc(report["mode"], "ok")
+    SYNC_LAST_SUCCESS.set(time.time())
+    return report
+
+def snapshot_signature():
+    """Changes whenever there is something new to snapshot"""
+    current = state
+    return (current.catalog.uid, current.catalog.version, counter_store.events_applied)
+
+def capture_current_snapshot():
+    with write_lock:
+        return capture_snapshot(state, counter_store, sync_watermark)
+
+snapshot_writer = SnapshotWriter(
+    SNAPSHOT_DIR, capture_current_snapshot, snapshot_signature, SNAPSHOT_INTERVAL_SECONDS
+) if SNAPSHOT_DIR else None
+
+def publish_state(new_state):
+    """Atomically replace the published catalog state"""
+    global state
+    state = new_state
+
+def counter_totals():
+    """A consistent ``(views, purchases)`` copy; the flusher keeps writing the live dicts"""
+    views, purchases, _ = counter_store.snapshot()
+    return views, purchases
+
+def new_catalog_state(catalog, **indexes):
+    """Build a state for ``catalog``, ranked from a copy of the counters.
+    
+    Returns the state and that copy, for ``catch_up_counters``.
+    """
+    counts = counter_totals()
+    new_state = CatalogState(
+        catalog, product_views, product_purchases, co_purchases=co_purchases, counts=counts, **indexes
+    )
+    return new_state, counts
+
+def catch_up_counters(new_state, counts):
+    """Re-rank the products whose counters moved since ``counts`` was copied.
+    
+    Call under ``write_lock`` right before publishing: flushes until then
+    re-ranked only the old state, and later ones wait for the lock and
+    reach the new one.
+    """
+    moved = set()
+    for old, new in zip(counts, counter_totals()):
+        moved.update(key for key, count in new.items() if old.get(key) != count)
+    new_state.counters_changed(moved)
+
+def build_neighbors_in_background(new_state):
+    """Build the neighbour table of a published state on a daemon thread.
+    
+    Until it is adopted, similar-product lookups scan by brute force. A
+    build that a catalog change overlapped is retried; one whose state was
+    replaced meanwhile is abandoned.
+    """
+    if len(new_state.catalog) > NEIGHBOR_INDEX_MAX_PRODUCTS:
+        log.info(
+            "ℹ️ %d products is above NEIGHBOR_INDEX_MAX_PRODUCTS; similar products are scored per request",
+            len(new_state.catalog)
+        )
+        return None
+    
+    def run():
+        for _ in range(3):
+            if state is not new_state:
+                return
+            started = time.perf_counter()
+            try:
+                if new_state.build_neighbors(write_lock):
+                    log.info(
+                        "🧭 Neighbour table built for %d products in %.1fs",
+                        len(new_state.catalog), time.perf_counter() - started
                     )
-                }
-                products.append(ml_product)
-            
-            print(f"✅ Synced {len(dummy_data.get('products', []))} DummyJSON products")
-            return True
-        else:
-            print(f"❌ Failed to sync DummyJSON products: {response.status_code}")
-            return False
-    except Exception as e:
-        print(f"❌ Error syncing DummyJSON products: {str(e)}")
-        return False
+                    return
+            except Exception as e:
+                log.exception("❌ Neighbour table build failed: %s", e)
+                return
+        log.warning("⚠️ Catalog kept changing; neighbour table not built until the next sync")
+    
+    thread = threading.Thread(target=run, name="neighbor-build", daemon=True)
+    thread.start()
+    return thread
 
-def extract_tags(name, description):
-    """Extract relevant tags from product name and description"""
-    text = (name + " " + description).lower()
-    
-    # Common product attributes to look for
-    keywords = [
-        'wireless', 'bluetooth', 'smart', 'premium', 'portable', 'waterproof',
-        'leather', 'cotton', 'organic', 'eco-friendly', 'rechargeable',
-        'lightweight', 'durable', 'comfortable', 'stylish', 'modern',
-        'vintage', 'classic', 'professional', 'gaming', 'fitness'
-    ]
-    
-    found_tags = [keyword for keyword in keywords if keyword in text]
-    return found_tags[:5]  # Limit to 5 tags
+def upstream_session():
+    """Shared pooled HTTP session for upstream syncs"""
+    global _session
+    if _session is None and REQUESTS_AVAILABLE:
+        _session = make_session()
+    return _session
 
 # Initialize products when the app starts
-def initialize_products():
-    """Initialize products from both Node.js backend and DummyJSON"""
-    print("🔄 Initializing products from multiple sources...")
-    
-    # Sync from Node.js backend
-    nodejs_success = sync_products_from_nodejs()
-    
-    # Sync from DummyJSON
-    dummyjson_success = sync_dummyjson_products()
-    
-    if not nodejs_success and not dummyjson_success:
-        print("⚠️ Failed to sync from both sources. Using fallback products.")
-        # Create some fallback products to ensure ML system works
-        create_fallback_products()
-    
-    print(f"📦 Total products available: {len(products)}")
+def initialize_products(upstream=None, watermark=None):
+    """Fetch both sources concurrently, build indexes off to the side and publish.
+    
+    Returns a sync report. ``upstream`` skips the fetch when the caller
+    already has the payload.
+    """
+    global sync_watermark
+    with sync_lock:
+        log.info("🔄 Initializing products from multiple sources...")
+        if upstream is None:
+            upstream, watermark = fetch_upstream(NODE_JS_BACKEND, DUMMYJSON_URL, session=upstream_session())
+        catalog = build_catalog(upstream)
+        
+        if all(products is None for products in upstream.values()):
+            log.warning("⚠️ Failed to sync from both sources. Using fallback products.")
+            # Create some fallback products to ensure ML system works
+            create_fallback_products(catalog)
+        
+        new_state, counts = new_catalog_state(catalog)
+        with write_lock:
+            catch_up_counters(new_state, counts)
+            publish_state(new_state)
+            sync_watermark = watermark
+        build_neighbors_in_background(new_state)
+        log.info("📦 Total products available: %d", len(catalog), extra={"products": len(catalog)})
+        return {"mode": "full", "added": len(catalog), "updated": 0, "removed": 0, "unchanged": 0}
+
+def incremental_sync():
+    """Apply only the products that changed upstream to the published catalog.
+    
+    Unchanged products keep their rows, derived values and index entries;
+    falls back to a full rebuild when a large part of the catalog changed.
+    """
+    global sync_watermark
+    with sync_lock:
+        current = state
+        since = sync_watermark
+        upstream, watermark = fetch_upstream(NODE_JS_BACKEND, DUMMYJSON_URL, session=upstream_session(), since=since)
+        if all(products is None for products in upstream.values()):
+            log.warning("⚠️ Incremental sync failed for both sources; keeping current catalog")
+            return {"mode": "incremental", "added": 0, "updated": 0, "removed": 0, "unchanged": len(current.catalog)}
+        
+        delta = diff_upstream(current.catalog, upstream, partial=since is not None)
+        if since is None and delta_too_large(current.catalog, delta):
+            log.info("🔄 Too many upstream changes; rebuilding the catalog")
+            return initialize_products(upstream, watermark)
+        
+        # The lock is taken per batch, so the counter flusher and other
+        # writers wait for one batch at a time, not the whole delta
+        added = updated = 0
+        for start in range(0, len(delta.changed), SYNC_PATCH_BATCH):
+            batch = delta.changed[start:start + SYNC_PATCH_BATCH]
+            with write_lock:
+                replaced = sum(key in current.catalog.id_index for key, _, _ in batch)
+                updated += replaced
+                added += len(batch) - replaced
+                current.add_products([product for _, _, product in batch])
+                for key, digest, _ in batch:
+                    current.catalog.content_hashes[key] = digest
+        for start in range(0, len(delta.removed), SYNC_PATCH_BATCH):
+            with write_lock:
+                current.remove_products(delta.removed[start:start + SYNC_PATCH_BATCH])
+        with write_lock:
+            sync_watermark = watermark
+        
+        log.info(
+            "✅ Incremental sync: %d added, %d updated, %d removed, %d unchanged",
+            added, updated, len(delta.removed), delta.unchanged
+        )
+        return {"mode": "incremental", "added": added, "updated": updated, "removed": len(delta.removed), "unchanged": delta.unchanged}
+
+def scheduled_sync():
+    """Background sync: incremental once a catalog exists, if configured.
+    
+    Runs a full sync instead once the content vocabulary has gone stale,
+    since only a full sync refits it.
+    """
+    if SYNC_MODE == "incremental" and len(state.catalog):
+        if not state.content.needs_refit():
+            return run_sync(incremental_sync, "incremental")
+        log.info("🔄 Products added since the last full sync use many unknown terms; refitting with a full sync")
+    return run_sync(initialize_products, "full")
 
-def create_fallback_products():
+def create_fallback_products(catalog):
     """Create fallback products if syncing fails"""
-    global products
     fallback_products = [
         {
             "id": "fallback_001",
@@ -179,20 +404,128 @@ def create_fallback_products():
         }
     ]
     
-    products.extend(fallback_products)
-    print(f"➕ Added {len(fallback_products)} fallback products")
+    catalog.extend(fallback_products)
+    log.info("➕ Added %d fallback products", len(fallback_products))
 
-# Initialize products on first request
+def warm_start():
+    """Publish the latest snapshot, if any, so requests are served before the first sync"""
+    global sync_watermark
+    loaded = load_snapshot(SNAPSHOT_DIR)
+    if loaded is None:
+        log.info("ℹ️ No snapshot in %s; starting empty", SNAPSHOT_DIR)
+        return False
+    
+    catalog, neighbors, prices, content, counters, meta = loaded
+    counter_store.restore(counters["views"], counters["purchases"], counters["user_purchases"])
+    new_state, counts = new_catalog_state(catalog, neighbors=neighbors, prices=prices, content=content)
+    with write_lock:
+        catch_up_counters(new_state, counts)
+        publish_state(new_state)
+        sync_watermark = meta.get("watermark")
+    if neighbors is None:
+        build_neighbors_in_background(new_state)
+    snapshot_writer.mark_current()
+    log.info(
+        "⚡ Warm start: %d products from a snapshot %.0fs old", len(catalog), time.time() - meta['created'],
+        extra={"products": len(catalog)}
+    )
+    return True
+
+def shutdown_snapshot():
+    """Flush counters and write a final snapshot on exit"""
+    try:
+        counter_store.flush()
+        snapshot_writer.stop(timeout=5)
+    except Exception as e:
+        log.exception("❌ Final snapshot failed: %s", e)
+
+def start_background_sync():
+    """Start the initial (and optional periodic) sync without blocking requests"""
+    global sync_scheduler
+    if sync_scheduler is None:
+        sync_scheduler = SyncScheduler(scheduled_sync, SYNC_INTERVAL_SECONDS).start()
+    return sync_scheduler
+
+def start_background_work():
+    """Start the counter flusher, snapshot writer and sync, once per process"""
+    if background_started.is_set():
+        return
+    # Concurrent first requests (threaded server, ASGI) must not start two of each
+    with _background_lock:
+        if background_started.is_set():
+            return
+        counter_store.start()
+        if snapshot_writer is not None:
+            snapshot_writer.start()
+        start_background_sync()
+        background_started.set()
+
+# Start syncing on first request; requests are served from the current state meanwhile
 @app.before_request
 def before_first_request():
-    if not hasattr(app, 'products_initialized'):
-        initialize_products()
-        app.products_initialized = True
+    start_background_work()
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    started = g.get("request_started")
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, request.endpoint or "unknown", response.status_code)
+    return response
+
+# Serve the last snapshot right away; the first sync refreshes it behind it
+if SNAPSHOT_DIR:
+    try:
+        warm_start()
+    except Exception as e:
+        log.exception("❌ Could not load snapshot: %s", e)
+    atexit.register(shutdown_snapshot)
+
+# Product fields that /products?fields= may project
+PRODUCT_FIELDS = ("id", "name", "price", "image", "description", "category", "rating", "reviews", "tags")
+
+# Serialized /products bodies, rebuilt only when the catalog changes
+catalog_payloads = CatalogPayloads()
 
 @app.route('/products', methods=['GET'])
 def get_products():
-    print("✅ [GET] /products called - Returning all products")
-    return jsonify(products)
+    """All products as JSON, served from bytes cached per catalog version.
+    
+    Supports ``?fields=id,name,price``, ``?page=N&per_page=M`` (total in
+    ``X-Total-Count``), ``If-None-Match`` and gzip.
+    """
+    log.debug("✅ [GET] /products called - Returning all products")
+    fields = request.args.get("fields")
+    if fields:
+        fields = tuple(field.strip() for field in fields.split(",") if field.strip())
+        unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+        if unknown:
+            return jsonify({"error": f"Unknown fields: {', '.join(unknown)}"}), 400
+    else:
+        fields = None
+    
+    per_page = request.args.get("per_page", type=int)
+    page = request.args.get("page", 1, type=int)
+    if per_page is not None and (per_page < 1 or page < 1):
+        return jsonify({"error": "page and per_page must be positive"}), 400
+    
+    payload = catalog_payloads.get(state.catalog, fields, page if per_page else None, per_page)
+    headers = {
+        "ETag": f'"{payload.etag}"',
+        "Cache-Control": "no-cache",
+        "Vary": "Accept-Encoding",
+        "X-Total-Count": str(payload.total)
+    }
+    if request.if_none_match.contains(payload.etag):
+        return Response(status=304, headers=headers)
+    
+    if request.accept_encodings["gzip"] > 0:
+        headers["Content-Encoding"] = "gzip"
+        return Response(payload.gzipped, mimetype="application/json", headers=headers)
+    return Response(payload.body, mimetype="application/json", headers=headers)
 
 @app.route('/', methods=['GET'])
 def home():
@@ -200,30 +533,29 @@ def home():
 
 @app.route('/sync-products', methods=['POST'])
 def manual_sync():
-    """Manually trigger product synchronization"""
-    # Clear existing products
-    global products
-    products = []
+    """Manually trigger product synchronization (?mode=incremental for a delta sync)"""
+    mode = "incremental" if request.args.get("mode") == "incremental" else "full"
+    sync = incremental_sync if mode == "incremental" else initialize_products
+    if request.args.get("background"):
+        threading.Thread(target=run_sync, args=(sync, mode), daemon=True).start()
+        return jsonify({"message": "Sync started"}), 202
     
-    # Re-initialize
-    initialize_products()
+    # Readers keep using the old catalog until the new one is published
+    report = run_sync(sync, mode)
     
-    return jsonify({"message": f"Successfully synced {len(products)} products"})
+    return jsonify({"message": f"Successfully synced {len(state.catalog)} products", **report})
 
 @app.route('/delete-product/<product_id>', methods=['DELETE'])
 def delete_product(product_id):
     """Delete a product - handle both string and int IDs"""
-    global products
-    initial_count = len(products)
-    
     # Handle both string and integer product IDs
-    products = [p for p in products if str(p['id']) != str(product_id)]
-    
-    if len(products) == initial_count:
-        print(f"⚠️ Product with ID {product_id} not found for deletion.")
+    with write_lock:
+        row = state.remove_product(product_id)
+    if row is None:
+        log.warning("⚠️ Product with ID %s not found for deletion.", product_id)
         return jsonify({"error": "Product not found"}), 404
     
-    print(f"🗑️ Product with ID {product_id} deleted.")
+    log.info("🗑️ Product with ID %s deleted.", product_id)
     return jsonify({"message": "Product deleted"})
 
 @app.route('/add-product', methods=['POST'])
@@ -232,311 +564,142 @@ def add_product():
     required_fields = ("name", "price", "image", "description")
     
     if not all(k in data for k in required_fields):
-        print("❌ Missing product fields in request.")
+        log.warning("❌ Missing product fields in request.")
         return jsonify({"error": "Missing product fields"}), 400
     
-    # Generate new ID - handle both string and int IDs
-    existing_ids = [p["id"] for p in products]
-    numeric_ids = [int(id) for id in existing_ids if str(id).isdigit()]
-    new_id = max(numeric_ids, default=0) + 1
-    
-    new_product = {
-        "id": new_id,
-        "name": data["name"],
-        "price": float(data["price"]),
-        "image": data["image"],
-        "description": data["description"],
-        "category": data.get("category", "Others"),
-        "rating": round(random.uniform(3.5, 5.0), 1),  # Simulate ratings
-        "reviews": random.randint(10, 500),  # Simulate review count
-        "tags": extract_tags(data["name"], data["description"])  # Extract keywords
-    }
-    products.append(new_product)
-    
-    print(f"✅ Product added: {new_product['name']} (ID: {new_id})")
-    return jsonify({"message": "Product added", "product": new_product})
-
-def calculate_similarity(product1, product2):
-    """Calculate similarity between two products"""
-    score = 0
-    
-    # Category match (highest weight)
-    if product1['category'] == product2['category']:
-        score += 0.4
-    
-    # Price similarity (within 50% range)
-    price_ratio = min(product1['price'], product2['price']) / max(product1['price'], product2['price'])
-    if price_ratio > 0.5:
-        score += 0.3 * price_ratio
-    
-    # Tag similarity
-    tags1 = set(product1.get('tags', []))
-    tags2 = set(product2.get('tags', []))
-    if tags1 and tags2:
-        common_tags = len(tags1.intersection(tags2))
-        union_tags = len(tags1.union(tags2))
-        if union_tags > 0:
-            score += 0.3 * (common_tags / union_tags)
-    
-    return score
-
-def get_popular_products():
-    """Get products sorted by popularity (views + purchases + rating)"""
-    scored_products = []
-    for product in products:
-        # Convert product ID to string for consistent lookup
-        product_id_str = str(product['id'])
-        popularity_score = (
-            product_views.get(product_id_str, 0) * 0.3 +
-            product_purchases.get(product_id_str, 0) * 0.5 +
-            product.get('rating', 0) * product.get('reviews', 0) * 0.2
-        )
-        scored_products.append((product, popularity_score))
-    
-    return [p[0] for p in sorted(scored_products, key=lambda x: x[1], reverse=True)]
-
-def get_category_recommendations(purchased_categories, exclude_ids):
-    """Get recommendations based on purchased categories"""
-    category_counts = Counter(purchased_categories)
-    recommendations = []
-    
-    # Convert exclude_ids to strings for consistent comparison
-    exclude_ids_str = set(str(id) for id in exclude_ids)
-    
-    for category, count in category_counts.most_common():
-        category_products = [
-            p for p in products 
-            if p['category'] == category and str(p['id']) not in exclude_ids_str
-        ]
-        # Sort by rating and reviews
-        category_products.sort(
-            key=lambda x: (x.get('rating', 0) * x.get('reviews', 0)), 
-            reverse=True
-        )
-        recommendations.extend(category_products[:2])  # Top 2 from each category
-    
-    return recommendations
-
-def get_diverse_category_recommendations(purchased_categories, exclude_ids, used_categories):
-    """Get recommendations from different categories for diversity"""
-    category_counts = Counter(purchased_categories)
-    recommendations = []
-    
-    # Convert exclude_ids to strings for consistent comparison
-    exclude_ids_str = set(str(id) for id in exclude_ids)
-    
-    # Get all available categories
-    all_categories = set(p['category'] for p in products)
-    
-    # Prioritize categories that user has purchased from but haven't been used yet
-    for category, count in category_counts.most_common():
-        if category not in used_categories:
-            category_products = [
-                p for p in products 
-                if p['category'] == category and str(p['id']) not in exclude_ids_str
-            ]
-            if category_products:
-                # Sort by rating and reviews, get the best one
-                category_products.sort(
-                    key=lambda x: (x.get('rating', 0) * x.get('reviews', 0)), 
-                    reverse=True
-                )
-                recommendations.append(category_products[0])
-                if len(recommendations) >= 2:
-                    break
-    
-    # If still need more, add from completely different categories
-    if len(recommendations) < 2:
-        unused_categories = all_categories - used_categories - set(purchased_categories)
-        for category in unused_categories:
-            category_products = [
-                p for p in products 
-                if p['category'] == category and str(p['id']) not in exclude_ids_str
-            ]
-            if category_products:
-                # Sort by rating and reviews, get the best one
-                category_products.sort(
-                    key=lambda x: (x.get('rating', 0) * x.get('reviews', 0)), 
-                    reverse=True
-                )
-                recommendations.append(category_products[0])
-                if len(recommendations) >= 2:
-                    break
-    
-    return recommendations
-
-def get_similar_products(purchased_products, exclude_ids):
-    """Get products similar to purchased ones"""
-    recommendations = []
-    
-    # Convert exclude_ids to strings for consistent comparison
-    exclude_ids_str = set(str(id) for id in exclude_ids)
-    
-    for purchased in purchased_products:
-        similar_products = []
-        for product in products:
-            if str(product['id']) not in exclude_ids_str:
-                similarity = calculate_similarity(purchased, product)
-                if similarity > 0.3:  # Threshold for similarity
-                    similar_products.append((product, similarity))
+    with write_lock:
+        current = state
+        # Generate new ID - handle both string and int IDs
+        new_id = current.catalog.next_numeric_id()
         
-        # Sort by similarity and add top matches
-        similar_products.sort(key=lambda x: x[1], reverse=True)
-        recommendations.extend([p[0] for p in similar_products[:2]])
-    
-    return recommendations
-
-def get_price_range_recommendations(purchased_products, exclude_ids):
-    """Get recommendations in similar price range"""
-    if not purchased_products:
-        return []
-    
-    # Convert exclude_ids to strings for consistent comparison
-    exclude_ids_str = set(str(id) for id in exclude_ids)
-    
-    avg_price = sum(p['price'] for p in purchased_products) / len(purchased_products)
-    price_range_products = []
-    
-    for product in products:
-        if str(product['id']) not in exclude_ids_str:
-            price_diff = abs(product['price'] - avg_price) / avg_price
-            if price_diff <= 0.5:  # Within 50% of average price
-                price_range_products.append(product)
-    
-    # Sort by rating
-    price_range_products.sort(
-        key=lambda x: x.get('rating', 0), 
-        reverse=True
-    )
+        new_product = {
+            "id": new_id,
+            "name": data["name"],
+            "price": float(data["price"]),
+            "image": data["image"],
+            "description": data["description"],
+            "category": data.get("category", "Others"),
+            "rating": round(random.uniform(3.5, 5.0), 1),  # Simulate ratings
+            "reviews": random.randint(10, 500),  # Simulate review count
+            "tags": extract_tags(data["name"], data["description"])  # Extract keywords
+        }
+        current.add_product(new_product)
     
-    return price_range_products[:3]
+    log.info("✅ Product added: %s (ID: %s)", new_product['name'], new_id)
+    return jsonify({"message": "Product added", "product": new_product})
 
 def find_product_by_id(product_id):
     """Find product by ID, handling both string and integer IDs"""
-    for product in products:
-        if str(product['id']) == str(product_id):
-            return product
-    return None
+    return state.catalog.get(product_id)
 
 @app.route('/recommend', methods=['POST'])
 def recommend():
     data = request.get_json()
     history = data.get("history", [])
     user_id = data.get("user_id", "anonymous")
-    limit = data.get("limit", 6)
+    limit = data.get("limit", DEFAULT_LIMIT)
     
-    print(f"🔍 Recommendation request for user {user_id}")
-    print(f"📊 Available products: {len(products)}")
-    print(f"🛒 User history: {len(history)} items")
+    # One consistent snapshot for the whole request
+    current = state
+    catalog = current.catalog
+    
+    log.debug(
+        "🔍 Recommendation request for user %s", user_id,
+        extra={"user_id": user_id, "products": len(catalog), "history": len(history)}
+    )
     
     # If no products available, return empty recommendations
-    if not products:
-        print("❌ No products available for recommendations")
-        return jsonify({
-            "recommendations": [],
-            "total_products": 0,
-            "user_history_count": len(history),
-            "message": "No products available for recommendations"
-        })
-    
-    # Extract purchased product IDs and details
-    bought_ids = {str(item.get("id")) for item in history if "id" in item}
-    purchased_products = []
-    
-    for item in history:
-        if "id" in item:
-            product = find_product_by_id(item.get("id"))
-            if product:
-                purchased_products.append(product)
-    
-    # Update user purchase history
-    user_purchases[user_id] = list(bought_ids)
-    
-    # Update product purchase counts
-    for product_id in bought_ids:
-        product_purchases[product_id] = product_purchases.get(product_id, 0) + 1
-    
-    recommendations = []
-    recommendation_reasons = []
-    used_categories = set()
-    
-    if purchased_products:
-        print(f"🛍️ User {user_id} has purchase history: {[p['name'] for p in purchased_products]}")
-        
-        # 1. Add ONE similar product (avoid duplicates)
-        similar_recs = get_similar_products(purchased_products, bought_ids)
-        if similar_recs:
-            best_similar = similar_recs[0]
-            recommendations.append(best_similar)
-            recommendation_reasons.append(f"Similar to {purchased_products[0]['name']}")
-            used_categories.add(best_similar['category'])
-        
-        # 2. Add products from DIFFERENT categories than already added
-        purchased_categories = [p['category'] for p in purchased_products]
-        category_recs = get_diverse_category_recommendations(purchased_categories, bought_ids, used_categories)
-        for rec in category_recs[:2]:
-            if rec not in recommendations:
-                recommendations.append(rec)
-                recommendation_reasons.append(f"Popular in {rec['category']}")
-                used_categories.add(rec['category'])
-        
-        # 3. Add ONE price range recommendation from different category
-        price_recs = get_price_range_recommendations(purchased_products, bought_ids)
-        for rec in price_recs:
-            if rec not in recommendations and rec['category'] not in used_categories:
-                recommendations.append(rec)
-                recommendation_reasons.append("In your price range")
-                used_categories.add(rec['category'])
-                break
-    
-    # 4. Fill remaining slots with diverse popular products
-    popular_products = get_popular_products()
-    for product in popular_products:
-        if len(recommendations) >= limit:
-            break
-        if (str(product['id']) not in bought_ids and 
-            product not in recommendations and 
-            product['category'] not in used_categories):
-            recommendations.append(product)
-            recommendation_reasons.append("Trending now")
-            used_categories.add(product['category'])
-    
-    # 5. If still not enough, add random products from different categories
-    available_products = [p for p in products if str(p['id']) not in bought_ids and p not in recommendations]
-    random.shuffle(available_products)  # Shuffle for better diversity
-    
-    for product in available_products:
-        if len(recommendations) >= limit:
-            break
-        if product['category'] not in used_categories:
-            recommendations.append(product)
-            recommendation_reasons.append("You might like this")
-            used_categories.add(product['category'])
-    
-    # 6. If still not enough, fill with any remaining products
-    for product in available_products:
-        if len(recommendations) >= limit:
-            break
-        if product not in recommendations:
-            recommendations.append(product)
-            recommendation_reasons.append("Recommended for you")
-    
-    # Prepare response with reasons
-    recommended_with_reasons = []
-    for i, rec in enumerate(recommendations[:limit]):
-        rec_copy = rec.copy()
-        rec_copy['recommendation_reason'] = recommendation_reasons[i] if i < len(recommendation_reasons) else "Recommended for you"
-        recommended_with_reasons.append(rec_copy)
-    
-    print(f"🎯 Recommended {len(recommended_with_reasons)} products for user {user_id}")
-    print(f"📋 Recommendations: {[(p['name'], p['recommendation_reason']) for p in recommended_with_reasons]}")
-    print(f"🎨 Categories used: {list(used_categories)}")
+    if not len(catalog):
+        log.debug("❌ No products available for recommendations")
+        return jsonify(recommendation_payload(catalog, None, len(history)))
+    
+    # Extract purchased product IDs and catalog rows
+    cart = prepare_cart(catalog, history)
+    
+    # Update user purchase history and product purchase counts
+    counter_store.record_purchases(user_id, cart.bought_ids)
+    
+    # Identical carts get identical responses until the catalog or ranking
+    # changes; co-purchase changes only miss the carts whose products they touch
+    cache_key = (cart.key, limit, len(history), co_purchases.version(cart.bought_ids))
+    generation = (catalog.uid, catalog.version, current.popularity.head_version)
+    payload = recommend_cache.get(cache_key, generation)
+    if payload is not None:
+        log.debug("⚡ Served cached recommendations for user %s", user_id)
+        return jsonify(payload)
+    
+    result = recommend_rows(current, cart, limit)
+    payload = recommendation_payload(catalog, result, len(history))
+    # Below the versioned head, the ranking can move without changing the generation
+    if result.popular_depth <= POPULARITY_HEAD_SIZE:
+        recommend_cache.put(cache_key, generation, payload)
+    recommended_with_reasons = payload["recommendations"]
+    
+    # The detailed line is only built when someone is listening
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug(
+            "🎯 Recommended %d products for user %s", len(recommended_with_reasons), user_id,
+            extra={
+                "user_id": user_id,
+                "purchase_history": [catalog.names[row] for row in cart.purchased_rows],
+                "recommendations": [(p['name'], p['recommendation_reason']) for p in recommended_with_reasons],
+                "categories": list(result.used_categories)
+            }
+        )
     
-    return jsonify({
-        "recommendations": recommended_with_reasons,
-        "total_products": len(products),
-        "user_history_count": len(history)
-    })
+    return jsonify(payload)
+
+def recommend_many(entries, processes=None):
+    """Recommendations for many ``{user_id, history, limit}`` entries.
+    
+    Yields one ``/recommend`` response body per entry, in order, with its
+    ``user_id``. All entries are scored against the same catalog state.
+    """
+    current = state
+    catalog = current.catalog
+    entries = list(entries)
+    processes = RECOMMEND_BATCH_PROCESSES if processes is None else processes
+    
+    results = recommend_batch(current, entries, processes) if len(catalog) else (None for _ in entries)
+    for entry, result in zip(entries, results):
+        history = entry.get("history", [])
+        user_id = entry.get("user_id", "anonymous")
+        if len(catalog):
+            counter_store.record_purchases(user_id, prepare_cart(catalog, history).bought_ids)
+        yield {"user_id": user_id, **recommendation_payload(catalog, result, len(history))}
+
+@app.route('/recommend/batch', methods=['POST'])
+def recommend_batch_endpoint():
+    """Recommendations for many users in one call.
+    
+    Takes ``{"requests": [{user_id, history, limit}, ...]}`` (or a bare
+    list). With ``?stream=1`` results are streamed as NDJSON, one line per
+    entry, as they are computed.
+    """
+    data = request.get_json()
+    entries = data.get("requests", []) if isinstance(data, dict) else data
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        return jsonify({"error": "Expected a list of recommendation requests"}), 400
+    
+    log.info("🔍 Batch recommendation request for %d users", len(entries), extra={"users": len(entries)})
+    results = recommend_many(entries)
+    
+    if request.args.get("stream"):
+        return Response(
+            stream_with_context(dumps(result) + b"\n" for result in results),
+            mimetype="application/x-ndjson"
+        )
+    return jsonify({"results": list(results)})
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    """Hit/miss/eviction counters of the recommendation cache"""
+    return jsonify(recommend_cache.stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics for this worker process"""
+    return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
 @app.route('/track-view', methods=['POST'])
 def track_view():
@@ -544,23 +707,97 @@ def track_view():
     data = request.get_json()
     product_id = data.get("product_id")
     
-    if product_id:
-        # Convert to string for consistent storage
-        product_id_str = str(product_id)
-        product_views[product_id_str] = product_views.get(product_id_str, 0) + 1
-        print(f"👁️ Product {product_id_str} viewed (total views: {product_views[product_id_str]})")
+    if product_id and not record_view(product_id):
+        return jsonify({"error": "Event buffer full, retry later"}), 429, {"Retry-After": "1"}
     
     return jsonify({"message": "View tracked"})
 
+def record_view(product_id):
+    """Enqueue one product view; the counter flusher applies it.
+    
+    Returns False if the event buffer is full and the view was dropped.
+    """
+    # Normalize for consistent storage
+    product_id_str = normalize_id(product_id)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("👁️ Product %s viewed (total views: %d)", product_id_str, product_views.get(product_id_str, 0) + 1)
+    return counter_store.record_view(product_id_str)
+
+@app.route('/track-events', methods=['POST'])
+def track_events_endpoint():
+    """Track many view/purchase events in one call.
+    
+    Takes a JSON list of ``{"type": "view"|"purchase", "product_id", "user_id"?}``
+    objects, ``{"events": [...]}``, or NDJSON with one event per line. Answers
+    202 with how many events were accepted, dropped and invalid, or 429 if
+    the event buffer was full and some were dropped.
+    """
+    events = parse_events(request.get_data(), request.mimetype)
+    if events is None:
+        return jsonify({"error": "Expected a list of events or NDJSON"}), 400
+    if len(events) > TRACK_EVENTS_MAX:
+        return jsonify({"error": f"At most {TRACK_EVENTS_MAX} events per call"}), 413
+    
+    result = track_events(events)
+    if result["dropped"]:
+        return jsonify(result), 429, {"Retry-After": "1"}
+    return jsonify(result), 202
+
+def parse_events(body, mimetype):
+    """The event objects in a /track-events body, or None if it is malformed"""
+    try:
+        if mimetype in ("application/x-ndjson", "application/jsonl"):
+            return [loads(line) for line in body.splitlines() if line.strip()]
+        data = loads(body)
+    except ValueError:
+        return None
+    events = data.get("events") if isinstance(data, dict) else data
+    return events if isinstance(events, list) else None
+
+def track_events(events):
+    """Enqueue valid view/purchase events in order; the counter flusher applies them.
+    
+    A purchase with a ``user_id`` also adds the product to that user's
+    purchase list. Returns ``{"accepted", "dropped", "invalid"}`` counts.
+    """
+    batch = []
+    for event in events:
+        if not isinstance(event, dict) or not event.get("product_id"):
+            continue
+        kind = event.get("type")
+        if kind == "view":
+            batch.append(("view", normalize_id(event["product_id"])))
+        elif kind == "purchase":
+            user_id = event.get("user_id")
+            if user_id is None:
+                batch.append(("purchase", normalize_id(event["product_id"])))
+            else:
+                batch.append(("purchase", normalize_id(event["product_id"]), str(user_id)))
+    
+    accepted = counter_store.record_events(batch)
+    return {"accepted": accepted, "dropped": len(batch) - accepted, "invalid": len(events) - len(batch)}
+
 @app.route('/analytics', methods=['GET'])
 def get_analytics():
-    """Get basic analytics about products and user behavior"""
+    """Get basic analytics about products and user behavior.
+    
+    Top products and user counts come from the streaming summaries, so
+    they are approximate unless ANALYTICS_EXACT is set; ``windows`` has the
+    same figures for the last hour and day. They are served as the counter
+    flusher last left them, so they trail new events by up to one
+    COUNTER_FLUSH_SECONDS interval; flushing here would put a write
+    transaction on the request path.
+    """
+    report = analytics.report()
+    all_time = report.pop("all_time")
     return jsonify({
-        "total_products": len(products),
-        "total_users": len(user_purchases),
-        "most_viewed_products": dict(sorted(product_views.items(), key=lambda x: x[1], reverse=True)[:5]),
-        "most_purchased_products": dict(sorted(product_purchases.items(), key=lambda x: x[1], reverse=True)[:5]),
-        "categories": list(set(p['category'] for p in products))
+        "total_products": len(state.catalog),
+        "total_users": all_time["distinct_users"],
+        "most_viewed_products": all_time["most_viewed_products"],
+        "most_purchased_products": all_time["most_purchased_products"],
+        "categories": list(state.categories.categories()),
+        "windows": report,
+        "exact": analytics.exact
     })
 
 if __name__ == '__main__':
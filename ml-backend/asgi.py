@@ -0,0 +1,287 @@
+import asyncio
+import io
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from app import (
+    REQUEST_SECONDS, TRACK_EVENTS_MAX, app as flask_app, log, parse_events, record_view, start_background_work,
+    track_events
+)
+from metrics import Gauge
+from serialization import dumps, loads
+
+# Threads that run request handlers (scoring, /products, /analytics, ...)
+# off the event loop
+ASGI_WORKER_THREADS = int(os.environ.get("ASGI_WORKER_THREADS", str(min(32, (os.cpu_count() or 1) + 4))))
+
+# Largest request body read into memory (bytes)
+MAX_BODY_BYTES = 16 * 1024 * 1024
+
+# Routes whose handlers wait on upstream HTTP; they get their own pool so a
+# slow upstream never ties up the threads that serve recommendations
+SYNC_PATHS = ("/sync-products",)
+
+_VIEW_TRACKED = dumps({"message": "View tracked"})
+_BUFFER_FULL = dumps({"error": "Event buffer full, retry later"})
+_RETRY_AFTER = [(b"retry-after", b"1")]
+
+
+class AsgiApp:
+    """ASGI front end for the Flask app, for serving under uvicorn.
+
+    ``POST /track-view`` and ``POST /track-events`` are answered on the
+    event loop: events are only appended to the counter queue, so thousands
+    of concurrent calls need no threads. Every other route runs the Flask handler in a thread pool,
+    with the request body already read and the response streamed back as
+    the handler produces it, so the loop stays free while recommendations
+    are scored or an upstream sync is in flight. Routes, status codes,
+    headers and CORS behave as under ``python app.py``.
+    """
+
+    def __init__(self, wsgi_app, workers=ASGI_WORKER_THREADS):
+        self.wsgi_app = wsgi_app
+        self.workers = ThreadPoolExecutor(workers, thread_name_prefix="asgi")
+        self.sync_workers = ThreadPoolExecutor(1, thread_name_prefix="asgi-sync")
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self._lifespan(receive, send)
+        if scope["type"] != "http":
+            return
+
+        start_background_work()
+        body = await _read_body(receive)
+        if body is None:
+            return await _send_simple(send, 413, b'{"error":"Request body too large"}')
+        if scope["method"] == "POST" and scope["path"] == "/track-view":
+            return await self._track_view(scope, body, send)
+        if scope["method"] == "POST" and scope["path"] == "/track-events":
+            return await self._track_events(scope, body, send)
+
+        executor = self.sync_workers if scope["path"] in SYNC_PATHS else self.workers
+        self.in_flight += 1
+        try:
+            await self._call_wsgi(scope, body, send, executor)
+        finally:
+            self.in_flight -= 1
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                start_background_work()
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.workers.shutdown(wait=False)
+                self.sync_workers.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    async def _track_view(self, scope, body, send):
+        """Enqueue the view and answer without leaving the event loop"""
+        started = time.perf_counter()
+        try:
+            data = loads(body)
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            await _send_simple(send, 400, b'{"error":"Expected a JSON object"}', _cors_headers(scope))
+            REQUEST_SECONDS.observe(time.perf_counter() - started, "track_view", 400)
+            return
+
+        product_id = data.get("product_id")
+        if product_id and not record_view(product_id):
+            await _send_simple(send, 429, _BUFFER_FULL, _cors_headers(scope) + _RETRY_AFTER)
+            REQUEST_SECONDS.observe(time.perf_counter() - started, "track_view", 429)
+            return
+        await _send_simple(send, 200, _VIEW_TRACKED, _cors_headers(scope))
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "track_view", 200)
+
+    async def _track_events(self, scope, body, send):
+        """Enqueue a batch of events and answer without leaving the event loop"""
+        started = time.perf_counter()
+        mimetype = (_header(scope, b"content-type") or "").split(";", 1)[0].strip().lower()
+        events = parse_events(body, mimetype)
+        headers = _cors_headers(scope)
+        if events is None:
+            status, payload = 400, {"error": "Expected a list of events or NDJSON"}
+        elif len(events) > TRACK_EVENTS_MAX:
+            status, payload = 413, {"error": f"At most {TRACK_EVENTS_MAX} events per call"}
+        else:
+            payload = track_events(events)
+            status = 202
+            if payload["dropped"]:
+                status = 429
+                headers = headers + _RETRY_AFTER
+        await _send_simple(send, status, dumps(payload), headers)
+        REQUEST_SECONDS.observe(time.perf_counter() - started, "track_events_endpoint", status)
+
+    async def _call_wsgi(self, scope, body, send, executor):
+        """Run the WSGI app in ``executor``, relaying its response as it is produced"""
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        environ = _environ(scope, body)
+
+        def emit(event):
+            loop.call_soon_threadsafe(events.put_nowait, event)
+
+        def run():
+            started = []
+
+            def start_response(status, headers, exc_info=None):
+                if exc_info and started:
+                    raise exc_info[1].with_traceback(exc_info[2])
+                started[:] = [(status, headers)]
+                return write
+
+            def write(data):
+                flush_start()
+                if data:
+                    emit(("body", bytes(data)))
+
+            def flush_start():
+                if started and started[0] is not None:
+                    emit(("start",) + started[0])
+                    started[0] = None
+
+            try:
+                result = self.wsgi_app(environ, start_response)
+                try:
+                    for chunk in result:
+                        write(chunk)
+                finally:
+                    if hasattr(result, "close"):
+                        result.close()
+                flush_start()
+                emit(("end",))
+            except BaseException as e:
+                emit(("error", e))
+
+        executor.submit(run)
+        response_started = False
+        while True:
+            event = await events.get()
+            kind = event[0]
+            if kind == "start":
+                status, headers = event[1], event[2]
+                await send({
+                    "type": "http.response.start",
+                    "status": int(status.split(" ", 1)[0]),
+                    "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+                })
+                response_started = True
+            elif kind == "body":
+                await send({"type": "http.response.body", "body": event[1], "more_body": True})
+            elif kind == "end":
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+            else:
+                log.error("❌ Unhandled error in %s %s: %s", scope["method"], scope["path"], event[1])
+                if not response_started:
+                    await _send_simple(send, 500, b'{"error":"Internal server error"}')
+                else:
+                    await send({"type": "http.response.body", "body": b"", "more_body": False})
+                return
+
+
+async def _read_body(receive):
+    """The full request body, or None if it exceeds MAX_BODY_BYTES"""
+    chunks = []
+    size = 0
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            break
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            return None
+        chunks.append(chunk)
+        if not message.get("more_body", False):
+            break
+    return b"".join(chunks)
+
+
+async def _send_simple(send, status, body, headers=()):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())] + list(headers)
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+def _header(scope, name):
+    for key, value in scope.get("headers", ()):
+        if key == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _cors_headers(scope):
+    """The CORS headers the Flask app would add to this response"""
+    return list(_flask_cors_headers(scope["method"], scope["path"], _header(scope, b"origin")))
+
+
+@lru_cache(maxsize=256)
+def _flask_cors_headers(method, path, origin):
+    """Headers the Flask app's after-request hooks (Flask-CORS) add for ``origin``.
+
+    They depend only on the method, path and origin, so each combination
+    goes through Flask once, not on every event-loop request.
+    """
+    headers = [(b"origin", origin.encode("latin-1"))] if origin is not None else []
+    environ = _environ({"method": method, "path": path, "headers": headers}, b"")
+    bare = flask_app.response_class()
+    with flask_app.request_context(environ):
+        response = flask_app.process_response(flask_app.response_class())
+    return tuple(
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in response.headers.items() if name not in bare.headers
+    )
+
+
+def _environ(scope, body):
+    """PEP 3333 environ for an ASGI HTTP scope whose body has been read"""
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", "").encode("utf-8").decode("latin-1"),
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "REMOTE_PORT": str(client[1]),
+        "CONTENT_LENGTH": str(len(body)),
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(body),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False
+    }
+    for name, value in scope.get("headers", ()):
+        name = name.decode("latin-1").upper().replace("-", "_")
+        value = value.decode("latin-1")
+        if name == "CONTENT_TYPE":
+            environ["CONTENT_TYPE"] = value
+        elif name == "CONTENT_LENGTH":
+            continue
+        else:
+            key = f"HTTP_{name}"
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+application = AsgiApp(flask_app)
+
+Gauge('asgi_requests_in_flight', 'Requests queued for or running in the ASGI worker threads',
+      function=lambda: application.in_flight)
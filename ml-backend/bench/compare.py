@@ -0,0 +1,68 @@
+"""Compare two benchmark result files.
+
+    python bench/compare.py before.json after.json [--fail-above 1.2]
+
+Prints p50/p99 and peak RSS side by side for every benchmark and size the
+two runs share. With ``--fail-above``, exits non-zero if any p50 or p99
+grew by more than that factor.
+"""
+import argparse
+import json
+import sys
+
+
+def load(path):
+    with open(path) as f:
+        report = json.load(f)
+    return report.get("meta", {}), {
+        (record["benchmark"], record["size"]): record for record in report["results"]
+    }
+
+
+def ratio(before, after):
+    if not before or after is None:
+        return None
+    return after / before
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--fail-above", type=float, help="fail on a p50/p99 slowdown above this factor")
+    args = parser.parse_args(argv)
+
+    before_meta, before = load(args.before)
+    after_meta, after = load(args.after)
+    print(f"before: {before_meta.get('commit')}  after: {after_meta.get('commit')}")
+    print(f"{'benchmark':<45} {'size':>8} {'p50 ms':>19} {'p99 ms':>19} {'ratio':>6}")
+
+    regressions = []
+    for key in sorted(before.keys() & after.keys(), key=lambda key: (key[1], key[0])):
+        old, new = before[key], after[key]
+        name, size = key
+        memory_key = next((key for key in ("peak_rss_mb", "memory_mb") if key in old), None)
+        if memory_key:
+            print(f"{name:<45} {size:>8} {'':>19} {old[memory_key]:>8.1f} -> {new.get(memory_key) or 0:>6.1f} MB")
+            continue
+        if "p50_ms" not in old:
+            continue
+        worst = max(
+            (value for value in (ratio(old["p50_ms"], new["p50_ms"]), ratio(old["p99_ms"], new["p99_ms"]))
+             if value is not None),
+            default=None
+        )
+        print(
+            f"{name:<45} {size:>8} {old['p50_ms']:>8.3f} -> {new['p50_ms']:>8.3f} "
+            f"{old['p99_ms']:>8.3f} -> {new['p99_ms']:>8.3f} {worst or 0:>6.2f}"
+        )
+        if args.fail_above and worst is not None and worst > args.fail_above:
+            regressions.append((name, size, worst))
+
+    for name, size, worst in regressions:
+        print(f"❌ {name} at {size} products is {worst:.2f}x slower", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
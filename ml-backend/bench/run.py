@@ -0,0 +1,390 @@
+"""Benchmark and load-test suite for the recommendation service.
+
+    python bench/run.py                                  # 1k, 10k, 100k, 1M products
+    python bench/run.py --sizes 1000,10000 --output before.json
+    python bench/run.py --sizes 10000 --target http --concurrency 8
+    python bench/compare.py before.json after.json
+
+Each catalog size runs in its own process, so peak RSS is per size. For
+every size the suite times sync (fetch from a local stub of the Node.js
+backend and DummyJSON, conversion, incremental diff), index builds, each
+recommendation helper on realistic carts, and end-to-end requests through
+the Flask app. Results are written as JSON: one record per benchmark and
+size, with p50/p99/mean latency in milliseconds and throughput per second.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+DEFAULT_SIZES = "1000,10000,100000,1000000"
+
+# The app's NEIGHBOR_INDEX_MAX_PRODUCTS, same variable and default. Up to this
+# many products the O(n^2) neighbour table is built, timed on its own as
+# index.neighbors_build, and requests use it, as production does once its
+# background build finishes; above it, both take the brute-force path
+DEFAULT_NEIGHBOR_LIMIT = int(os.environ.get("NEIGHBOR_INDEX_MAX_PRODUCTS", "100000"))
+
+# Above this many products the HTTP sync benchmark is skipped
+DEFAULT_FETCH_LIMIT = 100000
+
+
+def summarize(name, size, durations, wall=None, **extra):
+    """One result record from per-call durations in seconds"""
+    import numpy as np
+
+    durations = np.asarray(durations, dtype=np.float64)
+    wall = wall if wall is not None else float(durations.sum())
+    return {
+        "benchmark": name,
+        "size": size,
+        "iterations": int(len(durations)),
+        "p50_ms": float(np.percentile(durations, 50) * 1000),
+        "p99_ms": float(np.percentile(durations, 99) * 1000),
+        "mean_ms": float(durations.mean() * 1000),
+        "throughput_per_s": len(durations) / wall if wall > 0 else None,
+        "total_s": wall,
+        **extra
+    }
+
+
+def measure(name, size, fn, inputs, seconds, min_iterations=1):
+    """Call ``fn`` on ``inputs`` in turn until ``seconds`` have passed"""
+    durations = []
+    clock = time.perf_counter
+    deadline = clock() + seconds
+    i = 0
+    while i < min_iterations or (clock() < deadline and i < len(inputs) * 1000):
+        item = inputs[i % len(inputs)]
+        started = clock()
+        fn(item)
+        durations.append(clock() - started)
+        i += 1
+    return summarize(name, size, durations)
+
+
+def once(name, size, fn):
+    started = time.perf_counter()
+    result = fn()
+    return summarize(name, size, [time.perf_counter() - started]), result
+
+
+def drive(name, size, send, requests, concurrency, seconds):
+    """Closed-loop load: ``concurrency`` threads send ``requests`` for ``seconds``"""
+    durations = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    deadline = time.perf_counter() + seconds
+
+    def worker(slot):
+        i = slot
+        clock = time.perf_counter
+        while clock() < deadline:
+            started = clock()
+            if not send(slot, requests[i % len(requests)]):
+                errors[slot] += 1
+            durations[slot].append(clock() - started)
+            i += concurrency
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - started
+    return summarize(
+        name, size, [d for slot in durations for d in slot], wall,
+        concurrency=concurrency, errors=sum(errors)
+    )
+
+
+def build_state(catalog, views, purchases, neighbor_limit, neighbors=None, content=None):
+    from content import ContentIndex
+    from neighbors import NeighborIndex
+    from state import CatalogState
+
+    content = content if content is not None else ContentIndex.build(catalog)
+    if neighbors is None and len(catalog) <= neighbor_limit:
+        neighbors = NeighborIndex.build(catalog, content=content)
+    # Otherwise the table stays unbuilt and similar-product lookups fall back to brute force
+    return CatalogState(catalog, views, purchases, neighbors=neighbors, content=content)
+
+
+def bench_sync(args, upstream, results):
+    from stub import StubUpstream
+    from sync import build_catalog, diff_upstream, fetch_upstream, make_session
+
+    size = args.size
+    if size <= args.fetch_limit:
+        stub = StubUpstream(upstream).start()
+        session = make_session()
+        record, (fetched, _) = once("sync.fetch_upstream", size, lambda: fetch_upstream(
+            stub.node_url, stub.dummyjson_url, session=session
+        ))
+        results.append(record)
+        stub.stop()
+        assert sum(len(products) for products in fetched.values()) == size
+
+    record, catalog = once("sync.build_catalog", size, lambda: build_catalog(upstream))
+    results.append(record)
+
+    # 1% of products edited upstream
+    changed = {source: [dict(product) for product in products] for source, products in upstream.items()}
+    for product in changed["nodejs"][::100]:
+        product["price"] = round(product["price"] * 1.1, 2)
+    record, delta = once("sync.incremental_diff", size, lambda: diff_upstream(catalog, changed))
+    results.append(record)
+    return catalog
+
+
+def bench_helpers(args, state, requests, results):
+    from recommender import (
+        get_diverse_category_recommendations, get_popular_products, get_price_range_recommendations,
+        get_similar_products, prepare_cart, recommend_rows
+    )
+
+    size = args.size
+    catalog = state.catalog
+    carts = [prepare_cart(catalog, request["history"]) for request in requests]
+    with_items = [cart for cart in carts if cart.purchased_rows] or carts
+    seconds = args.seconds
+
+    results.append(measure("helper.get_popular_products", size, lambda _: get_popular_products(state), [None], seconds))
+    results.append(measure("helper.popularity_top", size, lambda cart: state.popularity.top(
+        6, cart.bought_rows, (), distinct_categories=True
+    ), carts, seconds))
+    results.append(measure("helper.get_similar_products", size, lambda cart: get_similar_products(
+        state, cart.purchased_rows, cart.bought_ids
+    ), with_items, seconds))
+    results.append(measure("helper.get_diverse_category_recommendations", size, lambda cart: (
+        get_diverse_category_recommendations(
+            state, [catalog.category_of(row) for row in cart.purchased_rows], cart.bought_ids, set()
+        )
+    ), with_items, seconds))
+    results.append(measure("helper.get_price_range_recommendations", size, lambda cart: (
+        get_price_range_recommendations(state, cart.purchased_rows, cart.bought_ids)
+    ), with_items, seconds))
+    results.append(measure("helper.recommend_rows", size, lambda cart: recommend_rows(
+        state, cart, 6
+    ), carts, seconds))
+
+
+def bench_app(args, state, requests, results):
+    import app
+
+    size = args.size
+    app.background_started.set()   # keep the app from syncing on its own
+    app.publish_state(state)
+    app.counter_store.start()
+
+    clients = [app.app.test_client() for _ in range(args.concurrency)]
+
+    def send(slot, body):
+        return clients[slot].post("/recommend", json=body).status_code == 200
+
+    def get(path):
+        return lambda slot, _: clients[slot].get(path).status_code in (200, 304)
+
+    results.append(drive("e2e.recommend", size, send, requests, args.concurrency, args.seconds))
+    maxsize = app.recommend_cache.maxsize
+    app.recommend_cache.maxsize = 0
+    app.recommend_cache.clear()
+    results.append(drive("e2e.recommend_uncached", size, send, requests, args.concurrency, args.seconds))
+    app.recommend_cache.maxsize = maxsize
+
+    record, _ = once("e2e.recommend_batch_1000", size, lambda: clients[0].post(
+        "/recommend/batch", json={"requests": requests[:1000]}
+    ).get_json())
+    results.append(record)
+    results.append(drive("e2e.products_page", size, get("/products?page=1&per_page=50"), [None],
+                         args.concurrency, args.seconds))
+    if size <= args.fetch_limit:
+        results.append(drive("e2e.products_full", size, get("/products"), [None], args.concurrency, args.seconds))
+
+    # One view per call against batches of 1000 events per call
+    views = [{"product_id": i % size} for i in range(1000)]
+    batches = [[{"type": "view", "product_id": (i + j) % size} for j in range(1000)] for i in range(10)]
+    results.append(drive("e2e.track_view", size, lambda slot, body: clients[slot].post(
+        "/track-view", json=body
+    ).status_code == 200, views, args.concurrency, args.seconds))
+    results.append(drive("e2e.track_events_1000", size, lambda slot, body: clients[slot].post(
+        "/track-events", json=body
+    ).status_code == 202, batches, args.concurrency, args.seconds))
+    results.append(drive("e2e.analytics", size, get("/analytics"), [None], args.concurrency, args.seconds))
+    app.counter_store.stop()
+
+
+def bench_http(args, requests, results):
+    """Load a separate server process (bench/serve.py) over HTTP"""
+    import requests as http
+
+    size = args.size
+    server = subprocess.Popen([
+        sys.executable, os.path.join(BENCH_DIR, "serve.py"), "--size", str(size), "--seed", str(args.seed),
+        "--port", str(args.port), "--neighbor-limit", str(args.neighbor_limit)
+    ], stdout=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{args.port}"
+    try:
+        deadline = time.time() + 3600
+        while True:
+            try:
+                if http.get(f"{base}/health", timeout=1).ok:
+                    break
+            except http.ConnectionError:
+                pass
+            if server.poll() is not None or time.time() > deadline:
+                raise RuntimeError("bench server did not start")
+            time.sleep(0.2)
+
+        sessions = [http.Session() for _ in range(args.concurrency)]
+
+        def send(slot, body):
+            return sessions[slot].post(f"{base}/recommend", json=body, timeout=30).ok
+
+        results.append(drive("http.recommend", size, send, requests, args.concurrency, args.seconds))
+        results.append({"benchmark": "http.server_peak_rss", "size": size, "peak_rss_mb": _peak_rss_of(server.pid)})
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def _peak_rss_of(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        return None
+
+
+def run_size(args):
+    """All benchmarks for one catalog size, in this process"""
+    from synthetic import product_ids, recommend_requests, upstream_payload
+
+    size = args.size
+    results = []
+    record, upstream = once("synthetic.generate", size, lambda: upstream_payload(size, args.seed))
+    results.append(record)
+    requests = recommend_requests(product_ids(upstream), args.requests, args.seed)
+
+    catalog = bench_sync(args, upstream, results)
+    del upstream
+
+    from content import ContentIndex
+    record, content = once("index.content_build", size, lambda: ContentIndex.build(catalog))
+    results.append(record)
+    results.append({"benchmark": "index.content_memory", "size": size, "memory_mb": content.memory_bytes() / 2 ** 20})
+
+    neighbors = None
+    if len(catalog) <= args.neighbor_limit:
+        from neighbors import NeighborIndex
+        record, neighbors = once("index.neighbors_build", size, lambda: NeighborIndex.build(catalog, content=content))
+        results.append(record)
+    # Popularity, category and price indexes; content and neighbours are timed above
+    record, state = once("index.state_build", size, lambda: build_state(
+        catalog, {}, {}, args.neighbor_limit, neighbors, content
+    ))
+    results.append(record)
+
+    bench_helpers(args, state, requests, results)
+    if args.target == "http":
+        bench_http(args, requests, results)
+    else:
+        bench_app(args, state, requests, results)
+
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    results.append({"benchmark": "process.peak_rss", "size": size, "peak_rss_mb": peak_kb / 1024})
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=BENCH_DIR, stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated catalog sizes")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=5000, help="distinct synthetic requests per size")
+    parser.add_argument("--seconds", type=float, default=3.0, help="time budget per benchmark")
+    parser.add_argument("--concurrency", type=int, default=4, help="client threads for end-to-end load")
+    parser.add_argument("--target", choices=("testclient", "http"), default="testclient")
+    parser.add_argument("--port", type=int, default=5099, help="port for --target http")
+    parser.add_argument("--neighbor-limit", type=int, default=DEFAULT_NEIGHBOR_LIMIT)
+    parser.add_argument("--fetch-limit", type=int, default=DEFAULT_FETCH_LIMIT)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    parser.add_argument("--size", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    if args.result_file:
+        with open(args.result_file, "w") as f:
+            json.dump(run_size(args), f)
+        return 0
+
+    import numpy as np
+
+    results = []
+    for size in [int(size) for size in args.sizes.split(",") if size]:
+        print(f"⏱️ Benchmarking {size} products...", file=sys.stderr)
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+            result_file = f.name
+        try:
+            command = [sys.executable, os.path.abspath(__file__), "--size", str(size), "--result-file", result_file]
+            for option in ("seed", "requests", "seconds", "concurrency", "target", "port",
+                           "neighbor_limit", "fetch_limit"):
+                command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+            completed = subprocess.run(command)
+            if completed.returncode != 0:
+                print(f"❌ Size {size} failed with exit code {completed.returncode}", file=sys.stderr)
+                results.append({"benchmark": "error", "size": size, "returncode": completed.returncode})
+                continue
+            with open(result_file) as f:
+                results.extend(json.load(f))
+        finally:
+            os.unlink(result_file)
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("size", "result_file")}
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,95 @@
+"""Benchmark the co-purchase index at millions of interactions.
+
+    python bench/run_copurchase.py                        # 2M interactions over 100k products
+    python bench/run_copurchase.py --interactions 5000000 --max-pairs 500000 --output copurchase.json
+
+Feeds Zipf-distributed baskets to a CoPurchaseIndex in flush-sized
+batches, then times "bought together" queries for realistic carts. Writes
+the same JSON format as ``bench/run.py``, so ``bench/compare.py`` works on it.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+# Baskets per update call, about what one counter flush delivers under load
+FLUSH_BATCH = 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--interactions", type=int, default=2000000, help="purchased items across all baskets")
+    parser.add_argument("--products", type=int, default=100000)
+    parser.add_argument("--max-pairs", type=int, default=1000000)
+    parser.add_argument("--normalization", default="cosine")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--seconds", type=float, default=3.0, help="time budget for the query benchmark")
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    from copurchase import CoPurchaseIndex
+    from run import _git_commit, measure, summarize
+    from synthetic import carts
+
+    ids = [f"{0x650000000000000000000000 + index:024x}" for index in range(args.products)]
+    size = args.interactions
+    rng = random.Random(args.seed)
+
+    started = time.perf_counter()
+    baskets = []
+    interactions = 0
+    while interactions < args.interactions:
+        # Mean cart size is 1.75 items
+        count = max(1000, int((args.interactions - interactions) / 1.75))
+        for history in carts(ids, count, rng.randrange(1 << 30)):
+            basket = [item["id"] for item in history]
+            if basket:
+                baskets.append(basket)
+                interactions += len(basket)
+    generated = time.perf_counter() - started
+    print(f"⏱️ {len(baskets)} baskets, {interactions} interactions in {generated:.1f}s", file=sys.stderr)
+
+    index = CoPurchaseIndex(args.max_pairs, normalization=args.normalization)
+    durations = []
+    for start in range(0, len(baskets), FLUSH_BATCH):
+        batch = [((), basket) for basket in baskets[start:start + FLUSH_BATCH]]
+        began = time.perf_counter()
+        index.update(batch)
+        durations.append(time.perf_counter() - began)
+    results = [summarize(
+        "copurchase.update_1000_baskets", size, durations, interactions=interactions, **index.stats()
+    )]
+
+    queries = baskets[-5000:]
+    results.append(measure("copurchase.top", size, lambda basket: index.top(basket, 6), queries, args.seconds, 1000))
+    results.append({
+        "benchmark": "process.peak_rss", "size": size,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    })
+
+    report = {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "args": vars(args)
+        },
+        "results": results
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,45 @@
+"""Serve the Flask app on a synthetic catalog for HTTP load tests.
+
+    python bench/serve.py --size 100000 --port 5099
+
+Builds the same catalog as ``bench/run.py`` for the same size and seed,
+publishes it, and serves with a threaded WSGI server. No upstream sync runs.
+"""
+import argparse
+import logging
+import os
+import sys
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+
+def main(argv=None):
+    from run import DEFAULT_NEIGHBOR_LIMIT
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--port", type=int, default=5099)
+    parser.add_argument("--neighbor-limit", type=int, default=DEFAULT_NEIGHBOR_LIMIT)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+    from werkzeug.serving import make_server
+
+    import app
+    from run import build_state
+    from sync import build_catalog
+    from synthetic import upstream_payload
+
+    catalog = build_catalog(upstream_payload(args.size, args.seed))
+    app.publish_state(build_state(catalog, app.product_views, app.product_purchases, args.neighbor_limit))
+    app.background_started.set()
+    app.counter_store.start()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)   # no per-request access log
+    make_server("127.0.0.1", args.port, app.app, threaded=True).serve_forever()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,81 @@
+"""Local stand-in for the Node.js backend and dummyjson.com.
+
+Serves ``GET /api/products`` (a JSON array, streamed in chunks) and
+``GET /products?limit=&skip=`` (DummyJSON pages) from a synthetic payload
+on a background thread.
+"""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+CHUNK_SIZE = 64 * 1024
+
+
+class StubUpstream:
+    def __init__(self, upstream, host="127.0.0.1", port=0):
+        self.node_body = json.dumps(upstream["nodejs"]).encode("utf-8")
+        self.dummyjson = upstream["dummyjson"]
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stub.requests += 1
+                url = urlparse(self.path)
+                if url.path == "/api/products":
+                    self._send_chunked(stub.node_body)
+                elif url.path == "/products":
+                    query = parse_qs(url.query)
+                    limit = int(query.get("limit", ["30"])[0])
+                    skip = int(query.get("skip", ["0"])[0])
+                    page = stub.dummyjson[skip:skip + limit]
+                    self._send(json.dumps({
+                        "products": page, "total": len(stub.dummyjson), "skip": skip, "limit": len(page)
+                    }).encode("utf-8"))
+                else:
+                    self.send_error(404)
+
+            def _send(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _send_chunked(self, body):
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for start in range(0, len(body), CHUNK_SIZE):
+                    chunk = body[start:start + CHUNK_SIZE]
+                    self.wfile.write(f"{len(chunk):x}\r\n".encode("ascii") + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def node_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def dummyjson_url(self):
+        return f"{self.node_url}/products"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, name="stub-upstream", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
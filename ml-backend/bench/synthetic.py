@@ -0,0 +1,134 @@
+"""Synthetic upstream catalogs and cart traffic for benchmarks.
+
+Products come in the raw shapes the sync code consumes: MongoDB documents
+from the Node.js backend and DummyJSON products. Everything is generated
+from a seed, so two processes given the same arguments build the same
+catalog.
+"""
+import itertools
+import random
+
+CATEGORIES = [
+    'smartphones', 'laptops', 'fragrances', 'skincare', 'groceries',
+    'home-decoration', 'furniture', 'tops', 'womens-dresses', 'womens-shoes',
+    'mens-shirts', 'mens-shoes', 'mens-watches', 'womens-watches', 'womens-bags',
+    'womens-jewellery', 'sunglasses', 'automotive', 'motorcycle', 'lighting',
+    'Electronics', 'Fashion', 'Sports', 'Books', 'Toys'
+]
+
+ATTRIBUTES = [
+    'wireless', 'bluetooth', 'smart', 'premium', 'portable', 'waterproof',
+    'leather', 'cotton', 'organic', 'eco-friendly', 'rechargeable',
+    'lightweight', 'durable', 'comfortable', 'stylish', 'modern',
+    'vintage', 'classic', 'professional', 'gaming', 'fitness', 'stainless steel',
+    'noise cancelling', 'ergonomic', 'handmade', 'minimalist'
+]
+
+NOUNS = [
+    'headphones', 'speaker', 'watch', 'backpack', 'jacket', 'sneakers',
+    'lamp', 'chair', 'desk', 'bottle', 'mug', 'keyboard', 'mouse', 'camera',
+    'charger', 'wallet', 'perfume', 'serum', 'blender', 'kettle'
+]
+
+FILLER = [
+    'designed', 'for', 'everyday', 'use', 'with', 'a', 'finish', 'that',
+    'lasts', 'and', 'looks', 'great', 'in', 'any', 'setting', 'the', 'best',
+    'choice', 'perfect', 'gift', 'quality', 'materials', 'built', 'to', 'last'
+]
+
+# DummyJSON only ever supplies 100 products; the rest come from MongoDB
+DUMMYJSON_PRODUCTS = 100
+
+# Cart sizes and how often they occur
+CART_SIZES = [0, 1, 2, 3, 4, 5, 8]
+CART_WEIGHTS = [20, 35, 20, 12, 7, 4, 2]
+
+# Zipf exponent for how often each product appears in carts
+ZIPF_EXPONENT = 1.1
+
+
+def _description(rng):
+    words = rng.choices(FILLER, k=rng.randint(8, 30))
+    for attribute in rng.sample(ATTRIBUTES, rng.randint(0, 4)):
+        words.insert(rng.randrange(len(words) + 1), attribute)
+    return ' '.join(words).capitalize() + '.'
+
+
+def _name(rng):
+    return f"{rng.choice(ATTRIBUTES).title()} {rng.choice(NOUNS).title()} {rng.randint(1, 999)}"
+
+
+def _price(rng):
+    return round(rng.lognormvariate(3.5, 1.2), 2)
+
+
+def mongo_product(rng, index):
+    """A product document as the Node.js backend returns it"""
+    return {
+        "_id": f"{0x650000000000000000000000 + index:024x}",
+        "name": _name(rng),
+        "price": _price(rng),
+        "image": f"https://cdn.example.com/products/{index}.jpg",
+        "description": _description(rng),
+        "category": rng.choice(CATEGORIES),
+        "countInStock": rng.randint(0, 200),
+        "createdAt": "2024-01-01T00:00:00.000Z",
+        "__v": 0
+    }
+
+
+def dummyjson_product(rng, product_id):
+    """A product as dummyjson.com returns it"""
+    return {
+        "id": product_id,
+        "title": _name(rng),
+        "description": _description(rng),
+        "price": _price(rng),
+        "discountPercentage": round(rng.uniform(0, 20), 2),
+        "rating": round(rng.uniform(3.0, 5.0), 2),
+        "stock": rng.randint(0, 150),
+        "brand": rng.choice(NOUNS).title(),
+        "category": rng.choice(CATEGORIES),
+        "thumbnail": f"https://cdn.dummyjson.com/product-images/{product_id}/thumbnail.jpg",
+        "images": []
+    }
+
+
+def upstream_payload(size, seed=0):
+    """``{"nodejs": [...], "dummyjson": [...]}`` with ``size`` products in total"""
+    rng = random.Random(seed)
+    dummyjson_count = min(DUMMYJSON_PRODUCTS, size)
+    return {
+        "nodejs": [mongo_product(rng, index) for index in range(size - dummyjson_count)],
+        "dummyjson": [dummyjson_product(rng, product_id) for product_id in range(1, dummyjson_count + 1)]
+    }
+
+
+def product_ids(upstream):
+    """Product ids as the frontend sends them in carts"""
+    return (
+        [product["_id"] for product in upstream["nodejs"]] +
+        [product["id"] + 1000 for product in upstream["dummyjson"]]
+    )
+
+
+def carts(ids, count, seed=0):
+    """``count`` cart histories; sizes follow CART_WEIGHTS, items a Zipf law"""
+    rng = random.Random(seed)
+    cum_weights = list(itertools.accumulate(1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(ids))))
+    popular_first = ids[:]
+    rng.shuffle(popular_first)
+    histories = []
+    for size in rng.choices(CART_SIZES, CART_WEIGHTS, k=count):
+        items = rng.choices(popular_first, cum_weights=cum_weights, k=size) if size else []
+        histories.append([{"id": product_id, "quantity": rng.randint(1, 3)} for product_id in items])
+    return histories
+
+
+def recommend_requests(ids, count, seed=0):
+    """``/recommend`` request bodies with realistic carts"""
+    rng = random.Random(seed + 1)
+    return [
+        {"user_id": f"user-{rng.randint(1, max(count // 4, 1))}", "history": history, "limit": 6}
+        for history in carts(ids, count, seed)
+    ]
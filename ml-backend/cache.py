@@ -0,0 +1,85 @@
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAXSIZE = 10000
+DEFAULT_TTL = 300
+
+
+class RecommendationCache:
+    """Bounded LRU cache with a TTL for ``/recommend`` responses.
+
+    Entries belong to a generation, ``(catalog uid, catalog version,
+    popularity head version)``. Anything that changes the catalog or the
+    head of the ranking changes the generation, and the first lookup under
+    a new generation drops every older entry at once, so a stale response is
+    never served. Changes that only affect some carts belong in the key.
+    """
+
+    def __init__(self, maxsize=DEFAULT_MAXSIZE, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()   # key -> (expires at, value)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _adopt(self, generation):
+        if generation != self.generation:
+            if self._entries:
+                self.invalidations += 1
+                self._entries.clear()
+            self.generation = generation
+
+    def get(self, key, generation):
+        """Cached value for ``key`` under ``generation``, or None"""
+        with self._lock:
+            self._adopt(generation)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= self.clock():
+                del self._entries[key]
+                self.expirations += 1
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key, generation, value):
+        with self._lock:
+            if not self.maxsize:
+                return
+            self._adopt(generation)
+            self._entries[key] = (self.clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "ttl_seconds": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
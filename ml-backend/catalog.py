@@ -0,0 +1,329 @@
+import itertools
+import re
+
+import numpy as np
+
+# Bits per word of the tag bitmask columns
+TAG_WORD_BITS = 64
+
+if hasattr(np, 'bitwise_count'):
+    def popcount(words):
+        """Count set bits per row of a uint64 bitmask array"""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        """Count set bits per row of a uint64 bitmask array"""
+        words = np.ascontiguousarray(words)
+        as_bytes = words.view(np.uint8).reshape(words.shape[:-1] + (-1,))
+        return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+_OBJECT_ID = re.compile(r'^[0-9a-fA-F]{24}$')
+
+# Distinguishes catalogs whose version counters happen to coincide
+_catalog_uids = itertools.count(1)
+
+
+def normalize_id(product_id):
+    """Canonical string key for a product id.
+
+    Integers and integral floats (DummyJSON ids, 1001 or 1001.0) become
+    their decimal string, Mongo ObjectIds (plain or ``{"$oid": ...}``)
+    become lowercase hex, and other ids such as ``fallback_001`` are kept
+    as stripped strings.
+    """
+    if isinstance(product_id, dict) and '$oid' in product_id:
+        product_id = product_id['$oid']
+    if isinstance(product_id, float) and product_id.is_integer():
+        return str(int(product_id))
+    key = str(product_id).strip()
+    if _OBJECT_ID.match(key):
+        return key.lower()
+    return key
+
+
+def _as_number(value, default=0.0):
+    """Coerce an upstream rating/review value to float"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float(default)
+
+
+class ProductCatalog:
+    """Columnar product store.
+
+    Numeric attributes live in contiguous NumPy arrays indexed by row, text
+    attributes in parallel Python lists. Deleted rows are tombstoned so row
+    numbers stay stable; dict views are only built for rows being returned.
+    """
+
+    def __init__(self, capacity=1024):
+        capacity = max(int(capacity), 16)
+        self.size = 0          # rows used, including tombstones
+        self.live_count = 0    # rows not deleted
+        self.version = 0       # bumped on every mutation
+        self.uid = next(_catalog_uids)
+
+        self._price = np.zeros(capacity, dtype=np.float64)
+        self._rating = np.zeros(capacity, dtype=np.float64)
+        self._reviews = np.zeros(capacity, dtype=np.float64)
+        self._category = np.zeros(capacity, dtype=np.int32)
+        self._alive = np.zeros(capacity, dtype=bool)
+        self._tag_bits = np.zeros((capacity, 1), dtype=np.uint64)
+
+        self.ids = []
+        self.names = []
+        self.images = []
+        self.descriptions = []
+        self.tags = []
+
+        self.keys = []                # row -> normalized id
+        self.id_index = {}            # normalized id -> row
+        self.max_numeric = 0          # largest numeric id ever stored
+        self.content_hashes = {}      # normalized id -> upstream payload hash
+        self.category_names = []      # code -> category
+        self.category_codes = {}      # category -> code
+        self._category_live = []      # code -> live row count
+        self.tag_vocab = {}           # tag -> bit position
+
+    # Numeric columns, by attribute name, as saved in snapshots
+    COLUMNS = ('price', 'rating', 'reviews', 'category', 'alive', 'tag_bits')
+
+    @classmethod
+    def from_columns(cls, columns, ids, names, images, descriptions, tags,
+                     category_names, tag_vocab, content_hashes, max_numeric=0, version=0):
+        """Rebuild a catalog around existing column arrays (e.g. memory-mapped).
+
+        The arrays are used as they are, not copied; adds that outgrow them
+        move the catalog to fresh arrays.
+        """
+        catalog = cls(capacity=0)
+        for name in cls.COLUMNS:
+            setattr(catalog, '_' + name, columns[name])
+        catalog.size = len(ids)
+        catalog.ids = list(ids)
+        catalog.names = list(names)
+        catalog.images = list(images)
+        catalog.descriptions = list(descriptions)
+        catalog.tags = [list(row_tags) for row_tags in tags]
+        catalog.keys = [normalize_id(product_id) for product_id in catalog.ids]
+        catalog.id_index = {key: row for row, key in enumerate(catalog.keys) if catalog._alive[row]}
+        catalog.live_count = len(catalog.id_index)
+        catalog.max_numeric = int(max_numeric)
+        catalog.content_hashes = dict(content_hashes)
+        catalog.category_names = list(category_names)
+        catalog.category_codes = {name: code for code, name in enumerate(catalog.category_names)}
+        catalog._category_live = np.bincount(
+            catalog.category[catalog.alive], minlength=len(catalog.category_names)
+        ).tolist()
+        catalog.tag_vocab = dict(tag_vocab)
+        catalog.version = int(version)
+        return catalog
+
+    @property
+    def price(self):
+        return self._price[:self.size]
+
+    @property
+    def rating(self):
+        return self._rating[:self.size]
+
+    @property
+    def reviews(self):
+        return self._reviews[:self.size]
+
+    @property
+    def category(self):
+        return self._category[:self.size]
+
+    @property
+    def alive(self):
+        return self._alive[:self.size]
+
+    @property
+    def tag_bits(self):
+        return self._tag_bits[:self.size]
+
+    def __len__(self):
+        return self.live_count
+
+    def __contains__(self, product_id):
+        return normalize_id(product_id) in self.id_index
+
+    def category_code(self, category):
+        """Return the integer code for a category, registering it if new"""
+        code = self.category_codes.get(category)
+        if code is None:
+            code = len(self.category_names)
+            self.category_codes[category] = code
+            self.category_names.append(category)
+            self._category_live.append(0)
+        return code
+
+    def encode_tags(self, tags):
+        """Return the uint64 bitmask words for a list of tags"""
+        for tag in tags:
+            if tag not in self.tag_vocab:
+                self.tag_vocab[tag] = len(self.tag_vocab)
+        words_needed = max(1, -(-len(self.tag_vocab) // TAG_WORD_BITS))
+        if words_needed > self._tag_bits.shape[1]:
+            widened = np.zeros((self._tag_bits.shape[0], words_needed), dtype=np.uint64)
+            widened[:, :self._tag_bits.shape[1]] = self._tag_bits
+            self._tag_bits = widened
+
+        words = np.zeros(self._tag_bits.shape[1], dtype=np.uint64)
+        for tag in tags:
+            bit = self.tag_vocab[tag]
+            words[bit // TAG_WORD_BITS] |= np.uint64(1 << (bit % TAG_WORD_BITS))
+        return words
+
+    def _grow(self, needed):
+        capacity = len(self._price)
+        if needed <= capacity:
+            return
+        new_capacity = max(needed, capacity * 2)
+        for name in ('_price', '_rating', '_reviews', '_category', '_alive'):
+            column = getattr(self, name)
+            grown = np.zeros(new_capacity, dtype=column.dtype)
+            grown[:capacity] = column
+            setattr(self, name, grown)
+        grown_tags = np.zeros((new_capacity, self._tag_bits.shape[1]), dtype=np.uint64)
+        grown_tags[:capacity] = self._tag_bits
+        self._tag_bits = grown_tags
+
+    def add(self, product):
+        """Insert a product dict, replacing any existing row with the same id.
+
+        Returns the row the product was stored in.
+        """
+        key = normalize_id(product['id'])
+        row = self.id_index.get(key)
+        if row is None:
+            row = self.size
+            self._grow(row + 1)
+            self.size += 1
+            self.live_count += 1
+            self.ids.append(None)
+            self.keys.append(key)
+            self.names.append(None)
+            self.images.append(None)
+            self.descriptions.append(None)
+            self.tags.append(None)
+            self.id_index[key] = row
+            # An all-digit Mongo ObjectId is still an ObjectId, not a numeric id
+            if key.isdigit() and not _OBJECT_ID.match(key):
+                self.max_numeric = max(self.max_numeric, int(key))
+        else:
+            self._category_live[self._category[row]] -= 1
+
+        tags = list(product.get('tags', []))
+        code = self.category_code(product.get('category', 'Others'))
+
+        self.ids[row] = product['id']
+        self.names[row] = product.get('name')
+        self.images[row] = product.get('image')
+        self.descriptions[row] = product.get('description', '')
+        self.tags[row] = tags
+        self._price[row] = _as_number(product.get('price', 0))
+        self._rating[row] = _as_number(product.get('rating', 0))
+        self._reviews[row] = _as_number(product.get('reviews', 0))
+        self._category[row] = code
+        self._tag_bits[row] = self.encode_tags(tags)
+        self._alive[row] = True
+        self._category_live[code] += 1
+
+        self.version += 1
+        return row
+
+    def extend(self, products):
+        """Insert many product dicts"""
+        self._grow(self.size + len(products))
+        for product in products:
+            self.add(product)
+
+    def remove(self, product_id):
+        """Tombstone a product by id. Returns the freed row, or None if absent"""
+        key = normalize_id(product_id)
+        row = self.id_index.pop(key, None)
+        if row is None:
+            return None
+        self.content_hashes.pop(key, None)
+        self._alive[row] = False
+        self._tag_bits[row] = 0
+        self._category_live[self._category[row]] -= 1
+        self.live_count -= 1
+        self.version += 1
+        return row
+
+    def row_of(self, product_id):
+        """Return the row for a product id (int or str), or None"""
+        return self.id_index.get(normalize_id(product_id))
+
+    def rows_of(self, product_ids):
+        """Return the rows for the ids that exist in the catalog"""
+        rows = []
+        for product_id in product_ids:
+            row = self.id_index.get(normalize_id(product_id))
+            if row is not None:
+                rows.append(row)
+        return rows
+
+    def product(self, row):
+        """Build the dict view of one row"""
+        reviews = self._reviews[row]
+        return {
+            "id": self.ids[row],
+            "name": self.names[row],
+            "price": float(self._price[row]),
+            "image": self.images[row],
+            "description": self.descriptions[row],
+            "category": self.category_names[self._category[row]],
+            "rating": float(self._rating[row]),
+            "reviews": int(reviews) if float(reviews).is_integer() else float(reviews),
+            "tags": list(self.tags[row])
+        }
+
+    def products(self, rows):
+        """Build dict views for the given rows, in order"""
+        return [self.product(int(row)) for row in rows]
+
+    def get(self, product_id):
+        """Return the dict view for a product id, or None"""
+        row = self.row_of(product_id)
+        return None if row is None else self.product(row)
+
+    def category_of(self, row):
+        return self.category_names[self._category[row]]
+
+    def live_rows(self):
+        """Row numbers of all live products, in insertion order"""
+        return np.flatnonzero(self.alive)
+
+    def to_list(self):
+        """Dict views of the whole catalog, in insertion order"""
+        return self.products(self.live_rows())
+
+    def candidate_mask(self, exclude_ids=()):
+        """Boolean mask of live rows whose id is not in ``exclude_ids``"""
+        mask = self.alive.copy()
+        rows = self.rows_of(exclude_ids)
+        if rows:
+            mask[rows] = False
+        return mask
+
+    def categories(self):
+        """Set of categories that have at least one live product"""
+        return {
+            name for name, live in zip(self.category_names, self._category_live)
+            if live > 0
+        }
+
+    def next_numeric_id(self):
+        """Next free numeric product id.
+
+        Never reuses an id, even after the highest one is deleted.
+        """
+        return self.max_numeric + 1
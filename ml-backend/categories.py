@@ -0,0 +1,103 @@
+import numpy as np
+
+from sortedlist import SortedKeyList
+
+
+class CategoryIndex:
+    """Per-category rankings of catalog rows by rating x reviews.
+
+    Each category keeps its rows as ``(-quality, row)`` keys, so the best
+    product comes first and ties fall back to catalog order. The names of
+    the non-empty categories are kept alongside, in catalog order, as a
+    tuple that is replaced rather than changed, so readers can use it
+    while adds and deletes go on.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.rankings = {}     # category code -> SortedKeyList
+        self.entries = {}      # row -> (category code, key)
+        self.names = ()        # categories with at least one live row
+        self.version = None
+
+    @classmethod
+    def build(cls, catalog):
+        index = cls(catalog)
+        index.rebuild()
+        return index
+
+    def is_current(self, catalog):
+        return self.catalog is catalog and self.version == catalog.version
+
+    def rebuild(self):
+        """Group and rank every live row with one lexsort"""
+        catalog = self.catalog
+        rows = catalog.live_rows()
+        quality = (catalog.rating * catalog.reviews)[rows]
+        codes = catalog.category[rows]
+        order = np.lexsort((rows, -quality, codes))
+        rows, quality, codes = rows[order].tolist(), quality[order].tolist(), codes[order].tolist()
+
+        self.rankings = {}
+        self.entries = {}
+        start = 0
+        for end in range(1, len(rows) + 1):
+            if end == len(rows) or codes[end] != codes[start]:
+                keys = [(-quality[i], rows[i]) for i in range(start, end)]
+                self.rankings[codes[start]] = SortedKeyList(keys)
+                for key in keys:
+                    self.entries[key[1]] = (codes[start], key)
+                start = end
+        self._update_names()
+        self.version = catalog.version
+
+    def _update_names(self):
+        names = self.catalog.category_names
+        self.names = tuple(names[code] for code in sorted(self.rankings))
+
+    def _discard(self, row):
+        entry = self.entries.pop(row, None)
+        if entry is None:
+            return
+        code, key = entry
+        ranking = self.rankings[code]
+        ranking.remove(key)
+        if not len(ranking):
+            del self.rankings[code]
+            self._update_names()
+
+    def on_add(self, row):
+        """Insert or re-rank ``row`` after ``catalog.add``"""
+        catalog = self.catalog
+        self._discard(row)
+        code = int(catalog.category[row])
+        key = (-float(catalog.rating[row] * catalog.reviews[row]), row)
+        if code not in self.rankings:
+            self.rankings[code] = SortedKeyList()
+            self._update_names()
+        self.rankings[code].add(key)
+        self.entries[row] = (code, key)
+        self.version = catalog.version
+
+    def on_remove(self, row):
+        self._discard(row)
+        self.version = self.catalog.version
+
+    def categories(self):
+        """Tuple of the categories that currently have products, in catalog order"""
+        return self.names
+
+    def best(self, category, n, exclude_rows=()):
+        """Top ``n`` rows of a category by rating x reviews, skipping ``exclude_rows``"""
+        code = self.catalog.category_codes.get(category)
+        ranking = self.rankings.get(code)
+        results = []
+        if ranking is None or n <= 0:
+            return results
+        for _, row in ranking:
+            if row in exclude_rows:
+                continue
+            results.append(row)
+            if len(results) >= n:
+                break
+        return results
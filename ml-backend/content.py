@@ -0,0 +1,220 @@
+import numpy as np
+
+from logs import get_logger
+
+log = get_logger("content")
+
+# Handle scikit-learn/scipy import with a fallback to tag-only similarity
+try:
+    import scipy.sparse as sp
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.preprocessing import normalize
+    SKLEARN_AVAILABLE = True
+except ImportError:
+    SKLEARN_AVAILABLE = False
+    log.warning("⚠️ Warning: 'scikit-learn' not available. Content similarity is disabled.")
+
+# Vocabulary cap: the most frequent terms across the catalog are kept
+DEFAULT_MAX_FEATURES = 50000
+
+# Once this many terms were added since the vocabulary was fitted, and more
+# than this share of them were outside it, the index asks for a refit
+REFIT_MIN_TERMS = 1000
+REFIT_UNKNOWN_SHARE = 0.2
+
+# Tokens of two or more letters/digits, lowercased, English stop words dropped
+_VECTORIZER_OPTIONS = {
+    "lowercase": True,
+    "stop_words": "english",
+    "token_pattern": r"(?u)\b\w\w+\b",
+    "dtype": np.float32,
+}
+
+
+def product_text(catalog, row):
+    return f"{catalog.names[row]} {catalog.descriptions[row]}"
+
+
+class ContentIndex:
+    """Sparse TF-IDF vectors of product names and descriptions.
+
+    Row ``r`` of ``matrix`` is the L2-normalized, sublinear TF-IDF vector
+    of catalog row ``r`` (float32, empty for tombstones), so the cosine
+    similarity of two products is a sparse dot product. The vocabulary and
+    IDF weights are fitted when the index is built, at sync time; adds and
+    deletes are vectorized against them and patched in without a refit,
+    a batch of rows at a time. Terms outside the vocabulary are ignored
+    until the next build; ``needs_refit`` tells when so much added text
+    was unknown that the next sync should rebuild instead.
+    """
+
+    def __init__(self, catalog, max_features=DEFAULT_MAX_FEATURES):
+        self.catalog = catalog
+        self.max_features = max_features
+        self.terms = []
+        self.idf = np.empty(0, dtype=np.float32)
+        self.matrix = None
+        self.version = None
+        self.added_terms = 0      # terms of products added since the fit
+        self.unknown_terms = 0    # ... that are not in the vocabulary
+        self._vectorizer = None
+        self._analyze = None
+        self._vocabulary = {}
+
+    @classmethod
+    def build(cls, catalog, max_features=DEFAULT_MAX_FEATURES):
+        """Fit the vocabulary and vectorize every live product"""
+        index = cls(catalog, max_features)
+        index.rebuild()
+        return index
+
+    @classmethod
+    def from_arrays(cls, catalog, terms, idf, data, indices, indptr):
+        """Adopt a previously built vocabulary and matrix (e.g. from a snapshot)"""
+        index = cls(catalog, len(terms))
+        if SKLEARN_AVAILABLE:
+            index._fit(terms, idf)
+            index.matrix = sp.csr_matrix((data, indices, indptr), shape=(len(indptr) - 1, len(terms)))
+            index.version = catalog.version
+        return index
+
+    def is_current(self, catalog):
+        """True if the vectors reflect exactly this catalog state"""
+        return self.catalog is catalog and self.version == catalog.version
+
+    def _fit(self, terms, idf):
+        self.terms = list(terms)
+        self.idf = np.asarray(idf, dtype=np.float32)
+        self._vectorizer = CountVectorizer(vocabulary=self.terms, **_VECTORIZER_OPTIONS)
+        self._analyze = self._vectorizer.build_analyzer()
+        self._vocabulary = {term: column for column, term in enumerate(self.terms)}
+        self.added_terms = self.unknown_terms = 0
+
+    def _weigh(self, counts):
+        """Raw term counts -> L2-normalized sublinear TF-IDF, in place"""
+        counts = counts.tocsr()
+        np.log1p(counts.data, out=counts.data)
+        counts.data *= self.idf[counts.indices]
+        return normalize(counts, copy=False)
+
+    def rebuild(self):
+        if not SKLEARN_AVAILABLE:
+            return
+        catalog = self.catalog
+        texts = [product_text(catalog, row) if alive else "" for row, alive in enumerate(catalog.alive.tolist())]
+        vectorizer = CountVectorizer(max_features=self.max_features, **_VECTORIZER_OPTIONS)
+        try:
+            counts = vectorizer.fit_transform(texts)
+        except ValueError:
+            # No terms at all (empty catalog or only stop words)
+            self._fit([], [])
+            self.matrix = sp.csr_matrix((catalog.size, 0), dtype=np.float32)
+            self.version = catalog.version
+            return
+
+        # Smoothed IDF over live products, as in scikit-learn's TfidfTransformer
+        live = len(catalog)
+        df = np.bincount(counts.indices, minlength=counts.shape[1])
+        idf = np.log((1 + live) / (1 + df)) + 1
+        self._fit(vectorizer.get_feature_names_out(), idf)
+        self.matrix = self._weigh(counts)
+        self.version = catalog.version
+
+    def vectorize(self, texts):
+        """TF-IDF vectors of arbitrary texts against the fitted vocabulary"""
+        return self._weigh(self._vectorizer.transform(texts))
+
+    def needs_refit(self):
+        """True once enough added text fell outside the vocabulary to warrant a rebuild"""
+        return self.added_terms >= REFIT_MIN_TERMS and self.unknown_terms > REFIT_UNKNOWN_SHARE * self.added_terms
+
+    def _count(self, texts):
+        """Term counts of added texts against the vocabulary, tallying unknown terms"""
+        columns = []
+        indptr = [0]
+        for text in texts:
+            terms = self._analyze(text)
+            known = [self._vocabulary[term] for term in terms if term in self._vocabulary]
+            self.added_terms += len(terms)
+            self.unknown_terms += len(terms) - len(known)
+            columns.extend(known)
+            indptr.append(len(columns))
+        counts = sp.csr_matrix(
+            (np.ones(len(columns), dtype=np.float32), np.array(columns, dtype=np.int32), np.array(indptr)),
+            shape=(len(texts), len(self.terms))
+        )
+        counts.sum_duplicates()
+        return counts
+
+    def _set_rows(self, rows, vectors):
+        """Replace ``rows`` of the matrix with those of ``vectors``, growing it to the catalog size.
+
+        One pass over the matrix for the whole batch; a row given twice
+        keeps its last vector. Builds new arrays and swaps ``matrix`` in one
+        assignment, so concurrent readers see either the old matrix or the
+        new one.
+        """
+        matrix = self.matrix
+        size = max(self.catalog.size, matrix.shape[0])
+        rows = np.asarray(rows, dtype=np.intp)
+        last = len(rows) - 1 - np.unique(rows[::-1], return_index=True)[1]
+        rows, vectors = rows[last], vectors[last]
+
+        lengths = np.diff(matrix.indptr)
+        kept = np.ones(matrix.shape[0], dtype=bool)
+        kept[rows[rows < matrix.shape[0]]] = False
+        entries = np.repeat(kept, lengths)
+        kept_lengths = np.zeros(size, dtype=np.int64)
+        kept_lengths[:matrix.shape[0]] = np.where(kept, lengths, 0)
+        base = sp.csr_matrix(
+            (matrix.data[entries], matrix.indices[entries], np.concatenate([[0], np.cumsum(kept_lengths)])),
+            shape=(size, matrix.shape[1])
+        )
+        placement = sp.csr_matrix(
+            (np.ones(len(rows), dtype=np.float32), (rows, np.arange(len(rows)))), shape=(size, len(rows))
+        )
+        patched = (base + placement @ vectors).tocsr()
+        # Sorted like a fresh build, so dot products sum in the same order
+        patched.sort_indices()
+        self.matrix = patched
+
+    def on_add_rows(self, rows):
+        """Vectorize products after ``catalog.add`` inserted or replaced ``rows``"""
+        if self.matrix is None or not len(rows):
+            return
+        counts = self._count([product_text(self.catalog, row) for row in rows])
+        self._set_rows(rows, self._weigh(counts) if self.terms else counts)
+        self.version = self.catalog.version
+
+    def on_remove_rows(self, rows):
+        """Drop products' vectors after ``catalog.remove`` tombstoned ``rows``"""
+        if self.matrix is None or not len(rows):
+            return
+        self._set_rows(rows, sp.csr_matrix((len(rows), len(self.terms)), dtype=np.float32))
+        self.version = self.catalog.version
+
+    def on_add(self, row):
+        self.on_add_rows([row])
+
+    def on_remove(self, row):
+        self.on_remove_rows([row])
+
+    def cosine(self, rows, candidate_rows):
+        """Cosine similarity of ``rows`` to ``candidate_rows``, as a dense array.
+
+        One sparse product of the whole matrix with the few query vectors;
+        returns shape (len(rows), len(candidate_rows)).
+        """
+        matrix = self.matrix
+        queries = matrix[np.asarray(rows, dtype=np.intp)].T
+        candidate_rows = np.asarray(candidate_rows, dtype=np.intp)
+        if 2 * len(candidate_rows) < matrix.shape[0]:
+            # Few candidates: slicing them out is cheaper than scoring everything
+            return (matrix[candidate_rows] @ queries).toarray().T.astype(np.float64)
+        return (matrix @ queries).toarray()[candidate_rows].T.astype(np.float64)
+
+    def memory_bytes(self):
+        """Bytes held by the sparse matrix and IDF weights"""
+        if self.matrix is None:
+            return 0
+        return self.matrix.data.nbytes + self.matrix.indices.nbytes + self.matrix.indptr.nbytes + self.idf.nbytes
@@ -0,0 +1,264 @@
+import heapq
+import math
+import threading
+import time
+
+import numpy as np
+
+# Pairs kept before the lowest-weight ones are pruned
+DEFAULT_MAX_PAIRS = 1000000
+
+# Pruning keeps this fraction of the cap, so it does not run on every update
+PRUNE_TO = 0.9
+
+# Co-purchase weight halves over this many seconds
+DEFAULT_HALF_LIFE = 30 * 24 * 3600
+
+# Only the first products of a very large basket form pairs
+MAX_BASKET = 50
+
+# Partners kept per product; a product past twice this many drops its
+# lightest pairs, which bounds both memory and query time for bestsellers
+MAX_PARTNERS = 500
+
+# Best partners cached per product for queries
+PER_ITEM = 32
+
+# Rescale stored weights before the inflation factor gets this large
+_MAX_LOG_SCALE = 50.0
+
+NORMALIZATIONS = ("cosine", "lift")
+
+
+class CoPurchaseIndex:
+    """Item-item co-purchase counts: "customers who bought this also bought".
+
+    Fed with basket changes, ``(previous ids, current ids)`` per user: each
+    newly bought product counts once, and once more with every other product
+    in the basket. Weights decay exponentially with ``half_life``. Instead of
+    touching every weight as time passes, new weights are added inflated by
+    ``exp(t / tau)``; scores are ratios of weights, so the common factor
+    cancels out and stored weights are only rescaled now and then to stay in
+    range.
+
+    Pairs are kept symmetrically in a dict of dicts keyed by dense item
+    numbers. When there are more than ``max_pairs`` pairs, the lowest-weight
+    ones are pruned, and so are the lightest partners of any product with
+    more than ``2 * MAX_PARTNERS``. Queries merge per-product lists of the
+    best ``PER_ITEM`` partners, which are cached and dropped when that
+    product's pairs or purchase count change, or the purchase count of a
+    partner on the list; ``version`` tells callers when that happened.
+    Lift's basket total scales every score alike, so it is applied when
+    lists are read rather than baked into them.
+    """
+
+    def __init__(self, max_pairs=DEFAULT_MAX_PAIRS, half_life=DEFAULT_HALF_LIFE, normalization="cosine",
+                 clock=time.time):
+        if normalization not in NORMALIZATIONS:
+            raise ValueError(f"normalization must be one of {NORMALIZATIONS}")
+        self.max_pairs = max_pairs
+        self.half_life = half_life
+        self.normalization = normalization
+        self.clock = clock
+        self.baskets = 0
+        self.pruned = 0
+
+        self._numbers = {}      # product id -> item number
+        self._ids = []          # item number -> product id
+        self._counts = np.zeros(1024)   # item number -> decayed purchase weight
+        self._pairs = {}        # item number -> {item number -> decayed pair weight}
+        self._pair_count = 0
+        self._total = 0.0       # decayed basket weight, for lift
+        self._origin = clock()
+        self._top = {}          # item number -> [(score, partner)], best first
+        self._cited = {}        # item number -> items whose cached list holds it
+        self._drops = 0
+        self._dropped = {}      # item number -> value of _drops when its list was last dropped
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._pair_count
+
+    def _number(self, product_id):
+        number = self._numbers.get(product_id)
+        if number is None:
+            number = len(self._ids)
+            self._numbers[product_id] = number
+            self._ids.append(product_id)
+            if number >= len(self._counts):
+                self._counts = np.concatenate([self._counts, np.zeros(len(self._counts))])
+        return number
+
+    def _weight(self):
+        """The inflated weight of one event happening now"""
+        if self.half_life is None:
+            return 1.0
+        log_scale = (self.clock() - self._origin) * math.log(2) / self.half_life
+        if log_scale > _MAX_LOG_SCALE:
+            self._rescale(math.exp(-log_scale))
+            return 1.0
+        return math.exp(log_scale)
+
+    def _rescale(self, factor):
+        """Multiply every stored weight by ``factor`` and move the origin to now"""
+        self._counts *= factor
+        for partners in self._pairs.values():
+            for partner in partners:
+                partners[partner] *= factor
+        self._total *= factor
+        self._origin = self.clock()
+
+    def update(self, baskets):
+        """Count the products that ``(previous, current)`` basket changes added"""
+        changed = False
+        with self._lock:
+            for previous, current in baskets:
+                current = list(dict.fromkeys(current))[:MAX_BASKET]
+                previous = set(previous)
+                added = [product_id for product_id in current if product_id not in previous]
+                if not added:
+                    continue
+                weight = self._weight()
+                members = [self._number(product_id) for product_id in current]
+                new = set(self._number(product_id) for product_id in added)
+                self._total += weight
+                self.baskets += 1
+                for a in new:
+                    self._counts[a] += weight
+                    self._drop_top(a)
+                    # Lists holding ``a`` were normalized by its old count
+                    for holder in self._cited.pop(a, ()):
+                        self._drop_top(holder)
+                    for b in members:
+                        # A pair of two new products is counted once, from its smaller end
+                        if b == a or (b in new and b < a):
+                            continue
+                        self._add_pair(a, b, weight)
+                        self._drop_top(b)
+                changed = True
+            if self._pair_count > self.max_pairs:
+                self._prune(int(self.max_pairs * PRUNE_TO))
+        return changed
+
+    def _add_pair(self, a, b, weight):
+        partners = self._pairs.setdefault(a, {})
+        if b not in partners:
+            self._pair_count += 1
+            partners[b] = 0.0
+            self._pairs.setdefault(b, {})[a] = 0.0
+        partners[b] += weight
+        self._pairs[b][a] += weight
+        for item in (a, b):
+            if len(self._pairs.get(item, ())) > 2 * MAX_PARTNERS:
+                self._trim(item)
+
+    def _trim(self, item):
+        """Keep only the ``MAX_PARTNERS`` heaviest partners of ``item``"""
+        partners = self._pairs[item]
+        numbers = np.fromiter(partners.keys(), dtype=np.int64, count=len(partners))
+        weights = np.fromiter(partners.values(), dtype=np.float64, count=len(partners))
+        drop = numbers[np.argpartition(weights, len(weights) - MAX_PARTNERS)[:len(weights) - MAX_PARTNERS]]
+        for partner in drop.tolist():
+            del partners[partner]
+            others = self._pairs[partner]
+            del others[item]
+            if not others:
+                del self._pairs[partner]
+            self._drop_top(partner)
+        self._drop_top(item)
+        self._pair_count -= len(drop)
+        self.pruned += len(drop)
+
+    def _prune(self, keep):
+        """Drop all but the ``keep`` heaviest pairs"""
+        a = []
+        b = []
+        weights = []
+        for item, partners in self._pairs.items():
+            for partner, weight in partners.items():
+                if item < partner:
+                    a.append(item)
+                    b.append(partner)
+                    weights.append(weight)
+        weights = np.array(weights)
+        if len(weights) <= keep:
+            return
+        drop = np.argpartition(weights, len(weights) - keep)[:len(weights) - keep]
+        touched = set()
+        for i in drop.tolist():
+            item, partner = a[i], b[i]
+            del self._pairs[item][partner]
+            del self._pairs[partner][item]
+            touched.update((item, partner))
+        for item in touched:
+            self._drop_top(item)
+            if not self._pairs[item]:
+                del self._pairs[item]
+        self._pair_count -= len(drop)
+        self.pruned += len(drop)
+
+    def _drop_top(self, item):
+        top = self._top.pop(item, None)
+        for _, partner in top or ():
+            holders = self._cited.get(partner)
+            if holders is not None:
+                holders.discard(item)
+                if not holders:
+                    del self._cited[partner]
+        self._drops += 1
+        self._dropped[item] = self._drops
+
+    def version(self, product_ids):
+        """A number that grows whenever ``top`` for ``product_ids`` may have changed"""
+        with self._lock:
+            return max((self._dropped.get(self._numbers.get(product_id), 0) for product_id in product_ids), default=0)
+
+    def _partners(self, a):
+        top = self._top.get(a)
+        if top is None:
+            partners = self._pairs.get(a, {})
+            numbers = np.fromiter(partners.keys(), dtype=np.int64, count=len(partners))
+            weights = np.fromiter(partners.values(), dtype=np.float64, count=len(partners))
+            counts = self._counts[numbers] * self._counts[a]
+            if self.normalization == "lift":
+                scores = weights / counts   # times the basket total, in top()
+            else:
+                scores = weights / np.sqrt(counts)
+            # Best first, ties to the earlier-seen product
+            order = np.lexsort((numbers, -scores))[:PER_ITEM]
+            top = list(zip(scores[order].tolist(), numbers[order].tolist()))
+            self._top[a] = top
+            for _, partner in top:
+                self._cited.setdefault(partner, set()).add(a)
+        return top
+
+    def top(self, product_ids, k, exclude_ids=()):
+        """Up to ``k`` ``(product id, score)`` pairs most bought with ``product_ids``.
+
+        A candidate's score is the sum of its normalized co-purchase weight
+        with each product in the cart; ties go to the earlier-seen product.
+        """
+        with self._lock:
+            scores = {}
+            for product_id in product_ids:
+                a = self._numbers.get(product_id)
+                if a is None:
+                    continue
+                for score, b in self._partners(a):
+                    scores[b] = scores.get(b, 0.0) + score
+            exclude = set(exclude_ids) | set(product_ids)
+            ranked = heapq.nlargest(
+                k + len(exclude), scores.items(), key=lambda item: (item[1], -item[0])
+            )
+            scale = self._total if self.normalization == "lift" else 1.0
+            return [(self._ids[b], score * scale) for b, score in ranked if self._ids[b] not in exclude][:k]
+
+    def stats(self):
+        return {
+            "products": len(self._ids),
+            "pairs": self._pair_count,
+            "baskets": self.baskets,
+            "pruned": self.pruned,
+            "max_pairs": self.max_pairs,
+            "normalization": self.normalization
+        }
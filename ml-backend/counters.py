@@ -0,0 +1,345 @@
+import json
+import os
+import sqlite3
+import threading
+from collections import Counter, defaultdict, deque
+
+from logs import get_logger
+
+log = get_logger("counters")
+
+# How often buffered increments are applied (seconds)
+DEFAULT_FLUSH_INTERVAL = 0.5
+
+# Events buffered between flushes; beyond this new events are dropped
+DEFAULT_MAX_PENDING = 100000
+
+# A buffer this full wakes the flusher early
+HIGH_WATER = 0.5
+
+# Users whose purchase lists are kept in memory; the least recently active
+# are forgotten past this
+DEFAULT_MAX_USERS = 100000
+
+# Most recent purchases kept per user
+DEFAULT_MAX_HISTORY = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS counters (
+    kind TEXT NOT NULL,
+    product_id TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    PRIMARY KEY (kind, product_id)
+);
+CREATE INDEX IF NOT EXISTS counters_seq ON counters (seq);
+CREATE TABLE IF NOT EXISTS user_purchases (
+    user_id TEXT PRIMARY KEY,
+    product_ids TEXT NOT NULL,
+    seq INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS user_purchases_seq ON user_purchases (seq);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('seq', 0);
+"""
+
+
+class CounterStore:
+    """View/purchase counters and per-user purchase lists.
+
+    Request handlers only append events to a deque (atomic in CPython, no
+    lock). A flusher applies them in batches, off the request path. The
+    buffer holds about ``max_pending`` events: past half full the flusher is
+    woken early, and when full, new events are refused and counted in
+    ``dropped``.
+
+    - With ``path`` set, batches are added to a SQLite file that every
+      worker process on the box shares. Each worker then reads back the
+      totals that changed since its last flush, its own and other
+      workers', so all workers converge on the same numbers.
+    - With ``path`` None, counts stay in this process.
+
+    ``views``, ``purchases`` and ``user_purchases`` are the local read model,
+    replaced only by the flusher. ``user_purchases`` keeps the last
+    ``max_history`` purchases of the ``max_users`` most recently active
+    users. ``on_change(product_ids)`` is called after each flush with the
+    products whose totals moved, ``on_baskets(changes)`` with a
+    ``(previous, current)`` pair of purchase lists for every user whose list
+    changed, in any worker, and ``on_events(views, purchases, user_ids,
+    historical)`` with the increments themselves.
+    """
+
+    def __init__(self, path=None, flush_interval=DEFAULT_FLUSH_INTERVAL, on_change=None, on_baskets=None,
+                 max_pending=DEFAULT_MAX_PENDING, on_events=None, max_users=DEFAULT_MAX_USERS,
+                 max_history=DEFAULT_MAX_HISTORY):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_users = max_users
+        self.max_history = max_history
+        self.on_change = on_change
+        self.on_baskets = on_baskets
+        self.on_events = on_events
+
+        self.views = defaultdict(int)       # product_id -> view_count
+        self.purchases = defaultdict(int)   # product_id -> purchase_count
+        self.user_purchases = {}            # user_id -> [product_ids]
+
+        self.events_applied = 0
+        self.flushes = 0
+        self.dropped = 0
+        self.users_evicted = 0
+
+        self._pending = deque()
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread = None
+        self._db = None
+        self._db_pid = None
+        self._last_seq = 0
+
+    def _room(self, count):
+        """How many of ``count`` new events fit in the buffer; the rest are dropped"""
+        pending = len(self._pending)
+        room = min(count, max(self.max_pending - pending, 0))
+        if room < count:
+            self.dropped += count - room
+        if pending + room > self.max_pending * HIGH_WATER:
+            self._wake.set()
+        return room
+
+    def record_view(self, product_id):
+        """Buffer one product view. Returns False if the buffer is full"""
+        if not self._room(1):
+            return False
+        self._pending.append(("view", product_id))
+        return True
+
+    def record_purchases(self, user_id, product_ids):
+        """Replace a user's purchase list and count one purchase per product.
+
+        All or nothing: returns False, buffering nothing, if it does not fit.
+        """
+        product_ids = list(product_ids)
+        events = [("user", str(user_id), product_ids)] + [("purchase", product_id) for product_id in product_ids]
+        room = self._room(len(events))
+        if room < len(events):
+            self.dropped += room  # refused too, though they would have fit
+            return False
+        self._pending.extend(events)
+        return True
+
+    def record_events(self, events):
+        """Buffer many events, in order, as far as they fit. Returns how many were taken.
+
+        Events are ``("view", product_id)``, ``("purchase", product_id)``, or
+        ``("purchase", product_id, user_id)`` to also add the product to that
+        user's purchase list.
+        """
+        room = self._room(len(events))
+        self._pending.extend(events[:room] if room < len(events) else events)
+        return room
+
+    def _drain(self):
+        views = Counter()
+        purchases = Counter()
+        users = {}
+        appended = set()    # users whose lists only grew, from a list not in memory
+        drained = 0
+        while True:
+            try:
+                event = self._pending.popleft()
+            except IndexError:
+                break
+            drained += 1
+            if event[0] == "view":
+                views[event[1]] += 1
+            elif event[0] == "purchase":
+                purchases[event[1]] += 1
+                if len(event) > 2:
+                    current = users.get(event[2])
+                    if current is None:
+                        current = self.user_purchases.get(event[2])
+                        if current is None:
+                            current = []
+                            appended.add(event[2])
+                    if event[1] not in current:
+                        users[event[2]] = current + [event[1]]
+            else:
+                users[event[1]] = event[2]
+                appended.discard(event[1])
+        return views, purchases, users, appended, drained
+
+    def _connection(self):
+        # Connections must not cross a fork, so each worker opens its own
+        if self._db is None or self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.executescript(_SCHEMA)
+            self._db_pid = os.getpid()
+            self._last_seq = 0
+        return self._db
+
+    def _apply_shared(self, views, purchases, users, appended, baskets):
+        """Write a batch to the shared file and read back everything new.
+
+        Returns the changed product ids and the increments read back, from
+        every worker. On the first read, everything but this batch counts
+        as history.
+        """
+        db = self._connection()
+        if views or purchases or users:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for user_id in appended & set(users):
+                    # Forgotten locally, but the file still has the full list
+                    row = db.execute("SELECT product_ids FROM user_purchases WHERE user_id = ?", (user_id,)).fetchone()
+                    if row is not None:
+                        stored = json.loads(row[0])
+                        added = [product_id for product_id in users[user_id] if product_id not in stored]
+                        users[user_id] = (stored + added)[-self.max_history:]
+                seq = db.execute("UPDATE meta SET value = value + 1 WHERE key = 'seq' RETURNING value").fetchone()[0]
+                db.executemany(
+                    "INSERT INTO counters (kind, product_id, count, seq) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (kind, product_id) DO UPDATE SET count = count + excluded.count, seq = excluded.seq",
+                    [("view", key, count, seq) for key, count in views.items()] +
+                    [("purchase", key, count, seq) for key, count in purchases.items()]
+                )
+                db.executemany(
+                    "INSERT INTO user_purchases (user_id, product_ids, seq) VALUES (?, ?, ?) "
+                    "ON CONFLICT (user_id) DO UPDATE SET product_ids = excluded.product_ids, seq = excluded.seq",
+                    [(user_id, json.dumps(ids), seq) for user_id, ids in users.items()]
+                )
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+        last_seq = self._last_seq
+        # Both reads in one transaction see the same snapshot; read apart, a
+        # batch committed between them could raise _last_seq past counter
+        # rows the first read never saw
+        db.execute("BEGIN")
+        try:
+            counter_rows = db.execute(
+                "SELECT kind, product_id, count, seq FROM counters WHERE seq > ?", (last_seq,)).fetchall()
+            user_rows = db.execute(
+                "SELECT user_id, product_ids, seq FROM user_purchases WHERE seq > ?", (last_seq,)).fetchall()
+        finally:
+            db.execute("COMMIT")
+        increments = {"view": Counter(), "purchase": Counter()}
+        for kind, product_id, count, seq in counter_rows:
+            totals = self.views if kind == "view" else self.purchases
+            increments[kind][product_id] = count - totals.get(product_id, 0)
+            totals[product_id] = count
+            self._last_seq = max(self._last_seq, seq)
+        user_ids = []
+        for user_id, product_ids, seq in user_rows:
+            self._set_user(user_id, json.loads(product_ids), baskets)
+            user_ids.append(user_id)
+            self._last_seq = max(self._last_seq, seq)
+        changed = set(increments["view"]) | set(increments["purchase"])
+        if last_seq == 0:
+            history = (
+                increments["view"] - views, increments["purchase"] - purchases,
+                [user_id for user_id in user_ids if user_id not in users], True
+            )
+            return changed, [history, (views, purchases, list(users), False)]
+        return changed, [(increments["view"], increments["purchase"], user_ids, False)]
+
+    def _apply_local(self, views, purchases, users, baskets):
+        for key, count in views.items():
+            self.views[key] += count
+        for key, count in purchases.items():
+            self.purchases[key] += count
+        for user_id, product_ids in users.items():
+            self._set_user(user_id, product_ids, baskets)
+        return set(views) | set(purchases), [(views, purchases, list(users), False)]
+
+    def _set_user(self, user_id, product_ids, baskets):
+        product_ids = product_ids[-self.max_history:]
+        # Re-inserting keeps the dict in least to most recently active order
+        previous = self.user_purchases.pop(user_id, [])
+        if previous != product_ids:
+            baskets.append((previous, product_ids))
+        self.user_purchases[user_id] = product_ids
+        while len(self.user_purchases) > self.max_users:
+            del self.user_purchases[next(iter(self.user_purchases))]
+            self.users_evicted += 1
+
+    def flush(self):
+        """Apply buffered events now. Returns the product ids whose totals changed"""
+        baskets = []
+        with self._flush_lock:
+            views, purchases, users, appended, drained = self._drain()
+            if self.path:
+                changed, events = self._apply_shared(views, purchases, users, appended, baskets)
+            else:
+                changed, events = self._apply_local(views, purchases, users, baskets)
+            self.events_applied += drained
+            self.flushes += 1
+        if changed and self.on_change is not None:
+            self.on_change(changed)
+        if baskets and self.on_baskets is not None:
+            self.on_baskets(baskets)
+        if self.on_events is not None:
+            for batch in events:
+                if batch[0] or batch[1] or batch[2]:
+                    self.on_events(*batch)
+        return changed
+
+    def snapshot(self):
+        """Consistent copies of the read model: ``(views, purchases, user_purchases)``"""
+        with self._flush_lock:
+            return dict(self.views), dict(self.purchases), dict(self.user_purchases)
+
+    def restore(self, views, purchases, user_purchases):
+        """Seed the local read model from a snapshot.
+
+        Ignored with a shared file, which already keeps the totals.
+        Restored purchase lists reach ``on_baskets`` as new baskets, and the
+        totals reach ``on_events`` as history.
+        """
+        if self.path:
+            return
+        baskets = []
+        with self._flush_lock:
+            self.views.update(views)
+            self.purchases.update(purchases)
+            for user_id, product_ids in user_purchases.items():
+                self._set_user(user_id, product_ids, baskets)
+        if baskets and self.on_baskets is not None:
+            self.on_baskets(baskets)
+        if self.on_events is not None:
+            self.on_events(views, purchases, list(user_purchases), True)
+
+    def start(self):
+        """Flush on a daemon thread every ``flush_interval`` seconds"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="counter-flush", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.flush()
+
+    def _run(self):
+        while True:
+            # Every flush_interval, or sooner once the buffer passes the high-water mark
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                log.exception("❌ Counter flush failed: %s", e)
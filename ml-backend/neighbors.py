@@ -0,0 +1,184 @@
+import numpy as np
+
+from similarity import MAX_BLOCK_CELLS, similarity_matrix, top_k, top_similar
+
+# Neighbours kept per product. Larger than the 2 used per cart item so a
+# lookup still has enough entries after the cart's own ids are excluded.
+DEFAULT_K = 16
+
+# Minimum similarity for a product to count as a neighbour
+DEFAULT_THRESHOLD = 0.3
+
+
+class NeighborIndex:
+    """Persistent top-K item-to-item similarity table over a ProductCatalog.
+
+    Row ``r`` of ``neighbors`` holds the catalog rows most similar to row
+    ``r`` (best first, ties in catalog order) and ``scores`` their
+    similarities; unused slots are -1 / -inf. The table is built once per
+    catalog and then patched on single adds and deletes; until it has been
+    built, patches are ignored and it is never current. ``content`` is the
+    ContentIndex whose text cosine is part of the similarity, if any; it
+    must be patched before this table.
+    """
+
+    def __init__(self, catalog, k=DEFAULT_K, threshold=DEFAULT_THRESHOLD, content=None):
+        self.catalog = catalog
+        self.k = k
+        self.threshold = threshold
+        self.content = content
+        self.neighbors = np.full((0, k), -1, dtype=np.int64)
+        self.scores = np.full((0, k), -np.inf, dtype=np.float64)
+        self.version = None
+
+    @classmethod
+    def build(cls, catalog, k=DEFAULT_K, threshold=DEFAULT_THRESHOLD, content=None):
+        """Build the full table for a catalog"""
+        index = cls(catalog, k, threshold, content)
+        index.rebuild()
+        return index
+
+    @classmethod
+    def from_arrays(cls, catalog, neighbors, scores, threshold=DEFAULT_THRESHOLD, content=None):
+        """Adopt a previously built table (e.g. from a snapshot) for ``catalog``"""
+        index = cls(catalog, neighbors.shape[1], threshold, content)
+        index.neighbors = neighbors
+        index.scores = scores
+        index.version = catalog.version
+        return index
+
+    def is_current(self, catalog):
+        """True if the table reflects exactly this catalog state"""
+        return self.catalog is catalog and self.version == catalog.version
+
+    def _ensure_capacity(self):
+        size = self.catalog.size
+        if size <= len(self.neighbors):
+            return
+        extra = max(size, 2 * len(self.neighbors)) - len(self.neighbors)
+        self.neighbors = np.vstack([self.neighbors, np.full((extra, self.k), -1, dtype=np.int64)])
+        self.scores = np.vstack([self.scores, np.full((extra, self.k), -np.inf)])
+
+    def _scores_against_live(self, rows, live_rows):
+        """Similarity of ``rows`` to every live row, below-threshold and self masked"""
+        scores = similarity_matrix(self.catalog, rows, live_rows, self.content)
+        scores[scores <= self.threshold] = -np.inf
+        positions = np.searchsorted(live_rows, rows)
+        found = (positions < len(live_rows)) & (live_rows[np.minimum(positions, len(live_rows) - 1)] == rows)
+        scores[np.flatnonzero(found), positions[found]] = -np.inf
+        return scores
+
+    def refresh_rows(self, rows):
+        """Recompute the neighbour lists of the given rows from scratch"""
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(rows):
+            return
+        self._ensure_capacity()
+        live_rows = self.catalog.live_rows()
+        block = max(1, MAX_BLOCK_CELLS // max(len(live_rows), 1))
+        for start in range(0, len(rows), block):
+            chunk = rows[start:start + block]
+            scores = self._scores_against_live(chunk, live_rows)
+            for row, row_scores, columns in zip(chunk, scores, top_k(scores, self.k)):
+                self.neighbors[row] = -1
+                self.scores[row] = -np.inf
+                self.neighbors[row, :len(columns)] = live_rows[columns]
+                self.scores[row, :len(columns)] = row_scores[columns]
+
+    def rebuild(self):
+        """Full O(n^2) build, done block by block.
+
+        Stamped with the catalog version it started from, so a build that a
+        catalog change overlapped is not current.
+        """
+        version = self.catalog.version
+        self.neighbors = np.full((self.catalog.size, self.k), -1, dtype=np.int64)
+        self.scores = np.full((self.catalog.size, self.k), -np.inf)
+        self.refresh_rows(self.catalog.live_rows())
+        self.version = version
+
+    def _holders_of(self, row):
+        """Rows whose neighbour list contains ``row``"""
+        return np.flatnonzero((self.neighbors == row).any(axis=1))
+
+    def _insert(self, target, row, score):
+        """Insert ``row`` into the full-or-partial list of ``target``"""
+        scores = self.scores[target]
+        neighbors = self.neighbors[target]
+        ahead = (scores > score) | ((scores == score) & (neighbors >= 0) & (neighbors < row))
+        position = int(ahead.sum())
+        if position >= self.k:
+            return
+        scores[position + 1:] = scores[position:-1].copy()
+        neighbors[position + 1:] = neighbors[position:-1].copy()
+        scores[position] = score
+        neighbors[position] = row
+
+    def on_add(self, row):
+        """Patch the table after ``catalog.add`` inserted or replaced ``row``"""
+        if self.version is None:
+            return
+        self._ensure_capacity()
+        # Lists that already hold this row may rank it differently now
+        holders = self._holders_of(row)
+
+        live_rows = self.catalog.live_rows()
+        scores = self._scores_against_live(np.array([row]), live_rows)[0]
+        columns = top_k(scores[None, :], self.k)[0]
+        self.neighbors[row] = -1
+        self.scores[row] = -np.inf
+        self.neighbors[row, :len(columns)] = live_rows[columns]
+        self.scores[row, :len(columns)] = scores[columns]
+
+        # Similarity is symmetric: offer the row to every list it now beats
+        worst_scores = self.scores[live_rows, -1]
+        worst_rows = self.neighbors[live_rows, -1]
+        beats = (scores > worst_scores) | ((scores == worst_scores) & (worst_rows >= 0) & (row < worst_rows))
+        beats &= scores > -np.inf
+        beats &= ~np.isin(live_rows, holders)
+        for target, score in zip(live_rows[beats], scores[beats]):
+            self._insert(target, row, score)
+
+        self.refresh_rows(holders[holders != row])
+        self.version = self.catalog.version
+
+    def on_remove(self, row):
+        """Patch the table after ``catalog.remove`` tombstoned ``row``"""
+        if self.version is None:
+            return
+        self._ensure_capacity()
+        self.neighbors[row] = -1
+        self.scores[row] = -np.inf
+        self.refresh_rows(self._holders_of(row))
+        self.version = self.catalog.version
+
+    def lists(self, rows):
+        """``row -> neighbour list`` for many rows, gathered in one pass"""
+        rows = sorted(set(rows))
+        return dict(zip(rows, self.neighbors[rows].tolist())) if rows else {}
+
+    def similar(self, cart_rows, exclude_rows, per_item=2, lists=None):
+        """Top ``per_item`` neighbours of each cart row, skipping ``exclude_rows``.
+
+        ``lists`` may hold neighbour lists already gathered with ``lists()``.
+        Falls back to a brute-force scan for a cart row only when its whole
+        list was consumed by exclusions.
+        """
+        results = []
+        for row in cart_rows:
+            picked = []
+            row_list = lists[row] if lists is not None else self.neighbors[row].tolist()
+            for neighbor in row_list:
+                if neighbor < 0 or len(picked) >= per_item:
+                    break
+                if neighbor not in exclude_rows:
+                    picked.append(neighbor)
+            if len(picked) < per_item and row_list[-1] >= 0:
+                candidates = self.catalog.candidate_mask()
+                candidates[list(exclude_rows)] = False
+                picked = top_similar(
+                    self.catalog, [row], np.flatnonzero(candidates),
+                    k=per_item, threshold=self.threshold, content=self.content
+                )[0].tolist()
+            results.append(picked)
+        return results
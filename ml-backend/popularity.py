@@ -0,0 +1,145 @@
+import numpy as np
+
+from sortedlist import SortedKeyList
+
+# Score weights: views*0.3 + purchases*0.5 + rating*reviews*0.2
+VIEW_WEIGHT = 0.3
+PURCHASE_WEIGHT = 0.5
+QUALITY_WEIGHT = 0.2
+
+# Leading rows of the ranking whose order is versioned; a reader that stops
+# within them can keep its result while ``head_version`` holds still
+HEAD_SIZE = 256
+
+
+class PopularityIndex:
+    """Catalog rows kept ordered by popularity score.
+
+    Keys are ``(-score, row)`` so iteration yields the most popular row
+    first and breaks ties in catalog order, matching a stable sort.
+    ``views`` and ``purchases`` are the live ``product_id -> count``
+    mappings; call ``update`` after changing a product's counters. While
+    another thread writes to them, build from ``counts``, a ``(views,
+    purchases)`` copy, and re-rank what moved since it was taken.
+    ``head_version`` changes only when the order of the first ``HEAD_SIZE``
+    rows may have, so counter churn further down leaves it alone.
+    """
+
+    def __init__(self, catalog, views, purchases):
+        self.catalog = catalog
+        self.views = views
+        self.purchases = purchases
+        self.scores = {}
+        self.ranking = SortedKeyList()
+        self.version = None
+        self.head_version = 0
+
+    @classmethod
+    def build(cls, catalog, views, purchases, counts=None):
+        index = cls(catalog, views, purchases)
+        index.rebuild(counts)
+        return index
+
+    def is_current(self, catalog):
+        return self.catalog is catalog and self.version == catalog.version
+
+    def _counter_column(self, counts):
+        column = np.zeros(self.catalog.size)
+        for product_id, count in counts.items():
+            row = self.catalog.row_of(product_id)
+            if row is not None:
+                column[row] = count
+        return column
+
+    def rebuild(self, counts=None):
+        """Score every live row in one vectorized pass and sort once"""
+        catalog = self.catalog
+        views, purchases = counts if counts is not None else (self.views, self.purchases)
+        rows = catalog.live_rows()
+        scores = (
+            self._counter_column(views) * VIEW_WEIGHT +
+            self._counter_column(purchases) * PURCHASE_WEIGHT +
+            catalog.rating * catalog.reviews * QUALITY_WEIGHT
+        )[rows]
+        self.scores = dict(zip(rows.tolist(), scores.tolist()))
+        self.ranking = SortedKeyList((-score, row) for row, score in self.scores.items())
+        self.version = catalog.version
+        self.head_version += 1
+
+    def score_of(self, row):
+        """Popularity score of one row from its current counters"""
+        catalog = self.catalog
+        key = catalog.keys[row]
+        return (
+            self.views.get(key, 0) * VIEW_WEIGHT +
+            self.purchases.get(key, 0) * PURCHASE_WEIGHT +
+            catalog.rating[row] * catalog.reviews[row] * QUALITY_WEIGHT
+        )
+
+    def rank(self, row):
+        """Position of a row in the ranking, 0 for the most popular"""
+        return self.ranking.bisect_left((-self.scores[row], row))
+
+    def update(self, row):
+        """Re-rank one row after its counters or attributes changed"""
+        old_score = self.scores.get(row)
+        old_rank = None
+        if old_score is not None:
+            old_rank = self.ranking.bisect_left((-old_score, row))
+            self.ranking.remove((-old_score, row))
+        score = float(self.score_of(row))
+        # Ranks counted without the row, so an unchanged order gives equal ranks
+        new_rank = self.ranking.bisect_left((-score, row))
+        self.scores[row] = score
+        self.ranking.add((-score, row))
+        if new_rank != old_rank and min(new_rank, HEAD_SIZE if old_rank is None else old_rank) < HEAD_SIZE:
+            self.head_version += 1
+
+    def on_add(self, row):
+        self.update(row)
+        self.version = self.catalog.version
+
+    def on_remove(self, row):
+        old_score = self.scores.pop(row, None)
+        if old_score is not None:
+            if self.ranking.bisect_left((-old_score, row)) < HEAD_SIZE:
+                self.head_version += 1
+            self.ranking.remove((-old_score, row))
+        self.version = self.catalog.version
+
+    def __iter__(self):
+        """Rows from most to least popular"""
+        for _, row in self.ranking:
+            yield row
+
+    def top(self, n, exclude_rows=(), exclude_categories=(), distinct_categories=False, ranking=None):
+        """Most popular ``n`` rows not in ``exclude_rows`` or ``exclude_categories``.
+
+        With ``distinct_categories`` each returned row's category is excluded
+        for the rows after it. Stops as soon as ``n`` rows are found, or
+        when every category has been excluded. ``ranking`` may be a list of
+        rows already materialized from this index, to share across calls.
+        """
+        catalog = self.catalog
+        excluded_codes = {
+            catalog.category_codes[category] for category in exclude_categories
+            if category in catalog.category_codes
+        }
+        category_count = len(catalog.category_names)
+        codes = catalog.category
+
+        results = []
+        if n <= 0:
+            return results
+        for row in self if ranking is None else ranking:
+            code = codes[row]
+            if row in exclude_rows or code in excluded_codes or row in results:
+                continue
+            results.append(row)
+            if len(results) >= n:
+                break
+            if distinct_categories:
+                excluded_codes.add(code)
+                if len(excluded_codes) >= category_count:
+                    break
+        return results
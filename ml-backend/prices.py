@@ -0,0 +1,116 @@
+import numpy as np
+
+# Products within this fraction of the reference price are "in range"
+PRICE_BAND = 0.5
+
+
+class PriceIndex:
+    """Live catalog rows sorted by price.
+
+    ``prices`` and ``rows`` are parallel arrays in ascending price order, so
+    a price band is two ``searchsorted`` calls. Single adds and deletes
+    shift the arrays in place rather than re-sorting.
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.prices = np.empty(0, dtype=np.float64)
+        self.rows = np.empty(0, dtype=np.int64)
+        self.indexed_price = {}    # row -> price it is filed under
+        self.version = None
+
+    @classmethod
+    def build(cls, catalog):
+        index = cls(catalog)
+        index.rebuild()
+        return index
+
+    @classmethod
+    def from_arrays(cls, catalog, prices, rows):
+        """Adopt previously sorted ``prices``/``rows`` arrays for ``catalog``"""
+        index = cls(catalog)
+        index.prices = prices
+        index.rows = rows
+        index.indexed_price = dict(zip(rows.tolist(), prices.tolist()))
+        index.version = catalog.version
+        return index
+
+    def is_current(self, catalog):
+        return self.catalog is catalog and self.version == catalog.version
+
+    def rebuild(self):
+        catalog = self.catalog
+        rows = catalog.live_rows()
+        order = np.lexsort((rows, catalog.price[rows]))
+        self.rows = rows[order]
+        self.prices = catalog.price[self.rows]
+        self.indexed_price = dict(zip(self.rows.tolist(), self.prices.tolist()))
+        self.version = catalog.version
+
+    def _position(self, row, price):
+        start = np.searchsorted(self.prices, price, side='left')
+        end = np.searchsorted(self.prices, price, side='right')
+        return start + int(np.flatnonzero(self.rows[start:end] == row)[0])
+
+    def _discard(self, row):
+        price = self.indexed_price.pop(row, None)
+        if price is None:
+            return
+        position = self._position(row, price)
+        self.prices = np.delete(self.prices, position)
+        self.rows = np.delete(self.rows, position)
+
+    def on_add(self, row):
+        self._discard(row)
+        price = float(self.catalog.price[row])
+        start = np.searchsorted(self.prices, price, side='left')
+        end = np.searchsorted(self.prices, price, side='right')
+        position = start + int(np.searchsorted(self.rows[start:end], row))
+        self.prices = np.insert(self.prices, position, price)
+        self.rows = np.insert(self.rows, position, row)
+        self.indexed_price[row] = price
+        self.version = self.catalog.version
+
+    def on_remove(self, row):
+        self._discard(row)
+        self.version = self.catalog.version
+
+    def band(self, reference_price, exclude_rows=()):
+        """Rows whose price is within PRICE_BAND of ``reference_price``.
+
+        Returns an empty array for a zero, negative or missing reference.
+        """
+        if reference_price is None or not reference_price > 0:
+            return np.empty(0, dtype=np.int64)
+
+        # Bisect a slightly widened window, then apply the exact test
+        low = reference_price * (1 - PRICE_BAND) * (1 - 1e-9)
+        high = reference_price * (1 + PRICE_BAND) * (1 + 1e-9)
+        start = np.searchsorted(self.prices, low, side='left')
+        end = np.searchsorted(self.prices, high, side='right')
+        prices = self.prices[start:end]
+        rows = self.rows[start:end]
+        in_band = np.abs(prices - reference_price) / reference_price <= PRICE_BAND
+        if len(exclude_rows):
+            in_band &= ~np.isin(rows, np.fromiter(exclude_rows, dtype=np.int64))
+        return rows[in_band]
+
+    def top_rated_in_band(self, reference_price, n, exclude_rows=()):
+        """Best ``n`` rows by rating inside the band, ties in catalog order.
+
+        Uses a partition instead of sorting the whole band.
+        """
+        rows = self.band(reference_price, exclude_rows)
+        if n <= 0 or not len(rows):
+            return []
+        ratings = self.catalog.rating[rows]
+        if len(rows) > n:
+            cutoff = np.partition(ratings, len(rows) - n)[len(rows) - n]
+            above = rows[ratings > cutoff]
+            ties = rows[ratings == cutoff]
+            needed = n - len(above)
+            if needed < len(ties):
+                ties = np.partition(ties, needed - 1)[:needed]
+            rows = np.concatenate([above, ties])
+        order = np.lexsort((rows, -self.catalog.rating[rows]))
+        return rows[order][:n].tolist()
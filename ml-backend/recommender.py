@@ -0,0 +1,431 @@
+import hashlib
+import copy
+import multiprocessing
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import numpy as np
+
+from catalog import normalize_id
+from metrics import RECOMMEND_STAGE_SECONDS
+from similarity import top_similar
+
+DEFAULT_LIMIT = 6
+
+# Popular rows materialized once per batch; deeper lookups use the live index
+POPULAR_PREFIX = 4096
+
+# Batches smaller than this are not worth forking workers for
+PARALLEL_MIN_ENTRIES = 2000
+
+# Similar products taken per cart item, and the lowest similarity that counts
+SIMILAR_PER_ITEM = 2
+SIMILAR_THRESHOLD = 0.3
+
+# Co-purchase candidates looked up per cart: the two used plus spares for
+# products no longer in the catalog
+CO_PURCHASE_CANDIDATES = 6
+
+# A user's history resolved against one catalog; ``key`` is its normalized
+# ids in history order, which together with the limit fixes the result
+Cart = namedtuple("Cart", "key bought_ids bought_rows purchased_rows")
+
+# Chosen rows, with the reason for each, in recommendation order, and how
+# many leading rows of the popularity ranking the choice depended on
+Recommendation = namedtuple("Recommendation", "rows reasons used_categories popular_depth")
+
+
+def get_popular_products(state):
+    """Get catalog rows sorted by popularity (views + purchases + rating)"""
+    return np.fromiter(state.popularity, dtype=np.int64, count=len(state.catalog))
+
+
+def get_category_recommendations(state, purchased_categories, exclude_ids):
+    """Get recommendations based on purchased categories"""
+    category_counts = Counter(purchased_categories)
+    recommendations = []
+
+    exclude_rows = set(state.catalog.rows_of(exclude_ids))
+
+    for category, count in category_counts.most_common():
+        # Top 2 from each category by rating and reviews
+        recommendations.extend(state.categories.best(category, 2, exclude_rows))
+
+    return recommendations
+
+
+def get_diverse_category_recommendations(state, purchased_categories, exclude_ids, used_categories):
+    """Get recommendations from different categories for diversity"""
+    category_counts = Counter(purchased_categories)
+    recommendations = []
+
+    exclude_rows = set(state.catalog.rows_of(exclude_ids))
+
+    # Get all available categories
+    all_categories = state.categories.categories()
+
+    # Prioritize categories that user has purchased from but haven't been used yet
+    for category, count in category_counts.most_common():
+        if category not in used_categories:
+            best = state.categories.best(category, 1, exclude_rows)
+            if best:
+                recommendations.extend(best)
+                if len(recommendations) >= 2:
+                    break
+
+    # If still need more, add from completely different categories, in
+    # catalog order so the pick does not depend on string hashing
+    if len(recommendations) < 2:
+        purchased = set(purchased_categories)
+        unused_categories = [
+            category for category in all_categories if category not in used_categories and category not in purchased
+        ]
+        for category in unused_categories:
+            best = state.categories.best(category, 1, exclude_rows)
+            if best:
+                recommendations.extend(best)
+                if len(recommendations) >= 2:
+                    break
+
+    return recommendations
+
+
+def get_similar_products(state, purchased_rows, exclude_ids, neighbor_lists=None, scored=None):
+    """Get catalog rows similar to purchased ones.
+
+    ``scored`` maps cart rows to their best matches over all live rows,
+    long enough to survive the cart's exclusions (see BatchContext).
+    """
+    catalog = state.catalog
+    recommendations = []
+
+    # Precomputed neighbour lists turn this into a lookup
+    if state.neighbors.is_current(catalog):
+        exclude_rows = set(catalog.rows_of(exclude_ids))
+        for similar_rows in state.neighbors.similar(
+                purchased_rows, exclude_rows, per_item=SIMILAR_PER_ITEM, lists=neighbor_lists):
+            recommendations.extend(similar_rows)
+        return recommendations
+
+    if scored is not None:
+        exclude_rows = set(catalog.rows_of(exclude_ids))
+        for row in purchased_rows:
+            recommendations.extend([match for match in scored[row] if match not in exclude_rows][:SIMILAR_PER_ITEM])
+        return recommendations
+
+    candidates = np.flatnonzero(catalog.candidate_mask(exclude_ids))
+
+    # Score the whole cart against the catalog at once, top 2 per item
+    for similar_rows in top_similar(
+            catalog, purchased_rows, candidates, k=SIMILAR_PER_ITEM, threshold=SIMILAR_THRESHOLD,
+            content=state.content):
+        recommendations.extend(similar_rows.tolist())
+
+    return recommendations
+
+
+def get_co_purchased_products(state, bought_ids, k=2):
+    """Get catalog rows most often bought together with the cart"""
+    if state.co_purchases is None or not bought_ids:
+        return []
+    catalog = state.catalog
+    rows = []
+    for product_id, _ in state.co_purchases.top(bought_ids, max(k, CO_PURCHASE_CANDIDATES)):
+        row = catalog.row_of(product_id)
+        if row is not None:
+            rows.append(row)
+    return rows[:k]
+
+
+def get_price_range_recommendations(state, purchased_rows, exclude_ids, avg_price=None):
+    """Get recommendations in similar price range"""
+    if not purchased_rows:
+        return []
+
+    catalog = state.catalog
+    if avg_price is None:
+        avg_price = sum(catalog.price[row] for row in purchased_rows) / len(purchased_rows)
+    exclude_rows = set(catalog.rows_of(exclude_ids))
+
+    # Top 3 by rating within 50% of average price
+    return state.prices.top_rated_in_band(avg_price, 3, exclude_rows)
+
+
+def prepare_cart(catalog, history):
+    """Resolve a request's ``history`` items to ids and catalog rows"""
+    key = tuple(normalize_id(item.get("id")) for item in history if "id" in item)
+    bought_ids = set(key)
+    purchased_rows = []
+    for item in history:
+        if "id" in item:
+            row = catalog.row_of(item.get("id"))
+            if row is not None:
+                purchased_rows.append(row)
+    return Cart(key, bought_ids, set(catalog.rows_of(bought_ids)), purchased_rows)
+
+
+def fill_rng(cart, limit):
+    """RNG for the random fill, seeded by the cart and limit.
+
+    The same request always gets the same products, which is what makes
+    responses cacheable and reproducible.
+    """
+    digest = hashlib.blake2b(repr((cart.key, limit)).encode('utf-8'), digest_size=8).digest()
+    return np.random.default_rng(int.from_bytes(digest, 'little'))
+
+
+def recommend_rows(state, cart, limit, rng=None, batch=None, avg_price=None):
+    """Pick up to ``limit`` rows for a cart: similar, co-purchased, category, price, popular, random.
+
+    ``batch`` is a BatchContext sharing work across many carts; ``rng``
+    supplies the shuffle for the random fill (``fill_rng`` by default).
+    Stage timings are recorded unless the batch is ``timed=False``.
+    """
+    catalog = state.catalog
+    _, bought_ids, bought_rows, purchased_rows = cart
+
+    recommendations = []
+    recommendation_reasons = []
+    recommended_rows = set()
+    used_categories = set()
+
+    def add_recommendation(row, reason):
+        recommendations.append(row)
+        recommendation_reasons.append(reason)
+        recommended_rows.add(row)
+        used_categories.add(catalog.category_of(row))
+
+    observe = RECOMMEND_STAGE_SECONDS.observe if batch is None or batch.timed else None
+    started = time.perf_counter()
+
+    def stage_done(stage):
+        nonlocal started
+        if observe is None:
+            return
+        now = time.perf_counter()
+        observe(now - started, stage)
+        started = now
+
+    if purchased_rows:
+        # 1. Add ONE similar product (avoid duplicates)
+        similar_recs = get_similar_products(
+            state, purchased_rows, bought_ids,
+            neighbor_lists=batch.neighbor_lists if batch is not None else None,
+            scored=batch.scored if batch is not None else None
+        )
+        if similar_recs:
+            add_recommendation(similar_recs[0], f"Similar to {catalog.names[purchased_rows[0]]}")
+        stage_done("similar")
+
+        # 2. Add ONE product other customers bought with this cart
+        for row in get_co_purchased_products(state, bought_ids):
+            if row not in recommended_rows:
+                add_recommendation(row, "Frequently bought together")
+                break
+        stage_done("co_purchase")
+
+        # 3. Add products from DIFFERENT categories than already added
+        purchased_categories = [catalog.category_of(row) for row in purchased_rows]
+        category_recs = get_diverse_category_recommendations(state, purchased_categories, bought_ids, used_categories)
+        for row in category_recs[:2]:
+            if row not in recommended_rows:
+                add_recommendation(row, f"Popular in {catalog.category_of(row)}")
+        stage_done("category")
+
+        # 4. Add ONE price range recommendation from different category
+        price_recs = get_price_range_recommendations(state, purchased_rows, bought_ids, avg_price)
+        for row in price_recs:
+            if row not in recommended_rows and catalog.category_of(row) not in used_categories:
+                add_recommendation(row, "In your price range")
+                break
+        stage_done("price_range")
+
+    # 5. Fill remaining slots with diverse popular products
+    wanted = limit - len(recommendations)
+    popular_rows = batch.popular_top(
+        wanted, bought_rows | recommended_rows, used_categories
+    ) if batch is not None else state.popularity.top(
+        wanted,
+        exclude_rows=bought_rows | recommended_rows,
+        exclude_categories=used_categories,
+        distinct_categories=True
+    )
+    for row in popular_rows:
+        add_recommendation(row, "Trending now")
+    # The scan stops at its last row once it has enough; short of that it read everything
+    if wanted <= 0:
+        popular_depth = 0
+    elif len(popular_rows) == wanted:
+        popular_depth = state.popularity.rank(popular_rows[-1]) + 1
+    else:
+        popular_depth = len(state.popularity.ranking)
+    stage_done("popular")
+
+    # 6. If still not enough, add random products from different categories
+    if len(recommendations) < limit:
+        available = catalog.candidate_mask(bought_ids)
+        available[recommendations] = False
+        available_rows = np.flatnonzero(available)
+        (rng or fill_rng(cart, limit)).shuffle(available_rows)  # Shuffle for better diversity
+        available_rows = available_rows.tolist()
+
+        for row in available_rows:
+            if len(recommendations) >= limit:
+                break
+            if catalog.category_of(row) not in used_categories:
+                add_recommendation(row, "You might like this")
+
+        # 7. If still not enough, fill with any remaining products
+        for row in available_rows:
+            if len(recommendations) >= limit:
+                break
+            if row not in recommended_rows:
+                add_recommendation(row, "Recommended for you")
+        stage_done("random_fill")
+
+    return Recommendation(recommendations[:limit], recommendation_reasons[:limit], used_categories, popular_depth)
+
+
+def recommendation_payload(catalog, recommendation, history_count):
+    """The ``/recommend`` response body for one recommendation"""
+    if not len(catalog):
+        return {
+            "recommendations": [],
+            "total_products": 0,
+            "user_history_count": history_count,
+            "message": "No products available for recommendations"
+        }
+
+    recommended_with_reasons = []
+    for row, reason in zip(recommendation.rows, recommendation.reasons):
+        rec = catalog.product(row)
+        rec['recommendation_reason'] = reason
+        recommended_with_reasons.append(rec)
+    return {
+        "recommendations": recommended_with_reasons,
+        "total_products": len(catalog),
+        "user_history_count": history_count
+    }
+
+
+class BatchContext:
+    """Work shared by every cart in a batch scored against one state.
+
+    Resolves all carts up front, gathers the neighbour lists of every cart
+    row in one pass (or, without a current neighbour table, scores every
+    distinct cart row against the catalog in one blocked matrix pass),
+    computes every cart's average price in one vectorized
+    sum, and materializes the head of the popularity ranking once.
+    """
+
+    def __init__(self, state, histories, timed=True):
+        catalog = state.catalog
+        self.state = state
+        self.timed = timed
+        self.carts = [prepare_cart(catalog, history) for history in histories]
+
+        lengths = np.array([len(cart.purchased_rows) for cart in self.carts], dtype=np.int64)
+        rows = np.array([row for cart in self.carts for row in cart.purchased_rows], dtype=np.int64)
+        totals = np.zeros(len(self.carts))
+        np.add.at(totals, np.repeat(np.arange(len(self.carts)), lengths), catalog.price[rows])
+        self.avg_prices = totals / np.maximum(lengths, 1)
+
+        self.neighbor_lists = None
+        self.scored = None
+        if state.neighbors.is_current(catalog):
+            self.neighbor_lists = state.neighbors.lists(rows.tolist())
+        elif len(rows):
+            # Each list must outlast the exclusion of its cart's own products
+            k = SIMILAR_PER_ITEM + max(len(cart.bought_rows) for cart in self.carts)
+            distinct = np.unique(rows)
+            matches = top_similar(
+                catalog, distinct, catalog.live_rows(), k=k, threshold=SIMILAR_THRESHOLD, content=state.content
+            )
+            self.scored = dict(zip(distinct.tolist(), (similar_rows.tolist() for similar_rows in matches)))
+        self.popular = list(islice(state.popularity, POPULAR_PREFIX))
+
+    def popular_top(self, n, exclude_rows, exclude_categories):
+        """``PopularityIndex.top`` with distinct categories, over the shared head"""
+        popularity = self.state.popularity
+        rows = popularity.top(n, exclude_rows, exclude_categories, True, ranking=self.popular)
+        if len(rows) < n and len(self.popular) >= POPULAR_PREFIX:
+            rows = popularity.top(n, exclude_rows, exclude_categories, True)
+        return rows
+
+    def recommend(self, i, limit, rng=None):
+        cart = self.carts[i]
+        avg_price = float(self.avg_prices[i]) if cart.purchased_rows else None
+        return recommend_rows(self.state, cart, limit, rng, batch=self, avg_price=avg_price)
+
+
+def recommend_batch(state, entries, processes=0, timed=True):
+    """Recommendations for many ``{user_id, history, limit}`` entries, in order.
+
+    Yields one Recommendation per entry as it is ready. With ``processes``
+    above 1 and a large enough batch, chunks are spread over forked
+    worker processes that share the state copy-on-write. ``timed=False``
+    skips the stage latency histogram.
+    """
+    entries = list(entries)
+    if processes > 1 and len(entries) >= PARALLEL_MIN_ENTRIES and 'fork' in multiprocessing.get_all_start_methods():
+        yield from _recommend_parallel(state, entries, processes)
+        return
+
+    batch = BatchContext(state, [entry.get("history", []) for entry in entries], timed)
+    for i, entry in enumerate(entries):
+        yield batch.recommend(i, entry.get("limit", DEFAULT_LIMIT))
+
+
+class FrozenCoPurchases:
+    """Co-purchase lookups for a fixed set of carts, answered up front.
+
+    Stands in for the CoPurchaseIndex in forked workers: the index lock may
+    be held by another thread of the parent at the fork, and would then
+    never be released in the child.
+    """
+
+    def __init__(self, co_purchases, carts):
+        self.results = {}
+        for bought_ids in carts:
+            key = frozenset(bought_ids)
+            if bought_ids and key not in self.results:
+                self.results[key] = co_purchases.top(bought_ids, CO_PURCHASE_CANDIDATES)
+
+    def top(self, product_ids, k, exclude_ids=()):
+        exclude = set(exclude_ids)
+        return [pair for pair in self.results.get(frozenset(product_ids), []) if pair[0] not in exclude][:k]
+
+
+_worker_state = None
+
+
+def _init_worker(state):
+    global _worker_state
+    _worker_state = state
+
+
+def _recommend_chunk(entries):
+    # The stage histogram's lock may have been held at the fork, and a
+    # worker's timings are never scraped anyway
+    return list(recommend_batch(_worker_state, entries, timed=False))
+
+
+def _recommend_parallel(state, entries, processes):
+    # Workers must not take locks other threads of this process may hold
+    # while forking, so co-purchase lookups are made here
+    if state.co_purchases is not None:
+        state = copy.copy(state)
+        state.co_purchases = FrozenCoPurchases(state.co_purchases, (
+            {normalize_id(item.get("id")) for item in entry.get("history", []) if "id" in item}
+            for entry in entries
+        ))
+    # A few chunks per worker so results can stream back in order
+    size = -(-len(entries) // (processes * 4))
+    chunks = [entries[start:start + size] for start in range(0, len(entries), size)]
+    with ProcessPoolExecutor(
+            processes, mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker, initargs=(state,)) as pool:
+        for results in pool.map(_recommend_chunk, chunks):
+            yield from results
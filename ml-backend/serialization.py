@@ -0,0 +1,150 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from flask.json.provider import DefaultJSONProvider
+
+from logs import get_logger
+
+log = get_logger("serialization")
+
+# Handle orjson import with fallback to the standard library
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# "orjson" (when installed) or "json"
+JSON_BACKEND = os.environ.get("JSON_BACKEND", "orjson" if ORJSON_AVAILABLE else "json")
+if JSON_BACKEND == "orjson" and not ORJSON_AVAILABLE:
+    log.warning("⚠️ Warning: 'orjson' module not available. Using the standard json encoder.")
+    JSON_BACKEND = "json"
+
+# Payload variants (field/page combinations) kept per catalog version
+MAX_CATALOG_PAYLOADS = 64
+
+GZIP_LEVEL = 6
+
+
+def _numpy_default(default):
+    """``default`` extended with the NumPy values orjson encodes natively"""
+    def encode(obj):
+        if isinstance(obj, (np.generic, np.ndarray)):
+            return obj.tolist()
+        if default is None:
+            raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+        return default(obj)
+    return encode
+
+
+def dumps(obj, sort_keys=False, default=None):
+    """Serialize to compact UTF-8 JSON bytes with the configured backend.
+
+    Whatever orjson refuses, such as integers past 64 bits, is retried
+    with the standard json module, which only fails on what it cannot
+    encode either.
+    """
+    if JSON_BACKEND == "orjson":
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        try:
+            return orjson.dumps(obj, default=default, option=option)
+        except TypeError:
+            pass
+    return json.dumps(
+        obj, sort_keys=sort_keys, default=_numpy_default(default), ensure_ascii=False, separators=(',', ':')
+    ).encode('utf-8')
+
+
+def loads(data):
+    """Parse JSON from bytes or str with the configured backend"""
+    if JSON_BACKEND == "orjson":
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider that encodes with ``dumps``, so ``jsonify`` uses orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj, kwargs.get('sort_keys', self.sort_keys), self.default).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj, self.sort_keys, self.default), mimetype=self.mimetype)
+
+
+class CatalogPayload:
+    """One serialized catalog view, with its ETag and a lazily gzipped copy"""
+
+    def __init__(self, body, total):
+        self.body = body
+        self.total = total
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self._gzipped = None
+
+    @property
+    def gzipped(self):
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, GZIP_LEVEL, mtime=0)
+        return self._gzipped
+
+
+class CatalogPayloads:
+    """Pre-serialized ``/products`` bodies, cached per catalog version.
+
+    A view is a field projection plus an optional page. It is serialized
+    the first time it is requested for a catalog version and then served
+    as bytes until the catalog changes. ETags are content hashes, so every
+    worker process hands out the same tag for the same catalog.
+    """
+
+    def __init__(self, maxsize=MAX_CATALOG_PAYLOADS):
+        self.maxsize = maxsize
+        self.generation = None
+        self.builds = 0
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, catalog, fields=None, page=None, per_page=None):
+        """The payload for a view of ``catalog``.
+
+        ``fields`` is a tuple of product keys (None for all), ``page`` is
+        1-based and only applies with ``per_page``.
+        """
+        generation = (catalog.uid, catalog.version)
+        key = (fields, page, per_page)
+        with self._lock:
+            if generation != self.generation:
+                self._payloads.clear()
+                self.generation = generation
+            payload = self._payloads.get(key)
+            if payload is not None:
+                self._payloads.move_to_end(key)
+                return payload
+
+        payload = self._build(catalog, fields, page, per_page)
+        with self._lock:
+            if generation == self.generation:
+                self._payloads[key] = payload
+                while len(self._payloads) > self.maxsize:
+                    self._payloads.popitem(last=False)
+        return payload
+
+    def _build(self, catalog, fields, page, per_page):
+        rows = catalog.live_rows()
+        total = len(rows)
+        if per_page:
+            start = (page - 1) * per_page
+            rows = rows[start:start + per_page]
+        products = catalog.products(rows)
+        if fields is not None:
+            products = [{field: product[field] for field in fields} for product in products]
+        self.builds += 1
+        return CatalogPayload(dumps(products), total)
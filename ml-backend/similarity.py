@@ -0,0 +1,134 @@
+import numpy as np
+
+from catalog import popcount
+
+# Weights of the similarity blend
+CATEGORY_WEIGHT = 0.4
+PRICE_WEIGHT = 0.3
+TAG_WEIGHT = 0.3
+
+# Weight of the TF-IDF cosine of names and descriptions (see ContentIndex)
+TEXT_WEIGHT = 0.3
+
+# Price ratios at or below this contribute nothing
+PRICE_RATIO_CUTOFF = 0.5
+
+# Upper bound on cart x catalog cells scored at once (bounds peak memory)
+MAX_BLOCK_CELLS = 1 << 22
+
+
+def calculate_similarity(product1, product2, text_similarity=0.0):
+    """Calculate similarity between two products.
+
+    Scalar reference implementation; ``similarity_matrix`` must agree with it.
+    ``text_similarity`` is the cosine of the two products' content vectors.
+    """
+    score = 0
+
+    # Category match (highest weight)
+    if product1['category'] == product2['category']:
+        score += CATEGORY_WEIGHT
+
+    # Price similarity (within 50% range)
+    price_ratio = min(product1['price'], product2['price']) / max(product1['price'], product2['price'])
+    if price_ratio > PRICE_RATIO_CUTOFF:
+        score += PRICE_WEIGHT * price_ratio
+
+    # Tag similarity
+    tags1 = set(product1.get('tags', []))
+    tags2 = set(product2.get('tags', []))
+    if tags1 and tags2:
+        common_tags = len(tags1.intersection(tags2))
+        union_tags = len(tags1.union(tags2))
+        if union_tags > 0:
+            score += TAG_WEIGHT * (common_tags / union_tags)
+
+    # Name/description similarity
+    score += TEXT_WEIGHT * text_similarity
+
+    return score
+
+
+def similarity_matrix(catalog, cart_rows, candidate_rows, content=None):
+    """Score every cart row against every candidate row in one NumPy pass.
+
+    Returns a float64 array of shape (len(cart_rows), len(candidate_rows)).
+    Pairs whose prices are both zero score no price term instead of raising.
+    With a current ``content`` index, the text cosine is blended in too.
+    """
+    cart_rows = np.asarray(cart_rows, dtype=np.intp)
+    candidate_rows = np.asarray(candidate_rows, dtype=np.intp)
+
+    # Category equality mask
+    same_category = catalog.category[cart_rows][:, None] == catalog.category[candidate_rows][None, :]
+    scores = np.where(same_category, CATEGORY_WEIGHT, 0.0)
+
+    # Price ratio term with its cutoff
+    cart_prices = catalog.price[cart_rows][:, None]
+    prices = catalog.price[candidate_rows][None, :]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        price_ratio = np.minimum(cart_prices, prices) / np.maximum(cart_prices, prices)
+    scores += np.where(price_ratio > PRICE_RATIO_CUTOFF, PRICE_WEIGHT * price_ratio, 0.0)
+
+    # Tag Jaccard from bitmasks
+    cart_tags = catalog.tag_bits[cart_rows][:, None, :]
+    tags = catalog.tag_bits[candidate_rows][None, :, :]
+    common_tags = popcount(cart_tags & tags)
+    union_tags = popcount(cart_tags | tags)
+    jaccard = np.divide(
+        common_tags, union_tags,
+        out=np.zeros(union_tags.shape, dtype=np.float64),
+        where=union_tags > 0
+    )
+    scores += TAG_WEIGHT * jaccard
+
+    # Name/description cosine from sparse TF-IDF vectors
+    if content is not None and content.is_current(catalog):
+        scores += TEXT_WEIGHT * content.cosine(cart_rows, candidate_rows)
+
+    return scores
+
+
+def top_k(scores, k):
+    """Column indices of the k best scores per row, best first.
+
+    Uses argpartition rather than a full sort; ties keep column order, so the
+    result matches a stable descending sort. Entries equal to -inf are never
+    returned.
+    """
+    scores = np.atleast_2d(scores)
+    n = scores.shape[1]
+    if k <= 0 or n == 0:
+        return [np.empty(0, dtype=np.intp) for _ in range(scores.shape[0])]
+
+    if k < n:
+        kth_best = -np.partition(-scores, k - 1, axis=1)[:, k - 1]
+    else:
+        kth_best = np.full(scores.shape[0], -np.inf)
+
+    results = []
+    for row_scores, cutoff in zip(scores, kth_best):
+        keep = np.flatnonzero((row_scores >= cutoff) & (row_scores > -np.inf))
+        order = np.argsort(-row_scores[keep], kind='stable')[:k]
+        results.append(keep[order])
+    return results
+
+
+def top_similar(catalog, cart_rows, candidate_rows, k=2, threshold=0.3, content=None):
+    """Top-k candidate rows scoring above ``threshold`` for each cart row.
+
+    Returns one array of catalog rows per cart row, most similar first. The
+    cart is scored in blocks so peak memory stays bounded for large catalogs.
+    """
+    candidate_rows = np.asarray(candidate_rows, dtype=np.intp)
+    cart_rows = list(cart_rows)
+    if not cart_rows:
+        return []
+
+    block = max(1, MAX_BLOCK_CELLS // max(len(candidate_rows), 1))
+    results = []
+    for start in range(0, len(cart_rows), block):
+        scores = similarity_matrix(catalog, cart_rows[start:start + block], candidate_rows, content)
+        scores[scores <= threshold] = -np.inf
+        results.extend(candidate_rows[columns] for columns in top_k(scores, k))
+    return results
@@ -0,0 +1,242 @@
+import json
+import os
+import shutil
+import threading
+import time
+
+import numpy as np
+
+from catalog import ProductCatalog
+from content import ContentIndex
+from logs import get_logger
+from neighbors import NeighborIndex
+from prices import PriceIndex
+
+SNAPSHOT_FORMAT = 1
+
+# File in the snapshot directory naming the newest complete snapshot
+LATEST_FILE = "LATEST"
+
+# Complete snapshots kept on disk, newest first
+DEFAULT_KEEP = 2
+
+DEFAULT_INTERVAL = 60
+
+log = get_logger("snapshot")
+
+
+def capture_snapshot(state, counters, watermark=None):
+    """Copy everything a snapshot needs out of the live objects.
+
+    Only the copy has to happen under the app's write lock; the slow
+    part, writing files, then works on data nothing else touches.
+    """
+    catalog = state.catalog
+    size = catalog.size
+    views, purchases, user_purchases = counters.snapshot()
+    arrays = {
+        **{name: getattr(catalog, name).copy() for name in ProductCatalog.COLUMNS},
+        "price_index_prices": state.prices.prices.copy(),
+        "price_index_rows": state.prices.rows.copy(),
+    }
+    if state.neighbors.is_current(catalog):
+        # Not yet built after a sync: left out, and built again after loading
+        arrays.update({
+            "neighbors": state.neighbors.neighbors[:size].copy(),
+            "neighbor_scores": state.neighbors.scores[:size].copy(),
+        })
+    content = state.content
+    if content.matrix is not None:
+        # The matrix is replaced, never modified, so these are stable already
+        arrays.update({
+            "content_data": content.matrix.data,
+            "content_indices": content.matrix.indices,
+            "content_indptr": content.matrix.indptr,
+            "content_idf": content.idf,
+        })
+    return {
+        "arrays": arrays,
+        "catalog": {
+            "format": SNAPSHOT_FORMAT,
+            "created": time.time(),
+            "version": catalog.version,
+            "max_numeric": catalog.max_numeric,
+            "neighbor_threshold": state.neighbors.threshold,
+            "content_terms": content.terms if content.matrix is not None else None,
+            "watermark": watermark,
+            "ids": list(catalog.ids),
+            "names": list(catalog.names),
+            "images": list(catalog.images),
+            "descriptions": list(catalog.descriptions),
+            "tags": [list(tags) for tags in catalog.tags],
+            "category_names": list(catalog.category_names),
+            "tag_vocab": dict(catalog.tag_vocab),
+            "content_hashes": dict(catalog.content_hashes),
+        },
+        "counters": {
+            "views": views,
+            "purchases": purchases,
+            "user_purchases": user_purchases,
+        },
+    }
+
+
+def _write_file(path, write, binary=False):
+    with open(path, "wb" if binary else "w", encoding=None if binary else "utf-8") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def write_snapshot(directory, captured, keep=DEFAULT_KEEP):
+    """Write a captured snapshot and make it the latest. Returns its path.
+
+    Numeric columns and index tables are raw ``.npy`` files so they can be
+    memory-mapped on load; text columns and counters are JSON. The new
+    snapshot only becomes visible when ``LATEST`` is atomically replaced,
+    so a crash mid-write leaves the previous snapshot in place.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"snapshot-{time.time_ns()}-{os.getpid()}"
+    partial = os.path.join(directory, "." + name)
+    os.makedirs(partial)
+
+    for array_name, array in captured["arrays"].items():
+        _write_file(os.path.join(partial, array_name + ".npy"), lambda f: np.save(f, array), binary=True)
+    for json_name in ("catalog", "counters"):
+        _write_file(
+            os.path.join(partial, json_name + ".json"),
+            lambda f: json.dump(captured[json_name], f, separators=(',', ':'))
+        )
+
+    path = os.path.join(directory, name)
+    os.rename(partial, path)
+    pointer = os.path.join(directory, f".{LATEST_FILE}-{os.getpid()}")
+    _write_file(pointer, lambda f: f.write(name))
+    os.replace(pointer, os.path.join(directory, LATEST_FILE))
+
+    _prune(directory, keep, name)
+    return path
+
+
+def _prune(directory, keep, latest):
+    """Delete all but the ``keep`` newest snapshots (never ``latest``)"""
+    snapshots = sorted(
+        (entry for entry in os.listdir(directory) if entry.startswith("snapshot-")),
+        key=lambda entry: int(entry.split("-")[1]),
+        reverse=True
+    )
+    for entry in snapshots[keep:]:
+        if entry != latest:
+            # Mapped files stay readable after unlinking
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
+
+
+def _load_array(path):
+    try:
+        # Copy-on-write: later patches stay private to this process
+        return np.load(path, mmap_mode="c")
+    except ValueError:
+        return np.load(path)  # empty arrays cannot be mapped
+
+
+def load_snapshot(directory):
+    """Load the latest snapshot in ``directory``, or None if there is none.
+
+    Returns ``(catalog, neighbors, prices, content, counters, meta)``.
+    Arrays are memory-mapped, so loading costs little more than parsing
+    the JSON. Content vectors are refitted if the snapshot has none;
+    ``neighbors`` is None if it has no neighbour table.
+    """
+    try:
+        with open(os.path.join(directory, LATEST_FILE), encoding="utf-8") as f:
+            path = os.path.join(directory, f.read().strip())
+        with open(os.path.join(path, "catalog.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(path, "counters.json"), encoding="utf-8") as f:
+            counters = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get("format") != SNAPSHOT_FORMAT:
+        log.warning("⚠️ Ignoring snapshot %s: unsupported format %s", path, meta.get('format'))
+        return None
+
+    arrays = {
+        entry[:-len(".npy")]: _load_array(os.path.join(path, entry))
+        for entry in os.listdir(path) if entry.endswith(".npy")
+    }
+    catalog = ProductCatalog.from_columns(
+        {name: arrays[name] for name in ProductCatalog.COLUMNS},
+        meta["ids"], meta["names"], meta["images"], meta["descriptions"], meta["tags"],
+        meta["category_names"], meta["tag_vocab"], meta["content_hashes"],
+        meta["max_numeric"], meta["version"]
+    )
+    if meta.get("content_terms") is not None:
+        content = ContentIndex.from_arrays(
+            catalog, meta["content_terms"], arrays["content_idf"],
+            arrays["content_data"], arrays["content_indices"], arrays["content_indptr"]
+        )
+    else:
+        content = ContentIndex.build(catalog)
+    neighbors = None
+    if "neighbors" in arrays:
+        neighbors = NeighborIndex.from_arrays(
+            catalog, arrays["neighbors"], arrays["neighbor_scores"], meta["neighbor_threshold"], content
+        )
+    prices = PriceIndex.from_arrays(catalog, arrays["price_index_prices"], arrays["price_index_rows"])
+    return catalog, neighbors, prices, content, counters, meta
+
+
+class SnapshotWriter:
+    """Write-behind snapshots on a daemon thread.
+
+    Every ``interval`` seconds, ``capture()`` is called if ``signature()``
+    changed since the last write, and the result written to ``directory``.
+    ``stop`` writes a final snapshot, so a clean shutdown loses nothing.
+    """
+
+    def __init__(self, directory, capture, signature, interval=DEFAULT_INTERVAL, keep=DEFAULT_KEEP):
+        self.directory = directory
+        self.capture = capture
+        self.signature = signature
+        self.interval = interval
+        self.keep = keep
+        self.writes = 0
+        self._written = None
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def mark_current(self):
+        """Treat the current state as already on disk (e.g. just loaded)"""
+        self._written = self.signature()
+
+    def write(self, force=False):
+        """Write a snapshot if anything changed. Returns its path, or None"""
+        with self._write_lock:
+            signature = self.signature()
+            if not force and signature == self._written:
+                return None
+            path = write_snapshot(self.directory, self.capture(), self.keep)
+            self._written = signature
+            self.writes += 1
+            return path
+
+    def start(self):
+        if self._thread is None and self.interval:
+            self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self.write()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                log.exception("❌ Snapshot write failed: %s", e)
@@ -0,0 +1,60 @@
+from bisect import bisect_left, insort
+
+
+class SortedKeyList:
+    """Sorted list split into bounded sublists.
+
+    Insert and remove bisect the sublist maxima and then one sublist of at
+    most ``2 * load`` keys, so updates stay O(log n) plus a short memmove,
+    while in-order iteration is a plain walk over the sublists.
+    """
+
+    def __init__(self, keys=(), load=512):
+        self.load = load
+        keys = sorted(keys)
+        self._lists = [keys[i:i + load] for i in range(0, len(keys), load)]
+        self._maxes = [sublist[-1] for sublist in self._lists]
+        self._len = len(keys)
+
+    def __len__(self):
+        return self._len
+
+    def __iter__(self):
+        for sublist in self._lists:
+            yield from sublist
+
+    def add(self, key):
+        self._len += 1
+        if not self._lists:
+            self._lists.append([key])
+            self._maxes.append(key)
+            return
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            i -= 1
+            self._lists[i].append(key)
+            self._maxes[i] = key
+        else:
+            insort(self._lists[i], key)
+        if len(self._lists[i]) > 2 * self.load:
+            sublist = self._lists[i]
+            self._lists[i:i + 1] = [sublist[:self.load], sublist[self.load:]]
+            self._maxes[i:i + 1] = [sublist[self.load - 1], sublist[-1]]
+
+    def bisect_left(self, key):
+        """Position of ``key``, or where it would be inserted"""
+        i = bisect_left(self._maxes, key)
+        if i == len(self._maxes):
+            return self._len
+        return sum(len(sublist) for sublist in self._lists[:i]) + bisect_left(self._lists[i], key)
+
+    def remove(self, key):
+        i = bisect_left(self._maxes, key)
+        sublist = self._lists[i]
+        del sublist[bisect_left(sublist, key)]
+        self._len -= 1
+        if sublist:
+            self._maxes[i] = sublist[-1]
+        else:
+            del self._lists[i]
+            del self._maxes[i]
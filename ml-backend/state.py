@@ -0,0 +1,83 @@
+from categories import CategoryIndex
+from content import ContentIndex
+from neighbors import NeighborIndex
+from popularity import PopularityIndex
+from prices import PriceIndex
+
+
+class CatalogState:
+    """A catalog together with every index derived from it.
+
+    A state is built completely before it is published, and the app swaps
+    its single ``state`` reference to publish it, so readers always see a
+    catalog and indexes that belong together. The exception is the O(n^2)
+    neighbour table: unless one is supplied it starts unbuilt, similar-product
+    lookups scan by brute force, and ``build_neighbors`` fills it in later.
+    """
+
+    def __init__(self, catalog, views, purchases, neighbors=None, prices=None, content=None, co_purchases=None,
+                 counts=None):
+        # A snapshot may supply the neighbour, price and content indexes;
+        # ``counts`` is a (views, purchases) copy to rank from, see PopularityIndex
+        self.catalog = catalog
+        # Keyed by product id and fed by the counter flusher, so shared by
+        # every state rather than rebuilt with the catalog
+        self.co_purchases = co_purchases
+        self.content = content if content is not None else ContentIndex.build(catalog)
+        self.neighbors = neighbors if neighbors is not None else NeighborIndex(catalog, content=self.content)
+        self.popularity = PopularityIndex.build(catalog, views, purchases, counts)
+        self.categories = CategoryIndex.build(catalog)
+        self.prices = prices if prices is not None else PriceIndex.build(catalog)
+
+    def build_neighbors(self, lock):
+        """Build the neighbour table without holding ``lock``, then adopt it under it.
+
+        Returns False, adopting nothing, if the catalog changed meanwhile.
+        """
+        neighbors = NeighborIndex.build(self.catalog, content=self.content)
+        with lock:
+            if not neighbors.is_current(self.catalog):
+                return False
+            self.neighbors = neighbors
+            return True
+
+    def indexes(self):
+        # Content vectors first: neighbour updates score against them
+        return (self.content, self.neighbors, self.popularity, self.categories, self.prices)
+
+    def add_product(self, product):
+        """Insert or replace a product and patch every index. Returns its row"""
+        return self.add_products([product])[0]
+
+    def add_products(self, products):
+        """Insert or replace many products and patch every index. Returns their rows.
+
+        The content matrix is re-packed once for the whole batch.
+        """
+        rows = [self.catalog.add(product) for product in products]
+        content, *others = self.indexes()
+        content.on_add_rows(rows)
+        for row in rows:
+            for index in others:
+                index.on_add(row)
+        return rows
+
+    def remove_product(self, product_id):
+        """Delete a product and patch every index. Returns its row, or None"""
+        rows = self.remove_products([product_id])
+        return rows[0] if rows else None
+
+    def remove_products(self, product_ids):
+        """Delete many products and patch every index. Returns the rows removed"""
+        rows = [row for row in map(self.catalog.remove, product_ids) if row is not None]
+        content, *others = self.indexes()
+        content.on_remove_rows(rows)
+        for row in rows:
+            for index in others:
+                index.on_remove(row)
+        return rows
+
+    def counters_changed(self, product_ids):
+        """Re-rank products whose view or purchase counters changed"""
+        for row in self.catalog.rows_of(product_ids):
+            self.popularity.update(row)
@@ -0,0 +1,331 @@
+import hashlib
+import json
+import random
+import threading
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from logs import get_logger
+
+log = get_logger("sync")
+
+# Handle requests import with fallback
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
+    log.warning("⚠️ Warning: 'requests' module not available. Product sync will be disabled.")
+
+from catalog import ProductCatalog, normalize_id
+from tags import extract_tags, extract_tags_batch
+
+# (connect, read) timeouts in seconds for upstream calls
+DEFAULT_TIMEOUT = (3.05, 20)
+DEFAULT_RETRIES = 3
+
+# DummyJSON IDs 1-100 are mirrored by the frontend as 1001-1100
+DUMMYJSON_LIMIT = 100
+DUMMYJSON_PAGE_SIZE = 50
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Characters that may follow a complete number or literal inside an array
+_SCALAR_ENDS = (' ', '\t', '\r', '\n', ',', ']')
+
+# Response header through which the Node.js backend may supply a change
+# watermark; it is sent back as ``?since=`` on the next incremental sync
+WATERMARK_HEADER = "X-Sync-Watermark"
+
+# Above this fraction of changed rows an incremental sync rebuilds instead.
+# Patching costs a few ms per product plus an O(n) neighbour-table scan, so
+# a rebuild (with its O(n^2) table) wins at about 4-5% of the catalog
+MAX_DELTA_FRACTION = 0.05
+
+# Products that were added, updated or removed upstream since the last sync
+CatalogDelta = namedtuple("CatalogDelta", "changed removed unchanged")
+
+
+def make_session(retries=DEFAULT_RETRIES, pool_size=8):
+    """HTTP session with a connection pool and retry/backoff on transient errors"""
+    session = requests.Session()
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.3,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET'])
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def iter_json_array(chunks):
+    """Yield the elements of a top-level JSON array from a stream of text chunks.
+
+    Each element is decoded as soon as it is complete, so a large response
+    never has to be held and parsed as one document.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    for chunk in chunks:
+        buffer += chunk
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in ' \t\r\n,':
+                position += 1
+            if position >= len(buffer):
+                break
+            if not started:
+                if buffer[position] != '[':
+                    raise ValueError("Expected a JSON array")
+                started = True
+                position += 1
+                continue
+            if buffer[position] == ']':
+                return
+            try:
+                element, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break  # element continues in the next chunk
+            # A number cut at '1.' or '3e' decodes as its prefix, so a bare
+            # value is only complete once a separator follows it
+            if not isinstance(element, (dict, list, str)) and buffer[end:end + 1] not in _SCALAR_ENDS:
+                break
+            yield element
+            position = end
+        buffer = buffer[position:]
+    raise ValueError("Truncated JSON array")
+
+
+def content_hash(product):
+    """Stable fingerprint of an upstream product payload"""
+    payload = json.dumps(product, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def _simulated(key):
+    """Per-product RNG, so simulated ratings/reviews are the same on every sync"""
+    return random.Random(f"ml-sync:{key}")
+
+
+def nodejs_product_key(product):
+    return normalize_id(product.get("_id") or product.get("id"))
+
+
+def dummyjson_product_key(product):
+    return normalize_id(product.get("id", 0) + 1000)
+
+
+def nodejs_to_ml_product(product, tags=None):
+    """Convert a Node.js backend product (MongoDB or DummyJSON) to ML format"""
+    product_id = product.get("_id") or product.get("id")
+    simulated = _simulated(nodejs_product_key(product))
+    rating = round(simulated.uniform(3.5, 5.0), 1)
+    reviews = simulated.randint(10, 500)
+    return {
+        "id": product_id,
+        "name": product.get("name") or product.get("title"),
+        "price": float(product.get("price", 0)),
+        "image": product.get("image") or product.get("thumbnail"),
+        "description": product.get("description", ""),
+        "category": product.get("category", "Others"),
+        "rating": product.get("rating", rating),
+        "reviews": product.get("reviews", reviews),
+        "tags": tags if tags is not None else extract_tags(
+            product.get("name") or product.get("title", ""),
+            product.get("description", "")
+        )
+    }
+
+
+def dummyjson_to_ml_product(product, tags=None):
+    """Convert a DummyJSON product to ML format with its frontend ID (+1000)"""
+    simulated = _simulated(dummyjson_product_key(product))
+    rating = round(simulated.uniform(3.5, 5.0), 1)
+    reviews = simulated.randint(10, 500)
+    return {
+        "id": product.get("id", 0) + 1000,
+        "name": product.get("title", ""),
+        "price": float(product.get("price", 0)),
+        "image": product.get("thumbnail", ""),
+        "description": product.get("description", ""),
+        "category": product.get("category", "Others"),
+        "rating": product.get("rating", rating),
+        "reviews": reviews,
+        "tags": tags if tags is not None else extract_tags(
+            product.get("title", ""),
+            product.get("description", "")
+        )
+    }
+
+
+# source -> (id key, converter), in merge order: later sources win on shared ids
+SOURCES = {
+    "nodejs": (nodejs_product_key, nodejs_to_ml_product),
+    "dummyjson": (dummyjson_product_key, dummyjson_to_ml_product),
+}
+
+
+def fetch_nodejs_products(session, base_url, timeout=DEFAULT_TIMEOUT, since=None):
+    """Stream the raw Node.js product list, parsing products as they arrive.
+
+    Returns ``(products, watermark)``; the watermark is None unless the
+    backend sends one.
+    """
+    params = {"since": since} if since else None
+    with session.get(f"{base_url}/api/products", params=params, stream=True, timeout=timeout) as response:
+        response.raise_for_status()
+        response.encoding = response.encoding or 'utf-8'
+        chunks = response.iter_content(STREAM_CHUNK_SIZE, decode_unicode=True)
+        return list(iter_json_array(chunks)), response.headers.get(WATERMARK_HEADER)
+
+
+def fetch_dummyjson_products(session, url, limit=DUMMYJSON_LIMIT,
+                             page_size=DUMMYJSON_PAGE_SIZE, timeout=DEFAULT_TIMEOUT):
+    """Fetch raw DummyJSON products page by page"""
+    products = []
+    while len(products) < limit:
+        response = session.get(
+            url,
+            params={"limit": min(page_size, limit - len(products)), "skip": len(products)},
+            timeout=timeout
+        )
+        response.raise_for_status()
+        page = response.json().get("products", [])
+        products.extend(page)
+        if len(page) < page_size:
+            break
+    return products
+
+
+def fetch_upstream(node_url, dummyjson_url, session=None, timeout=DEFAULT_TIMEOUT, since=None):
+    """Fetch both upstream sources concurrently.
+
+    Returns ``(upstream, watermark)`` where ``upstream`` maps each source to
+    its raw product list, or None if it failed.
+    """
+    upstream = {source: None for source in SOURCES}
+    if not REQUESTS_AVAILABLE:
+        log.error("❌ Cannot sync products: 'requests' module not available")
+        return upstream, None
+
+    session = session or make_session()
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix="sync") as pool:
+        futures = {
+            "nodejs": pool.submit(fetch_nodejs_products, session, node_url, timeout, since),
+            "dummyjson": pool.submit(fetch_dummyjson_products, session, dummyjson_url, timeout=timeout)
+        }
+
+    watermark = None
+    for source, future in futures.items():
+        try:
+            result = future.result()
+            if source == "nodejs":
+                result, watermark = result
+            upstream[source] = result
+            log.info("✅ Fetched %d products from %s", len(result), source,
+                     extra={"source": source, "products": len(result)})
+        except Exception as e:
+            log.error("❌ Error syncing %s products: %s", source, e, extra={"source": source})
+    return upstream, watermark
+
+
+def _merged(upstream):
+    """``key -> (source, raw product)`` across sources, later sources winning"""
+    merged = {}
+    for source, (key_of, _) in SOURCES.items():
+        for product in upstream.get(source) or ():
+            # Keeps the first position, like catalog.add replacing a row
+            merged[key_of(product)] = (source, product)
+    return merged
+
+
+def convert_products(items):
+    """Convert ``(source, raw product)`` pairs to ML format, tagging them in one batch"""
+    products = [SOURCES[source][1](product, tags=[]) for source, product in items]
+    all_tags = extract_tags_batch((product["name"], product["description"]) for product in products)
+    for product, tags in zip(products, all_tags):
+        product["tags"] = tags
+    return products
+
+
+def build_catalog(upstream):
+    """Convert every fetched product into a new, unpublished catalog"""
+    merged = _merged(upstream)
+    catalog = ProductCatalog(capacity=len(merged))
+    for (key, (_, raw)), product in zip(merged.items(), convert_products(merged.values())):
+        catalog.add(product)
+        catalog.content_hashes[key] = content_hash(raw)
+    return catalog
+
+
+def diff_upstream(catalog, upstream, partial=False):
+    """Compare fetched products with the catalog by id and content hash.
+
+    ``changed`` lists ``(key, hash, ml_product)`` for new or modified
+    products (only these are converted and re-tagged), ``removed`` the
+    keys that disappeared upstream. Removals are only inferred from
+    complete payloads: never when ``partial`` (a ``since`` response) or
+    when a source failed to fetch.
+    """
+    merged = _merged(upstream)
+    pending = []
+    unchanged = 0
+    for key, (source, product) in merged.items():
+        digest = content_hash(product)
+        if catalog.content_hashes.get(key) == digest and key in catalog.id_index:
+            unchanged += 1
+            continue
+        pending.append((key, digest, source, product))
+
+    converted = convert_products((source, product) for _, _, source, product in pending)
+    changed = [(key, digest, product) for (key, digest, _, _), product in zip(pending, converted)]
+
+    removed = []
+    if not partial and all(products is not None for products in upstream.values()):
+        removed = [key for key in catalog.id_index if key not in merged]
+    return CatalogDelta(changed, removed, unchanged)
+
+
+def delta_too_large(catalog, delta):
+    """True when applying a delta row by row would cost more than a rebuild"""
+    touched = len(delta.changed) + len(delta.removed)
+    return touched > MAX_DELTA_FRACTION * max(len(catalog), 1)
+
+
+class SyncScheduler:
+    """Run a sync callable on a daemon thread, once now and then every ``interval`` seconds.
+
+    An ``interval`` of 0 runs the sync once.
+    """
+
+    def __init__(self, sync, interval=0):
+        self.sync = sync
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="catalog-sync", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception as e:
+                log.exception("❌ Scheduled sync failed: %s", e)
+            if not self.interval or self._stop.wait(self.interval):
+                break
@@ -0,0 +1,150 @@
+import bisect
+import json
+import os
+import re
+
+# Common product attributes to look for when no vocabulary file is configured
+DEFAULT_KEYWORDS = [
+    'wireless', 'bluetooth', 'smart', 'premium', 'portable', 'waterproof',
+    'leather', 'cotton', 'organic', 'eco-friendly', 'rechargeable',
+    'lightweight', 'durable', 'comfortable', 'stylish', 'modern',
+    'vintage', 'classic', 'professional', 'gaming', 'fitness'
+]
+
+MAX_TAGS = 5
+
+# Vocabulary shipped next to this module; TAG_VOCABULARY_PATH overrides it
+VOCABULARY_PATH = os.environ.get(
+    "TAG_VOCABULARY_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "tag_vocabulary.txt")
+)
+
+# Word characters for boundary purposes ('eco-friendly' is one term)
+_WORD = r"[\w-]"
+
+
+def load_vocabulary(path):
+    """Read a vocabulary from a JSON list or a text file with one term per line.
+
+    Blank lines and lines starting with '#' are ignored. Terms are
+    lowercased; their order is the tag priority order.
+    """
+    with open(path, encoding='utf-8') as f:
+        if path.endswith('.json'):
+            terms = json.load(f)
+        else:
+            terms = [line.strip() for line in f if line.strip() and not line.lstrip().startswith('#')]
+    return [term.lower() for term in terms]
+
+
+def _trie_pattern(terms):
+    """Regex alternation factored into a character trie.
+
+    Matching walks one branch per character instead of trying every term
+    at every position, so cost does not grow with vocabulary size.
+    """
+    trie = {}
+    for term in terms:
+        node = trie
+        for char in term:
+            node = node.setdefault(char, {})
+        node[''] = True
+
+    def pattern(node):
+        terminal = '' in node
+        branches = [re.escape(char) + pattern(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return '(?:' + body + ')?' if terminal else body
+
+    return pattern(trie)
+
+
+class TagExtractor:
+    """Single-pass tag extraction over a compiled vocabulary.
+
+    Terms only match whole words, so 'classic' does not fire inside
+    'neoclassical'. Every match start is considered, so overlapping
+    terms ('smart home' and 'home') are both found. The regex reports the
+    longest term at each start; shorter terms at the same start ('smart'
+    in 'smart home') are its prefixes and are added from a table. Tags are
+    returned in vocabulary order, at most ``max_tags`` of them.
+    """
+
+    def __init__(self, vocabulary=DEFAULT_KEYWORDS, max_tags=MAX_TAGS):
+        self.vocabulary = list(dict.fromkeys(term.lower() for term in vocabulary if term))
+        self.priority = {term: i for i, term in enumerate(self.vocabulary)}
+        self.max_tags = max_tags
+        # term -> the term and every vocabulary term that is a whole-word prefix of it
+        self.nested = {
+            term: [term] + [
+                term[:end] for end in range(1, len(term))
+                if term[:end] in self.priority and not re.match(_WORD, term[end])
+            ]
+            for term in self.vocabulary
+        }
+        self.regex = re.compile(
+            rf"(?<!{_WORD})(?=({_trie_pattern(self.vocabulary)})(?!{_WORD}))"
+        ) if self.vocabulary else None
+
+    @classmethod
+    def from_file(cls, path, max_tags=MAX_TAGS):
+        return cls(load_vocabulary(path), max_tags)
+
+    def _select(self, found):
+        return sorted(found, key=self.priority.__getitem__)[:self.max_tags]
+
+    def _matches(self, text):
+        """All vocabulary terms occurring at any word start in ``text``"""
+        found = set()
+        for match in self.regex.finditer(text):
+            found.update(self.nested[match.group(1)])
+        return found
+
+    def extract(self, name, description):
+        """Tags for one product"""
+        if self.regex is None:
+            return []
+        text = ((name or "") + " " + (description or "")).lower()
+        return self._select(self._matches(text))
+
+    def extract_batch(self, texts):
+        """Tags for many ``(name, description)`` pairs with one regex scan.
+
+        The texts are joined with newlines (a word boundary) and every match
+        is mapped back to its product by offset.
+        """
+        texts = list(texts)
+        if self.regex is None:
+            return [[] for _ in texts]
+        documents = [((name or "") + " " + (description or "")).lower() for name, description in texts]
+        starts = []
+        offset = 0
+        for document in documents:
+            starts.append(offset)
+            offset += len(document) + 1
+
+        found = [set() for _ in documents]
+        for match in self.regex.finditer("\n".join(documents)):
+            found[bisect.bisect_right(starts, match.start()) - 1].update(self.nested[match.group(1)])
+        return [self._select(tags) for tags in found]
+
+
+def _default_extractor():
+    if os.path.exists(VOCABULARY_PATH):
+        return TagExtractor.from_file(VOCABULARY_PATH)
+    return TagExtractor(DEFAULT_KEYWORDS)
+
+
+default_extractor = _default_extractor()
+
+
+def extract_tags(name, description):
+    """Extract relevant tags from product name and description"""
+    return default_extractor.extract(name, description)
+
+
+def extract_tags_batch(texts):
+    """Extract tags for many ``(name, description)`` pairs in one pass"""
+    return default_extractor.extract_batch(texts)
@@ -0,0 +1,39 @@
+import os
+import random
+import sys
+
+import pytest
+
+# The service modules live flat in ml-backend/
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import ProductCatalog  # noqa: E402
+
+CATEGORIES = ['smartphones', 'laptops', 'groceries', 'furniture', 'tops']
+TAGS = ['wireless', 'smart', 'premium', 'portable', 'leather', 'organic', 'gaming', 'fitness']
+
+
+def make_product(rng, product_id):
+    """A random product; prices repeat so ties are exercised"""
+    return {
+        'id': product_id,
+        'name': f"Product {product_id}",
+        'description': ' '.join(rng.sample(TAGS, 3)),
+        'price': rng.choice([5, 10, 12.5, 20, 40, 80]),
+        'category': rng.choice(CATEGORIES),
+        'rating': rng.choice([3, 4, 4.5, 5]),
+        'reviews': rng.randint(0, 50),
+        'tags': rng.sample(TAGS, rng.randint(0, 4))
+    }
+
+
+@pytest.fixture
+def rng():
+    return random.Random(7)
+
+
+@pytest.fixture
+def catalog(rng):
+    catalog = ProductCatalog()
+    catalog.extend([make_product(rng, product_id) for product_id in range(1, 121)])
+    return catalog
@@ -0,0 +1,141 @@
+import random
+from collections import Counter
+
+import pytest
+
+from analytics import DEFAULT_PRECISION, HyperLogLog, SpaceSaving, StreamingAnalytics
+
+CAPACITY = 50
+BUCKET_CAPACITY = 20
+WINDOWS = (("last_hour", 3600, 12), ("last_day", 86400, 24))
+
+# Four standard errors of the HyperLogLog estimate
+DISTINCT_TOLERANCE = 4 * 1.04 / (2 ** DEFAULT_PRECISION) ** 0.5
+
+
+def zipf_batches(rng, batches, products=2000, users=20000):
+    """``(views, purchases, user_ids)`` batches with a few heavy products"""
+    weights = [1 / rank for rank in range(1, products + 1)]
+    ids = [str(product_id) for product_id in range(products)]
+    for _ in range(batches):
+        views = Counter(rng.choices(ids, weights, k=rng.randint(50, 150)))
+        purchases = Counter(rng.choices(ids, weights, k=rng.randint(0, 15)))
+        yield views, purchases, [f"user-{rng.randrange(users)}" for _ in range(rng.randint(5, 30))]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def assert_close_to(approximate, exact, capacity, k):
+    """``approximate`` is a top-``k`` report, ``exact`` one listing every product"""
+    assert approximate["views"] == exact["views"]
+    assert approximate["purchases"] == exact["purchases"]
+    assert approximate["distinct_users"] == pytest.approx(exact["distinct_users"], rel=DISTINCT_TOLERANCE)
+    for kind, total in (("viewed", exact["views"]), ("purchased", exact["purchases"])):
+        approximate_top = approximate[f"most_{kind}_products"]
+        exact_counts = exact[f"most_{kind}_products"]
+        # Space-Saving only overestimates, by at most total / capacity
+        error = total / capacity
+        for product_id, count in approximate_top.items():
+            assert exact_counts[product_id] <= count <= exact_counts[product_id] + error
+        # So nothing ranks in place of a product more than that ahead of it
+        kth = sorted(exact_counts.values(), reverse=True)[k - 1]
+        assert len(approximate_top) == k
+        assert all(exact_counts[product_id] >= kth - error for product_id in approximate_top)
+
+
+@pytest.fixture
+def fed():
+    rng = random.Random(3)
+    clock = Clock()
+    approximate = StreamingAnalytics(CAPACITY, windows=WINDOWS, clock=clock, bucket_capacity=BUCKET_CAPACITY)
+    exact = StreamingAnalytics(windows=WINDOWS, exact=True, clock=clock)
+    # About three hours of traffic, with a restored history up front
+    history = next(zipf_batches(rng, 1))
+    for analytics in (approximate, exact):
+        analytics.update(*history, historical=True)
+    for views, purchases, user_ids in zipf_batches(rng, 1200):
+        clock.now += 9
+        for analytics in (approximate, exact):
+            analytics.update(views, purchases, user_ids)
+    return approximate, exact, history
+
+
+def test_approximate_report_matches_exact_within_bounds(fed):
+    approximate, exact, _ = fed
+    approximate_report = approximate.report(k=5)
+    exact_report = exact.report(k=10 ** 6)
+    assert approximate_report.keys() == exact_report.keys() == {"all_time", "last_hour", "last_day"}
+    for name, capacity in (("all_time", CAPACITY), ("last_hour", BUCKET_CAPACITY), ("last_day", BUCKET_CAPACITY)):
+        assert_close_to(approximate_report[name], exact_report[name], capacity, k=5)
+
+
+def test_windows_leave_out_history_and_old_buckets(fed):
+    _, exact, (views, purchases, _) = fed
+    report = exact.report()
+    assert report["all_time"]["views"] == report["last_day"]["views"] + sum(views.values())
+    assert report["all_time"]["purchases"] == report["last_day"]["purchases"] + sum(purchases.values())
+    # 1200 batches 9s apart span three hours; the last hour holds about a third
+    assert 0.25 < report["last_hour"]["views"] / report["last_day"]["views"] < 0.4
+
+
+def test_windows_empty_out():
+    clock = Clock()
+    analytics = StreamingAnalytics(windows=WINDOWS, clock=clock)
+    analytics.update({"1": 3}, {"1": 1}, ["alice"])
+    clock.now += 3600 + 300
+    report = analytics.report()
+    assert report["last_hour"]["views"] == 0 and report["last_hour"]["distinct_users"] == 0
+    assert report["last_day"]["views"] == 3
+    clock.now += 86400
+    assert analytics.report()["last_day"]["views"] == 0
+    assert analytics.report()["all_time"]["most_viewed_products"] == {"1": 3}
+
+
+def test_space_saving_bounds():
+    rng = random.Random(5)
+    summary = SpaceSaving(CAPACITY)
+    exact = Counter()
+    for views, _, _ in zipf_batches(rng, 300):
+        summary.add(views)
+        exact.update(views)
+    error = summary.total / CAPACITY
+    assert summary.total == sum(exact.values())
+    assert len(summary.counts) == CAPACITY
+    for product_id, count in summary.counts.items():
+        assert exact[product_id] <= count <= exact[product_id] + error
+    assert {product_id for product_id, count in exact.items() if count > error} <= set(summary.counts)
+
+
+@pytest.mark.parametrize("distinct", [10, 1000, 50000])
+def test_hyperloglog_estimate(distinct):
+    sketch = HyperLogLog()
+    half = HyperLogLog()
+    keys = [f"user-{i}" for i in range(distinct)]
+    sketch.add(keys)
+    half.add(keys[::2])
+    assert sketch.count() == pytest.approx(distinct, rel=DISTINCT_TOLERANCE)
+    # Merging a subset changes nothing
+    sketch.merge(half)
+    assert sketch.count() == pytest.approx(distinct, rel=DISTINCT_TOLERANCE)
+
+
+def test_merged_space_saving_only_overestimates():
+    rng = random.Random(9)
+    merged = SpaceSaving(CAPACITY)
+    exact = Counter()
+    for _ in range(24):
+        bucket = SpaceSaving(BUCKET_CAPACITY)
+        for views, _, _ in zipf_batches(rng, 20):
+            bucket.add(views)
+            exact.update(views)
+        merged.merge(bucket)
+    error = merged.total / BUCKET_CAPACITY
+    for product_id, count in merged.counts.items():
+        assert exact[product_id] <= count <= exact[product_id] + error
+    assert {product_id for product_id, count in exact.items() if count > error} <= set(merged.counts)
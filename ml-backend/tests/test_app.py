@@ -0,0 +1,154 @@
+import json
+import os
+import threading
+import time
+
+import pytest
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app  # noqa: E402
+import snapshot  # noqa: E402
+from counters import CounterStore  # noqa: E402
+from popularity import PopularityIndex  # noqa: E402
+from state import CatalogState  # noqa: E402
+
+
+def test_new_state_catches_up_with_flushes_before_publish(catalog):
+    new_state, counts = app.new_catalog_state(catalog)
+    app.counter_store.record_events([("view", "5")] * 50 + [("purchase", "7")] * 40 + [("view", "9")])
+    # The flush re-ranks the published state, not the one about to replace it
+    app.counter_store.flush()
+    assert list(new_state.popularity) != list(PopularityIndex.build(catalog, app.product_views, app.product_purchases))
+    with app.write_lock:
+        app.catch_up_counters(new_state, counts)
+    assert list(new_state.popularity) == list(PopularityIndex.build(catalog, app.product_views, app.product_purchases))
+
+
+def test_warm_start_publishes_the_latest_snapshot(monkeypatch, tmp_path, catalog):
+    source = CatalogState(catalog, {"3": 40}, {"5": 7}, co_purchases=app.co_purchases)
+    source.build_neighbors(threading.Lock())
+    counters = CounterStore()
+    counters.restore({"3": 40}, {"5": 7}, {"user-1": ["5"]})
+    snapshot.write_snapshot(tmp_path, snapshot.capture_snapshot(source, counters, watermark="w9"))
+
+    writer = snapshot.SnapshotWriter(tmp_path, app.capture_current_snapshot, app.snapshot_signature, interval=0)
+    monkeypatch.setattr(app, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "snapshot_writer", writer)
+    monkeypatch.setattr(app, "state", app.state)
+    monkeypatch.setattr(app, "sync_watermark", None)
+
+    assert app.warm_start()
+    current = app.state
+    assert current.catalog.to_list() == catalog.to_list()
+    assert current.neighbors.is_current(current.catalog)
+    assert app.sync_watermark == "w9"
+    assert app.product_views["3"] == 40 and app.counter_store.user_purchases["user-1"] == ["5"]
+    # Just loaded: nothing new to write until something changes
+    assert writer.write() is None
+
+
+def test_warm_start_without_snapshot(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, "SNAPSHOT_DIR", str(tmp_path))
+    monkeypatch.setattr(app, "state", app.state)
+    assert not app.warm_start()
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # No flusher, snapshot writer or upstream sync behind the test's back
+    monkeypatch.setattr(app, "start_background_work", lambda: None)
+    monkeypatch.setattr(app, "counter_store", CounterStore(max_pending=5))
+    return app.app.test_client()
+
+
+EVENTS = [
+    {"type": "view", "product_id": 1},
+    {"type": "view", "product_id": "1"},
+    {"type": "purchase", "product_id": 2, "user_id": 7},
+    {"type": "purchase", "product_id": 3},
+]
+INVALID = [{"type": "view"}, {"type": "click", "product_id": 1}, "view", None]
+
+
+def ndjson(events):
+    return "\n".join(json.dumps(event) for event in events) + "\n"
+
+
+@pytest.mark.parametrize("body, content_type", [
+    (json.dumps(EVENTS + INVALID), "application/json"),
+    (json.dumps({"events": EVENTS + INVALID}), "application/json"),
+    (ndjson(EVENTS + INVALID), "application/x-ndjson"),
+    ("\n" + ndjson(EVENTS + INVALID), "application/jsonl"),
+])
+def test_track_events_bodies(client, body, content_type):
+    response = client.post("/track-events", data=body, content_type=content_type)
+    assert response.status_code == 202
+    assert response.get_json() == {"accepted": 4, "dropped": 0, "invalid": 4}
+    app.counter_store.flush()
+    assert app.counter_store.snapshot() == ({"1": 2}, {"2": 1, "3": 1}, {"7": ["2"]})
+
+
+@pytest.mark.parametrize("body, content_type", [
+    ("{not json", "application/json"),
+    (json.dumps({"event": EVENTS}), "application/json"),
+    ('{"type": "view", "product_id": 1}\n{', "application/x-ndjson"),
+])
+def test_track_events_rejects_malformed_bodies(client, body, content_type):
+    assert client.post("/track-events", data=body, content_type=content_type).status_code == 400
+
+
+def test_track_events_limits_batch_size(client, monkeypatch):
+    monkeypatch.setattr(app, "TRACK_EVENTS_MAX", 3)
+    assert client.post("/track-events", json=EVENTS).status_code == 413
+    assert client.post("/track-events", json=EVENTS[:3]).status_code == 202
+
+
+def test_track_events_full_buffer_accepts_what_fits(client):
+    response = client.post("/track-events", data=ndjson(EVENTS + EVENTS), content_type="application/x-ndjson")
+    assert response.status_code == 429
+    assert response.headers["Retry-After"] == "1"
+    assert response.get_json() == {"accepted": 5, "dropped": 3, "invalid": 0}
+    assert app.counter_store.dropped == 3
+
+    # The accepted prefix is applied, in order
+    app.counter_store.flush()
+    assert app.counter_store.snapshot() == ({"1": 3}, {"2": 1, "3": 1}, {"7": ["2"]})
+    response = client.post("/track-events", json=EVENTS)
+    assert response.status_code == 202 and response.get_json()["accepted"] == 4
+
+
+def test_background_work_starts_once_under_concurrent_first_requests(monkeypatch):
+    started = []
+    monkeypatch.setattr(app, "background_started", threading.Event())
+    monkeypatch.setattr(app, "snapshot_writer", None)
+    monkeypatch.setattr(app, "counter_store", CounterStore())
+    monkeypatch.setattr(app.counter_store, "start", lambda: started.append("counters") or time.sleep(0.05))
+    monkeypatch.setattr(app, "start_background_sync", lambda: started.append("sync"))
+
+    barrier = threading.Barrier(8)
+    threads = [threading.Thread(target=lambda: (barrier.wait(), app.start_background_work())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert started == ["counters", "sync"]
+    assert app.background_started.is_set()
+
+
+def test_stale_vocabulary_turns_the_scheduled_sync_into_a_full_one(monkeypatch, catalog):
+    runs = []
+    monkeypatch.setattr(app, "SYNC_MODE", "incremental")
+    monkeypatch.setattr(app, "state", CatalogState(catalog, {}, {}))
+    monkeypatch.setattr(app, "run_sync", lambda sync, mode: runs.append(mode))
+    app.scheduled_sync()
+    monkeypatch.setattr(app.state.content, "needs_refit", lambda: True)
+    app.scheduled_sync()
+    assert runs == ["incremental", "full"]
+
+
+def test_analytics_lists_categories_in_catalog_order(client, monkeypatch, catalog):
+    monkeypatch.setattr(app, "state", CatalogState(catalog, {}, {}))
+    body = client.get("/analytics").get_json()
+    assert body["categories"] == catalog.category_names
+    assert body["total_products"] == len(catalog)
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+import threading
+
+import pytest
+
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+import app  # noqa: E402
+import asgi  # noqa: E402
+from counters import CounterStore  # noqa: E402
+from state import CatalogState  # noqa: E402
+
+DISALLOWED = "https://elsewhere.example"
+ORIGINS = app.CORS_ORIGINS + [DISALLOWED, None]
+
+
+@pytest.fixture(autouse=True)
+def quiet(monkeypatch):
+    # No flusher, snapshot writer or upstream sync behind the test's back
+    monkeypatch.setattr(app, "start_background_work", lambda: None)
+    monkeypatch.setattr(asgi, "start_background_work", lambda: None)
+    monkeypatch.setattr(app, "counter_store", CounterStore(max_pending=3))
+
+
+def call(method, path, body=b"", headers=(), query=b"", chunk=None):
+    """Drive the ASGI app once; returns every message it sent"""
+    chunk = chunk or max(len(body), 1)
+    messages = [
+        {"type": "http.request", "body": body[start:start + chunk], "more_body": start + chunk < len(body)}
+        for start in range(0, max(len(body), 1), chunk)
+    ]
+    sent = []
+
+    async def receive():
+        return messages.pop(0) if messages else {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "method": method, "path": path, "query_string": query, "headers": list(headers),
+        "http_version": "1.1", "scheme": "http", "server": ("127.0.0.1", 5001), "client": ("127.0.0.1", 40000),
+    }
+    asyncio.run(asgi.application(scope, receive, send))
+    return sent
+
+
+def response_of(sent):
+    start = sent[0]
+    assert start["type"] == "http.response.start"
+    assert all(message["type"] == "http.response.body" for message in sent[1:])
+    assert not sent[-1].get("more_body", False)
+    headers = {name.decode(): value.decode() for name, value in start["headers"]}
+    return start["status"], headers, b"".join(message.get("body", b"") for message in sent[1:])
+
+
+def cors(headers):
+    return {name: value for name, value in headers.items() if name.startswith("access-control-") or name == "vary"}
+
+
+@pytest.mark.parametrize("origin", ORIGINS)
+def test_track_view_round_trip(origin):
+    headers = [(b"content-type", b"application/json")]
+    if origin is not None:
+        headers.append((b"origin", origin.encode()))
+    status, response_headers, body = response_of(
+        call("POST", "/track-view", b'{"product_id": 1001}', headers, chunk=5)
+    )
+    assert status == 200
+    assert json.loads(body) == {"message": "View tracked"}
+    assert int(response_headers["content-length"]) == len(body)
+
+    # Same CORS headers as the Flask route would have sent
+    flask = app.app.test_client().post(
+        "/track-view", json={"product_id": 1001}, headers={"Origin": origin} if origin else {}
+    )
+    assert cors(response_headers) == cors({name.lower(): value for name, value in flask.headers.items()})
+    assert ("access-control-allow-origin" in response_headers) == (origin != DISALLOWED)
+
+    # One view each from the event loop and the Flask route
+    app.counter_store.flush()
+    assert app.counter_store.views == {"1001": 2}
+
+
+def test_track_view_answers_429_when_the_buffer_is_full():
+    statuses = [response_of(call("POST", "/track-view", b'{"product_id": 5}'))[0] for _ in range(4)]
+    assert statuses == [200, 200, 200, 429]
+    status, headers, body = response_of(call("POST", "/track-view", b"[1]"))
+    assert status == 400 and b"error" in body
+
+
+def test_streamed_batch_is_relayed_as_produced(monkeypatch, catalog):
+    state = CatalogState(catalog, {}, {}, co_purchases=app.co_purchases)
+    state.build_neighbors(threading.Lock())
+    monkeypatch.setattr(app, "state", state)
+    entries = [{"user_id": i, "history": [{"id": i + 1}, {"id": i + 7}], "limit": 4} for i in range(6)]
+    body = json.dumps({"requests": entries}).encode()
+
+    sent = call("POST", "/recommend/batch", body, [(b"content-type", b"application/json")], query=b"stream=1")
+    status, headers, streamed = response_of(sent)
+    assert status == 200
+    assert headers["content-type"] == "application/x-ndjson"
+    # One body message per NDJSON line, not one buffered response
+    assert len([message for message in sent[1:] if message.get("body")]) == len(entries)
+
+    expected = app.app.test_client().post("/recommend/batch?stream=1", json={"requests": entries})
+    assert streamed == expected.data
+    assert len(streamed.splitlines()) == len(entries)
@@ -0,0 +1,21 @@
+from catalog import ProductCatalog, normalize_id
+
+
+def test_normalize_id():
+    assert normalize_id(1001) == normalize_id(1001.0) == normalize_id(' 1001 ') == '1001'
+    assert normalize_id({'$oid': '65A1B2C3D4E5F60718293A4B'}) == '65a1b2c3d4e5f60718293a4b'
+
+
+def test_next_numeric_id_skips_object_ids():
+    catalog = ProductCatalog()
+    catalog.add({'id': 1001})
+    catalog.add({'id': '650000000000000000000123'})
+    catalog.add({'id': '65a1b2c3d4e5f60718293a4b'})
+    assert catalog.next_numeric_id() == 1002
+
+
+def test_next_numeric_id_is_not_reused_after_delete():
+    catalog = ProductCatalog()
+    catalog.add({'id': 5})
+    catalog.remove(5)
+    assert catalog.next_numeric_id() == 6
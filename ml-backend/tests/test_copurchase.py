@@ -0,0 +1,65 @@
+import pytest
+
+from copurchase import CoPurchaseIndex
+
+
+def test_version_moves_only_for_touched_products():
+    index = CoPurchaseIndex(half_life=None)
+    index.update([([], ['a', 'b']), ([], ['c', 'd'])])
+    cart = {'a'}
+    version = index.version(cart)
+    index.update([([], ['c', 'e'])])
+    assert index.version(cart) == version
+    index.update([([], ['b', 'f'])])
+    assert index.version(cart) == version
+    index.update([(['a', 'b'], ['a', 'b', 'g'])])
+    assert index.version(cart) > version
+    assert index.version({'unseen'}) == 0
+
+
+def test_top_holds_while_version_holds(rng):
+    index = CoPurchaseIndex(half_life=None)
+    ids = [str(product_id) for product_id in range(60)]
+    carts = [frozenset(rng.sample(ids, rng.randint(1, 3))) for _ in range(50)]
+    seen = {}
+    reused = 0
+    for _ in range(200):
+        for cart in carts:
+            version = index.version(cart)
+            top = index.top(cart, 6)
+            if cart in seen and seen[cart][0] == version:
+                assert seen[cart][1] == top
+                reused += 1
+            seen[cart] = (version, top)
+        index.update([([], rng.sample(ids, rng.randint(2, 4)))])
+    assert reused
+
+
+@pytest.mark.parametrize("normalization", ["cosine", "lift"])
+def test_cached_lists_follow_partner_counts(rng, normalization):
+    index = CoPurchaseIndex(half_life=None, normalization=normalization)
+    ids = [str(product_id) for product_id in range(30)]
+    baskets = []
+    for _ in range(150):
+        basket = ([], rng.sample(ids, rng.randint(1, 4)))
+        baskets.append(basket)
+        index.update([basket])
+        cart = rng.sample(ids, rng.randint(1, 2))
+        cached = index.top(cart, 5)
+        # Built from scratch, nothing cached
+        fresh = CoPurchaseIndex(half_life=None, normalization=normalization)
+        fresh.update(baskets)
+        expected = fresh.top(cart, 5)
+        assert [product_id for product_id, _ in cached] == [product_id for product_id, _ in expected]
+        assert [score for _, score in cached] == pytest.approx([score for _, score in expected])
+
+
+def test_partner_purchase_moves_the_version_of_lists_holding_it():
+    index = CoPurchaseIndex(half_life=None)
+    index.update([([], ['a', 'b']), ([], ['a', 'c'])])
+    index.top({'a'}, 2)
+    version = index.version({'a'})
+    # 'b' is bought alone: no pair with 'a' changes, but its normalization does
+    index.update([([], ['b'])])
+    assert index.version({'a'}) > version
+    assert [product_id for product_id, _ in index.top({'a'}, 2)] == ['c', 'b']
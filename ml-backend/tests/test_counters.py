@@ -0,0 +1,104 @@
+import pytest
+
+from counters import CounterStore
+
+
+@pytest.fixture
+def shared(tmp_path):
+    return str(tmp_path / "counters.sqlite3")
+
+
+def recorder(calls):
+    return lambda *args: calls.append(args)
+
+
+def test_two_stores_converge_on_a_shared_file(shared):
+    changes = []
+    first = CounterStore(shared, on_change=changes.append)
+    second = CounterStore(shared)
+    first.record_events([("view", "1")] * 3 + [("purchase", "2", "alice")])
+    second.record_events([("view", "1")] * 2 + [("view", "3"), ("purchase", "2", "bob"), ("purchase", "4", "alice")])
+
+    first.flush()
+    second.flush()
+    # The second store's batch reaches the first on its next flush
+    assert first.flush() == {"1", "2", "3", "4"}
+    assert changes[-1] == {"1", "2", "3", "4"}
+
+    for store in (first, second):
+        assert store.snapshot() == (
+            {"1": 5, "3": 1},
+            {"2": 2, "4": 1},
+            {"alice": ["2", "4"], "bob": ["2"]},
+        )
+
+
+def test_first_read_of_a_shared_file_is_history(shared):
+    writer = CounterStore(shared)
+    writer.record_events([("view", "1")] * 4 + [("purchase", "2", "alice")])
+    writer.flush()
+
+    events = []
+    reader = CounterStore(shared, on_events=recorder(events))
+    reader.record_events([("view", "1"), ("view", "5")])
+    reader.flush()
+    assert events == [
+        ({"1": 4}, {"2": 1}, ["alice"], True),
+        ({"1": 1, "5": 1}, {}, [], False),
+    ]
+
+    writer.record_view("5")
+    writer.flush()
+    reader.flush()
+    assert events[-1] == ({"5": 1}, {}, [], False)
+    assert reader.views == {"1": 5, "5": 2}
+
+
+def test_forgotten_user_is_merged_back_from_the_file(shared):
+    baskets = []
+    store = CounterStore(shared, max_users=1, on_baskets=baskets.extend)
+    store.record_events([("purchase", "1", "alice"), ("purchase", "2", "alice")])
+    store.flush()
+    store.record_events([("purchase", "3", "bob")])
+    store.flush()
+    assert "alice" not in store.user_purchases
+    assert store.users_evicted == 1
+
+    # Only the new product is known locally; the file has the rest
+    store.record_events([("purchase", "4", "alice")])
+    store.flush()
+    assert store.user_purchases == {"alice": ["1", "2", "4"]}
+    assert baskets[-1] == ([], ["1", "2", "4"])
+    other = CounterStore(shared)
+    other.flush()
+    assert other.user_purchases == {"alice": ["1", "2", "4"], "bob": ["3"]}
+
+
+def test_least_recently_active_users_are_evicted():
+    store = CounterStore(max_users=2, max_history=2)
+    store.record_purchases("alice", ["1"])
+    store.record_purchases("bob", ["2"])
+    store.flush()
+    store.record_events([("purchase", "3", "alice")])
+    store.flush()
+    store.record_purchases("carol", ["4", "5", "6"])
+    store.flush()
+    assert list(store.user_purchases) == ["alice", "carol"]
+    assert store.user_purchases == {"alice": ["1", "3"], "carol": ["5", "6"]}
+    assert store.users_evicted == 1
+
+
+def test_full_buffer_drops_and_counts():
+    store = CounterStore(max_pending=4)
+    assert [store.record_view("1") for _ in range(3)] == [True, True, True]
+    # All or nothing: two events do not fit in one free slot
+    assert not store.record_purchases("alice", ["2"])
+    assert store.record_events([("view", "3"), ("view", "4"), ("view", "5")]) == 1
+    assert not store.record_view("6")
+    assert store.dropped == 2 + 2 + 1
+
+    store.flush()
+    assert store.views == {"1": 3, "3": 1}
+    assert store.user_purchases == {}
+    assert store.events_applied == 4
+    assert store.record_purchases("alice", ["2"])
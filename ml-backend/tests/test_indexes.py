@@ -0,0 +1,165 @@
+import threading
+
+import numpy as np
+import pytest
+
+import content as content_module
+from catalog import ProductCatalog
+from categories import CategoryIndex
+from conftest import make_product
+from content import ContentIndex, product_text
+from neighbors import NeighborIndex
+from prices import PriceIndex
+from state import CatalogState
+
+
+def mutate(rng, catalog, indexes, steps=60):
+    """Random adds, replacements and deletes, patching ``indexes`` after each"""
+    next_id = 1000
+    for _ in range(steps):
+        live = [catalog.ids[row] for row in catalog.live_rows()]
+        action = rng.random()
+        if action < 0.4:
+            next_id += 1
+            row = catalog.add(make_product(rng, next_id))
+        elif action < 0.7:
+            row = catalog.add(make_product(rng, rng.choice(live)))
+        else:
+            row = catalog.remove(rng.choice(live))
+            for index in indexes:
+                index.on_remove(row)
+            continue
+        for index in indexes:
+            index.on_add(row)
+
+
+@pytest.mark.parametrize('with_content', [False, True])
+def test_neighbor_updates_match_rebuild(rng, catalog, with_content):
+    content = ContentIndex.build(catalog) if with_content else None
+    neighbors = NeighborIndex.build(catalog, content=content)
+    mutate(rng, catalog, [index for index in (content, neighbors) if index is not None])
+
+    # Same (patched) vocabulary for both, so only the table update is compared
+    rebuilt = NeighborIndex.build(catalog, content=content)
+    live = catalog.live_rows()
+    assert neighbors.is_current(catalog)
+    assert neighbors.neighbors[live].tolist() == rebuilt.neighbors[live].tolist()
+    np.testing.assert_allclose(neighbors.scores[live], rebuilt.scores[live])
+
+
+def test_price_updates_match_rebuild(rng, catalog):
+    prices = PriceIndex.build(catalog)
+    mutate(rng, catalog, [prices])
+    rebuilt = PriceIndex.build(catalog)
+    assert prices.is_current(catalog)
+    assert prices.rows.tolist() == rebuilt.rows.tolist()
+    assert prices.prices.tolist() == rebuilt.prices.tolist()
+    assert prices.band(20.0).tolist() == rebuilt.band(20.0).tolist()
+
+
+def test_category_updates_match_rebuild(rng, catalog):
+    categories = CategoryIndex.build(catalog)
+    mutate(rng, catalog, [categories])
+    rebuilt = CategoryIndex.build(catalog)
+    assert categories.is_current(catalog)
+    assert categories.categories() == rebuilt.categories()
+    assert {code: list(ranking) for code, ranking in categories.rankings.items()} == \
+        {code: list(ranking) for code, ranking in rebuilt.rankings.items()}
+
+
+def test_content_updates_match_vectorizing(rng, catalog):
+    content = ContentIndex.build(catalog)
+    mutate(rng, catalog, [content])
+    assert content.is_current(catalog)
+    assert content.matrix.shape == (catalog.size, len(content.terms))
+    assert content.matrix.has_sorted_indices
+
+    live = catalog.live_rows()
+    expected = content.vectorize([product_text(catalog, row) for row in live])
+    assert (content.matrix[live] != expected).nnz == 0
+    dead = np.flatnonzero(~catalog.alive)
+    assert len(dead) and content.matrix[dead].nnz == 0
+
+
+def test_content_batch_matches_single_updates(rng, catalog):
+    single = ContentIndex.build(catalog)
+    batched = ContentIndex.build(catalog)
+    products = [make_product(rng, product_id) for product_id in (5, 500, 501, 5, 7)]
+    rows = [catalog.add(product) for product in products]
+    for row in rows:
+        single.on_add(row)
+    batched.on_add_rows(rows)
+    assert (single.matrix != batched.matrix).nnz == 0
+
+    removed = [catalog.remove(product_id) for product_id in (500, 9, 10)]
+    for row in removed:
+        single.on_remove(row)
+    batched.on_remove_rows(removed)
+    assert (single.matrix != batched.matrix).nnz == 0
+    assert batched.matrix[removed].nnz == 0
+
+
+def test_state_batch_matches_single_updates(rng, catalog):
+    products = [make_product(rng, product_id) for product_id in (3, 300, 301, 302, 40)]
+    copy = ProductCatalog()
+    copy.extend(catalog.to_list())
+    single = CatalogState(catalog, {}, {})
+    batched = CatalogState(copy, {}, {})
+    for state in (single, batched):
+        state.build_neighbors(threading.Lock())
+
+    assert [single.add_product(product) for product in products] == batched.add_products(products)
+    removed = [single.remove_product(product_id) for product_id in (300, 7, 999)]
+    assert removed[-1] is None
+    assert batched.remove_products([300, 7, 999]) == removed[:-1]
+    assert (single.content.matrix != batched.content.matrix).nnz == 0
+    assert single.neighbors.neighbors.tolist() == batched.neighbors.neighbors.tolist()
+    assert list(single.popularity) == list(batched.popularity)
+    assert single.prices.rows.tolist() == batched.prices.rows.tolist()
+    for state in (single, batched):
+        assert all(index.is_current(state.catalog) for index in (state.content, state.neighbors, state.prices))
+
+
+def test_unknown_terms_ask_for_a_refit(rng, catalog, monkeypatch):
+    monkeypatch.setattr(content_module, "REFIT_MIN_TERMS", 50)
+    content = ContentIndex.build(catalog)
+    familiar = [catalog.add(make_product(rng, product_id)) for product_id in range(1, 31)]
+    content.on_add_rows(familiar)
+    assert content.added_terms >= 50 and content.unknown_terms == 0
+    assert not content.needs_refit()
+
+    novel = [catalog.add(dict(make_product(rng, product_id), description=f"zircon quasar nebula{product_id}"))
+             for product_id in range(300, 330)]
+    content.on_add_rows(novel)
+    assert content.needs_refit()
+    # Unknown terms are left out of the vectors until the refit
+    assert content.vectorize(["zircon quasar"]).nnz == 0
+    content.rebuild()
+    assert not content.needs_refit() and content.added_terms == 0
+    assert content.vectorize(["zircon quasar"]).nnz == 2
+
+
+def test_category_names_can_be_read_during_updates(rng, catalog):
+    categories = CategoryIndex.build(catalog)
+    original = tuple(catalog.category_names)
+    assert categories.categories() == original
+    stop = threading.Event()
+
+    def churn():
+        product_id = 10_000
+        while not stop.is_set():
+            product_id += 1
+            product = dict(make_product(rng, product_id), category=f"pop-up {product_id}")
+            categories.on_add(catalog.add(product))
+            categories.on_remove(catalog.remove(product_id))
+
+    thread = threading.Thread(target=churn)
+    thread.start()
+    try:
+        # Pop-up categories come and go after the original ones, in catalog order
+        seen = [categories.categories() for _ in range(20000)]
+    finally:
+        stop.set()
+        thread.join()
+    assert all(names[:len(original)] == original and len(names) <= len(original) + 1 for names in seen)
+    assert categories.categories() == original
@@ -0,0 +1,120 @@
+import threading
+import time
+
+import pytest
+
+import popularity
+from counters import CounterStore
+from popularity import PopularityIndex
+from recommender import prepare_cart, recommend_rows
+from sortedlist import SortedKeyList
+from state import CatalogState
+
+
+def test_bisect_left_counts_smaller_keys():
+    keys = list(range(0, 300, 3))
+    ranking = SortedKeyList(keys, load=8)
+    for key in range(-1, 302):
+        assert ranking.bisect_left(key) == sum(k < key for k in keys)
+
+
+def test_updates_match_rebuild(rng, catalog):
+    views = {}
+    purchases = {}
+    index = PopularityIndex.build(catalog, views, purchases)
+    for _ in range(200):
+        row = rng.randrange(len(catalog))
+        counts = views if rng.random() < 0.5 else purchases
+        counts[catalog.keys[row]] = counts.get(catalog.keys[row], 0) + rng.randint(1, 40)
+        index.update(row)
+    assert list(index) == list(PopularityIndex.build(catalog, views, purchases))
+    assert [index.rank(row) for row in index] == list(range(len(catalog)))
+
+
+def test_head_version_tracks_only_the_head(monkeypatch, catalog):
+    monkeypatch.setattr(popularity, 'HEAD_SIZE', 10)
+    views = {}
+    index = PopularityIndex.build(catalog, views, {})
+    ranked = list(index)
+
+    # Moving within the tail leaves the head alone
+    views[catalog.keys[ranked[-1]]] = 0.001
+    index.update(ranked[-1])
+    assert index.rank(ranked[-1]) >= 10
+    version = index.head_version
+    views[catalog.keys[ranked[-1]]] += 0.001
+    index.update(ranked[-1])
+    assert index.head_version == version
+
+    # A new score that keeps the top row on top changes nothing either
+    views[catalog.keys[ranked[0]]] = 1
+    index.update(ranked[0])
+    assert index.rank(ranked[0]) == 0 and index.head_version == version
+
+    # Climbing into the head reorders it
+    views[catalog.keys[ranked[-1]]] = 10 ** 6
+    index.update(ranked[-1])
+    assert index.head_version > version
+
+
+def test_responses_within_the_head_survive_tail_churn(monkeypatch, rng, catalog):
+    monkeypatch.setattr(popularity, 'HEAD_SIZE', 30)
+    views = {}
+    state = CatalogState(catalog, views, {})
+    carts = [
+        (prepare_cart(catalog, [{'id': rng.randint(1, 120)} for _ in range(rng.randint(0, 3))]), rng.randint(1, 8))
+        for _ in range(25)
+    ]
+    cached = {}
+    reused = 0
+    for _ in range(150):
+        version = state.popularity.head_version
+        for i, (cart, limit) in enumerate(carts):
+            result = recommend_rows(state, cart, limit)
+            if i in cached and cached[i][0] == version:
+                assert cached[i][1] == result.rows
+                reused += 1
+            elif result.popular_depth <= popularity.HEAD_SIZE:
+                cached[i] = (version, result.rows)
+        row = rng.randrange(len(catalog))
+        views[catalog.keys[row]] = views.get(catalog.keys[row], 0) + rng.choice([0.5, 5, 50])
+        state.popularity.update(row)
+    assert reused
+
+
+@pytest.mark.parametrize('limit', [1, 5])
+def test_popular_depth_covers_the_rows_read(catalog, limit):
+    state = CatalogState(catalog, {}, {})
+    result = recommend_rows(state, prepare_cart(catalog, []), limit)
+    trending = [row for row, reason in zip(result.rows, result.reasons) if reason == "Trending now"]
+    assert result.popular_depth == state.popularity.rank(trending[-1]) + 1
+
+
+def test_popular_depth_is_everything_when_short(catalog):
+    # Five categories, so a distinct-category scan cannot fill six slots
+    state = CatalogState(catalog, {}, {})
+    assert recommend_rows(state, prepare_cart(catalog, []), 6).popular_depth == len(catalog)
+
+
+def test_build_from_a_counter_snapshot_while_flushing(catalog):
+    store = CounterStore(None, 0.001).start()
+    stop = threading.Event()
+
+    def feed():
+        start = 0
+        while not stop.is_set():
+            store.record_events([("view", str(key)) for key in range(start, start + 50)])
+            start = (start + 50) % 100000
+            time.sleep(0.0005)
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        for _ in range(10):
+            views, purchases, _ = store.snapshot()
+            index = PopularityIndex.build(catalog, store.views, store.purchases, (views, purchases))
+            assert len(index.ranking) == len(catalog)
+    finally:
+        stop.set()
+        feeder.join()
+        store.stop(1)
@@ -0,0 +1,95 @@
+import multiprocessing
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+import recommender
+from copurchase import CoPurchaseIndex
+from state import CatalogState
+
+
+@pytest.fixture
+def state(rng, catalog):
+    co_purchases = CoPurchaseIndex()
+    co_purchases.update([([], [str(product_id) for product_id in rng.sample(range(1, 121), rng.randint(2, 5))])
+                          for _ in range(300)])
+    state = CatalogState(catalog, {}, {}, co_purchases=co_purchases)
+    state.build_neighbors(threading.Lock())
+    return state
+
+
+@pytest.fixture
+def entries(rng):
+    return [
+        {'history': [{'id': product_id} for product_id in rng.sample(range(1, 140), rng.randint(0, 4))],
+         'limit': rng.randint(1, 8)}
+        for _ in range(200)
+    ]
+
+
+def test_frozen_co_purchases_match_index(state, entries):
+    carts = [{str(item['id']) for item in entry['history']} for entry in entries]
+    frozen = recommender.FrozenCoPurchases(state.co_purchases, carts)
+    for bought_ids in carts:
+        for k in (1, 2, recommender.CO_PURCHASE_CANDIDATES):
+            assert frozen.top(bought_ids, k) == state.co_purchases.top(bought_ids, k)
+    assert any(frozen.results.values())
+
+
+@pytest.mark.skipif('fork' not in multiprocessing.get_all_start_methods(), reason="needs fork")
+def test_parallel_batch_matches_serial(monkeypatch, state, entries):
+    monkeypatch.setattr(recommender, 'PARALLEL_MIN_ENTRIES', 1)
+    serial = list(recommender.recommend_batch(state, entries))
+    parallel = list(recommender.recommend_batch(state, entries, processes=2))
+    assert [(r.rows, r.reasons) for r in parallel] == [(r.rows, r.reasons) for r in serial]
+    assert any("Frequently bought together" in r.reasons for r in serial)
+
+
+def test_batch_without_neighbor_table_matches_per_cart(catalog, entries):
+    state = CatalogState(catalog, {}, {})
+    assert not state.neighbors.is_current(catalog)
+    batch = recommender.BatchContext(state, [entry['history'] for entry in entries])
+    assert batch.neighbor_lists is None and batch.scored
+    results = []
+    for i, entry in enumerate(entries):
+        cart = recommender.prepare_cart(catalog, entry['history'])
+        expected = recommender.recommend_rows(state, cart, entry['limit'])
+        assert batch.recommend(i, entry['limit']) == expected
+        results.append(expected)
+    assert any(reason.startswith("Similar to") for r in results for reason in r.reasons)
+
+
+def test_diverse_fill_follows_catalog_order(catalog):
+    state = CatalogState(catalog, {}, {})
+    used = {catalog.category_names[0]}
+    picked = recommender.get_diverse_category_recommendations(state, [], set(), used)
+    assert [catalog.category_of(row) for row in picked] == catalog.category_names[1:3]
+
+
+DIVERSE_SCRIPT = """
+import random, sys
+sys.path[:0] = {paths!r}
+import recommender
+from conftest import make_product
+from catalog import ProductCatalog
+from state import CatalogState
+rng = random.Random(7)
+catalog = ProductCatalog()
+catalog.extend([make_product(rng, product_id) for product_id in range(1, 121)])
+state = CatalogState(catalog, {{}}, {{}})
+print([recommender.get_diverse_category_recommendations(state, [], set(), set()) for _ in range(3)])
+"""
+
+
+def test_diverse_fill_is_independent_of_hash_seed():
+    tests = os.path.dirname(os.path.abspath(__file__))
+    script = DIVERSE_SCRIPT.format(paths=[tests, os.path.dirname(tests)])
+    outputs = {
+        subprocess.run([sys.executable, "-c", script], env=dict(os.environ, PYTHONHASHSEED=seed),
+                       capture_output=True, text=True, check=True).stdout
+        for seed in ("1", "2", "3")
+    }
+    assert len(outputs) == 1
@@ -0,0 +1,20 @@
+import json
+
+import numpy as np
+import pytest
+
+from serialization import dumps, loads
+
+
+def test_integers_past_64_bits_fall_back():
+    value = {'id': 2 ** 70, 'count': np.int64(3), 'scores': np.arange(2)}
+    assert loads(dumps(value)) == {'id': 2 ** 70, 'count': 3, 'scores': [0, 1]}
+    assert dumps({'b': 2 ** 64, 'a': 'é'}, sort_keys=True) == json.dumps(
+        {'a': 'é', 'b': 2 ** 64}, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def test_unserializable_still_raises():
+    with pytest.raises(TypeError):
+        dumps({'id': 2 ** 70, 'value': object()})
+    assert dumps({'id': 2 ** 70, 'value': object()}, default=lambda obj: 'x') == (
+        b'{"id":1180591620717411303424,"value":"x"}')
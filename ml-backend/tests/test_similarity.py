@@ -0,0 +1,57 @@
+import numpy as np
+
+from catalog import ProductCatalog
+from content import ContentIndex
+from similarity import calculate_similarity, similarity_matrix, top_similar
+
+
+def scalar_matrix(catalog, cart_rows, candidate_rows, content=None):
+    """The same scores from the scalar reference, one pair at a time"""
+    text = content.cosine(cart_rows, candidate_rows) if content is not None else None
+    scores = np.zeros((len(cart_rows), len(candidate_rows)))
+    for i, row in enumerate(cart_rows):
+        for j, candidate in enumerate(candidate_rows):
+            scores[i, j] = calculate_similarity(
+                catalog.product(row), catalog.product(candidate), 0.0 if text is None else text[i, j]
+            )
+    return scores
+
+
+def test_matrix_matches_scalar_reference(catalog):
+    rows = catalog.live_rows()
+    cart_rows = rows[:15]
+    np.testing.assert_allclose(
+        similarity_matrix(catalog, cart_rows, rows), scalar_matrix(catalog, cart_rows, rows), atol=1e-12
+    )
+
+
+def test_matrix_matches_scalar_reference_with_text(catalog):
+    content = ContentIndex.build(catalog)
+    rows = catalog.live_rows()
+    cart_rows = rows[:15]
+    np.testing.assert_allclose(
+        similarity_matrix(catalog, cart_rows, rows, content),
+        scalar_matrix(catalog, cart_rows, rows, content),
+        atol=1e-6
+    )
+
+
+def test_top_similar_matches_stable_sort(catalog):
+    rows = catalog.live_rows()
+    cart_rows = rows[:10]
+    expected = scalar_matrix(catalog, cart_rows, rows)
+    for row_scores, result in zip(expected, top_similar(catalog, cart_rows, rows, k=5, threshold=0.3)):
+        order = [j for j in np.argsort(-row_scores, kind='stable') if row_scores[j] > 0.3][:5]
+        assert result.tolist() == rows[order].tolist()
+
+
+def test_zero_prices_score_no_price_term():
+    catalog = ProductCatalog()
+    catalog.extend([
+        {'id': 1, 'price': 0, 'category': 'a'},
+        {'id': 2, 'price': 0, 'category': 'b'},
+        {'id': 3, 'price': 10, 'category': 'b'},
+    ])
+    scores = similarity_matrix(catalog, [0], [1, 2])
+    assert scores.tolist() == [[0.0, 0.0]]
+    assert similarity_matrix(catalog, [1], [2])[0, 0] == 0.4
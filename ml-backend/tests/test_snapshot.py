@@ -0,0 +1,135 @@
+import os
+import threading
+
+import numpy as np
+import pytest
+
+import snapshot
+from catalog import ProductCatalog
+from conftest import make_product
+from copurchase import CoPurchaseIndex
+from counters import CounterStore
+from state import CatalogState
+
+
+@pytest.fixture
+def counters(rng):
+    counters = CounterStore()
+    counters.record_events(
+        [("view", str(rng.randint(1, 120))) for _ in range(400)]
+        + [("purchase", str(rng.randint(1, 120)), f"user-{rng.randint(1, 20)}") for _ in range(100)]
+    )
+    counters.flush()
+    return counters
+
+
+@pytest.fixture
+def state(catalog, counters):
+    state = CatalogState(catalog, counters.views, counters.purchases, co_purchases=CoPurchaseIndex())
+    state.build_neighbors(threading.Lock())
+    return state
+
+
+def loaded_state(loaded):
+    catalog, neighbors, prices, content, counters, _ = loaded
+    return CatalogState(
+        catalog, counters["views"], counters["purchases"], neighbors=neighbors, prices=prices, content=content
+    )
+
+
+def assert_same_state(loaded, state, counters):
+    catalog = loaded.catalog
+    for name in ProductCatalog.COLUMNS:
+        assert np.array_equal(getattr(catalog, name), getattr(state.catalog, name)), name
+    assert catalog.to_list() == state.catalog.to_list()
+    assert catalog.id_index == state.catalog.id_index
+    assert catalog.version == state.catalog.version
+
+    assert loaded.neighbors.is_current(catalog)
+    size = catalog.size
+    assert np.array_equal(loaded.neighbors.neighbors[:size], state.neighbors.neighbors[:size])
+    assert np.array_equal(loaded.neighbors.scores[:size], state.neighbors.scores[:size])
+    assert np.array_equal(loaded.prices.rows, state.prices.rows)
+    assert np.array_equal(loaded.prices.prices, state.prices.prices)
+    assert loaded.content.terms == state.content.terms
+    assert (loaded.content.matrix != state.content.matrix).nnz == 0
+    assert list(loaded.popularity) == list(state.popularity)
+
+    views, purchases, user_purchases = counters.snapshot()
+    assert (loaded.popularity.views, loaded.popularity.purchases) == (views, purchases)
+
+
+def test_round_trip(tmp_path, state, counters):
+    path = snapshot.write_snapshot(tmp_path, snapshot.capture_snapshot(state, counters, watermark="w1"))
+    loaded = snapshot.load_snapshot(tmp_path)
+    assert loaded[-1]["watermark"] == "w1"
+    assert loaded[4]["user_purchases"] == counters.snapshot()[2]
+    assert isinstance(loaded[0].price, np.memmap)
+    assert os.path.dirname(path) == str(tmp_path)
+    assert_same_state(loaded_state(loaded), state, counters)
+
+
+def test_mapped_columns_patched_after_load(tmp_path, rng, state, counters):
+    snapshot.write_snapshot(tmp_path, snapshot.capture_snapshot(state, counters))
+    loaded = loaded_state(snapshot.load_snapshot(tmp_path))
+
+    replacement = dict(state.catalog.get(3), price=999.0)
+    loaded.add_product(replacement)
+    loaded.remove_product(4)
+    # Enough new rows to outgrow the mapped arrays
+    for product_id in range(500, 500 + 2 * state.catalog.size):
+        loaded.add_product(make_product(rng, product_id))
+    assert loaded.catalog.get(3)["price"] == 999.0
+    assert 4 not in loaded.catalog
+    assert loaded.prices.is_current(loaded.catalog)
+    assert loaded.neighbors.is_current(loaded.catalog)
+
+    # Copy-on-write: the snapshot on disk is untouched
+    original = loaded_state(snapshot.load_snapshot(tmp_path))
+    assert_same_state(original, state, counters)
+
+
+def test_latest_points_at_the_newest_complete_snapshot(tmp_path, rng, state, counters):
+    first = snapshot.write_snapshot(tmp_path, snapshot.capture_snapshot(state, counters))
+    state.add_product(make_product(rng, 200))
+    second = snapshot.write_snapshot(tmp_path, snapshot.capture_snapshot(state, counters))
+    assert first != second
+    assert (tmp_path / snapshot.LATEST_FILE).read_text() == os.path.basename(second)
+
+    # A write that died before replacing LATEST is never read
+    (tmp_path / ".snapshot-99999999999999999999-1").mkdir()
+    loaded = snapshot.load_snapshot(tmp_path)
+    assert 200 in loaded[0]
+    assert_same_state(loaded_state(loaded), state, counters)
+    assert not [entry for entry in os.listdir(tmp_path) if entry.startswith(f".{snapshot.LATEST_FILE}")]
+
+
+def test_prune_keeps_the_newest(tmp_path, state, counters):
+    paths = [snapshot.write_snapshot(tmp_path, snapshot.capture_snapshot(state, counters), keep=2)
+             for _ in range(4)]
+    remaining = sorted(entry for entry in os.listdir(tmp_path) if entry.startswith("snapshot-"))
+    assert remaining == sorted(os.path.basename(path) for path in paths[-2:])
+    assert snapshot.load_snapshot(tmp_path) is not None
+
+
+def test_missing_snapshot(tmp_path):
+    assert snapshot.load_snapshot(tmp_path) is None
+    assert snapshot.load_snapshot(tmp_path / "absent") is None
+
+
+def test_writer_only_writes_changes(tmp_path, state, counters):
+    signature = [0]
+    writer = snapshot.SnapshotWriter(
+        tmp_path, lambda: snapshot.capture_snapshot(state, counters), lambda: signature[0], interval=0
+    )
+    assert writer.write() is not None
+    assert writer.write() is None
+    signature[0] += 1
+    assert writer.write() is not None
+    assert writer.write(force=True) is not None
+
+    writer.mark_current()
+    signature[0] += 1
+    writer.start().stop()
+    assert writer.writes == 4
+    assert_same_state(loaded_state(snapshot.load_snapshot(tmp_path)), state, counters)
@@ -0,0 +1,146 @@
+import json
+import os
+import random
+import sys
+
+import pytest
+
+import sync
+from sync import (
+    MAX_DELTA_FRACTION, build_catalog, delta_too_large, diff_upstream, dummyjson_product_key, fetch_upstream,
+    iter_json_array, nodejs_product_key
+)
+
+# The local stand-in for the upstream services lives with the benchmarks
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'bench'))
+
+from stub import StubUpstream  # noqa: E402
+from synthetic import upstream_payload  # noqa: E402
+
+DOCUMENTS = [
+    '[]',
+    '[1.5]',
+    '[3e10, -2.25E-3, 0, 17]',
+    ' [ true , false,null ,1.0e+2 ] ',
+    '[{"id": 1, "price": 12.5, "tags": ["a", "b"]}, "x]y", [1, [2.5]], -0.5]',
+    json.dumps([{"_id": f"{i:024x}", "price": i / 3, "name": f"N\\u00e9 {i}"} for i in range(20)]),
+]
+
+
+def split(text, rng):
+    """``text`` cut into chunks at random points, empty chunks included"""
+    cuts = sorted(rng.randint(0, len(text)) for _ in range(rng.randint(0, len(text))))
+    return [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+@pytest.mark.parametrize('size', [1, 2, 3, 7])
+def test_fixed_chunk_sizes(document, size):
+    chunks = [document[start:start + size] for start in range(0, len(document), size)]
+    assert list(iter_json_array(chunks)) == json.loads(document)
+
+
+@pytest.mark.parametrize('document', DOCUMENTS)
+def test_random_chunk_splits(document):
+    rng = random.Random(document)
+    for _ in range(50):
+        assert list(iter_json_array(split(document, rng))) == json.loads(document)
+
+
+@pytest.mark.parametrize('document', ['[1, 2', '[1.', '[{"id": 1}', '{"id": 1}', ''])
+def test_rejects_truncated_or_non_arrays(document):
+    with pytest.raises(ValueError):
+        list(iter_json_array([document]))
+
+
+def test_fetch_from_local_stub(monkeypatch):
+    monkeypatch.setattr(sync, 'STREAM_CHUNK_SIZE', 97)
+    upstream = upstream_payload(300, seed=4)
+    stub = StubUpstream(upstream).start()
+    try:
+        fetched, watermark = fetch_upstream(stub.node_url, stub.dummyjson_url)
+    finally:
+        stub.stop()
+    assert fetched == upstream
+    assert watermark is None
+    assert len(build_catalog(fetched)) == 300
+
+
+@pytest.fixture
+def upstream():
+    return upstream_payload(200, seed=5)
+
+
+def edited(upstream, count, rng):
+    """A copy of ``upstream`` with ``count`` Node.js products repriced"""
+    copy = {source: [dict(product) for product in products] for source, products in upstream.items()}
+    for product in rng.sample(copy["nodejs"], count):
+        product["price"] += 1
+    return copy
+
+
+def test_unchanged_hashes_are_skipped(upstream):
+    catalog = build_catalog(upstream)
+    delta = diff_upstream(catalog, upstream)
+    assert delta.changed == [] and delta.removed == [] and delta.unchanged == 200
+
+    changed = edited(upstream, 3, random.Random(1))
+    changed["nodejs"].append(dict(changed["nodejs"][0], _id="f" * 24))
+    delta = diff_upstream(catalog, changed)
+    repriced = {nodejs_product_key(a) for a, b in zip(changed["nodejs"], upstream["nodejs"]) if a != b}
+    assert {key for key, _, _ in delta.changed} == repriced | {"f" * 24}
+    assert delta.unchanged == 197 and delta.removed == []
+    assert all(product["price"] == catalog.product(catalog.row_of(key))["price"] + 1
+               for key, _, product in delta.changed if key in catalog.id_index)
+
+
+def test_removals_only_from_complete_payloads(upstream):
+    catalog = build_catalog(upstream)
+    missing = {source: products[1:] for source, products in upstream.items()}
+    gone = {nodejs_product_key(upstream["nodejs"][0]), dummyjson_product_key(upstream["dummyjson"][0])}
+    assert set(diff_upstream(catalog, missing).removed) == gone
+
+    # A since= response only lists what changed
+    assert diff_upstream(catalog, missing, partial=True).removed == []
+
+    # A failed source says nothing about its products, or the other source's
+    for failed in ("nodejs", "dummyjson"):
+        assert diff_upstream(catalog, dict(missing, **{failed: None})).removed == []
+
+
+def test_delta_threshold(upstream):
+    catalog = build_catalog(upstream)
+    limit = int(MAX_DELTA_FRACTION * len(catalog))
+    rng = random.Random(2)
+    assert not delta_too_large(catalog, diff_upstream(catalog, edited(upstream, limit, rng)))
+    assert delta_too_large(catalog, diff_upstream(catalog, edited(upstream, limit + 1, rng)))
+
+
+def test_incremental_sync_against_stub(monkeypatch, upstream):
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    import app
+
+    stub = StubUpstream(upstream).start()
+    monkeypatch.setattr(app, "NODE_JS_BACKEND", stub.node_url)
+    monkeypatch.setattr(app, "DUMMYJSON_URL", stub.dummyjson_url)
+    monkeypatch.setattr(app, "state", app.state)
+    monkeypatch.setattr(app, "sync_watermark", None)
+    rng = random.Random(3)
+    try:
+        assert app.initialize_products()["mode"] == "full"
+        catalog = app.state.catalog
+
+        changed = edited(upstream, 4, rng)
+        stub.node_body = json.dumps(changed["nodejs"]).encode("utf-8")
+        report = app.incremental_sync()
+        assert (report["mode"], report["updated"], report["added"], report["removed"]) == ("incremental", 4, 0, 0)
+        assert app.state.catalog is catalog
+
+        # Too many changes at once: rebuilt rather than patched
+        rebuilt = edited(changed, 40, rng)
+        stub.node_body = json.dumps(rebuilt["nodejs"]).encode("utf-8")
+        assert app.incremental_sync()["mode"] == "full"
+        assert app.state.catalog is not catalog
+        assert diff_upstream(app.state.catalog, rebuilt).unchanged == 200
+    finally:
+        stub.stop()
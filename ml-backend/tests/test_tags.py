@@ -0,0 +1,26 @@
+from tags import TagExtractor
+
+
+def test_overlapping_terms_are_all_found():
+    extractor = TagExtractor(['smart', 'smart home', 'home'])
+    assert extractor.extract('smart home hub', '') == ['smart', 'smart home', 'home']
+    assert extractor.extract_batch([('smart home hub', ''), ('a smart plug', '')]) == [
+        ['smart', 'smart home', 'home'], ['smart']
+    ]
+
+
+def test_terms_match_whole_words_only():
+    extractor = TagExtractor(['classic', 'smart', 'eco'])
+    assert extractor.extract('Neoclassical smartphone', 'eco-friendly') == []
+    assert extractor.extract('Classic', 'smart, eco') == ['classic', 'smart', 'eco']
+
+
+def test_tags_follow_vocabulary_order_and_limit():
+    extractor = TagExtractor(['a1', 'b2', 'c3'], max_tags=2)
+    assert extractor.extract('c3 b2 a1', '') == ['a1', 'b2']
+
+
+def test_batch_matches_single_extraction():
+    extractor = TagExtractor(['wireless', 'wireless charger', 'charger', 'eco-friendly', 'premium'])
+    texts = [('Wireless Charger', 'premium'), ('', 'eco-friendly charger'), ('wirelesscharger', None)]
+    assert extractor.extract_batch(texts) == [extractor.extract(name, description) for name, description in texts]